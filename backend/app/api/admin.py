@@ -0,0 +1,68 @@
+from typing import Literal
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from app.core.executors import DOCUMENT_STAGE, StageSaturated
+from app.core.index_archive import IndexArchiveError, list_archives
+from app.core.vector_store import VectorStore
+from app.config import INDEX_EXPORT_DIR, INDEX_EXPORT_DTYPE
+
+router = APIRouter()
+
+# 归档名只能是 INDEX_EXPORT_DIR 下的一级目录名，避免通过接口读写任意路径
+_ARCHIVE_NAME = r"^[A-Za-z0-9][A-Za-z0-9_.-]*$"
+
+
+class ExportRequest(BaseModel):
+    name: str = Field(..., pattern=_ARCHIVE_NAME, max_length=128)
+    dtype: Literal["float32", "float16"] = INDEX_EXPORT_DTYPE
+
+
+class ImportRequest(BaseModel):
+    name: str = Field(..., pattern=_ARCHIVE_NAME, max_length=128)
+    verify: bool = True  # 导入前校验各文件的SHA-256
+    force: bool = False  # 嵌入模型与当前配置不一致时仍然导入
+
+
+def _too_busy(e: StageSaturated) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+# 列出 INDEX_EXPORT_DIR 下的归档（清单内容）
+@router.get("/exports")
+async def get_exports():
+    return list_archives(INDEX_EXPORT_DIR)
+
+
+# 把向量库和文档目录导出为 INDEX_EXPORT_DIR/<name>，返回归档清单
+@router.post("/export", status_code=201)
+async def export_index(request: ExportRequest):
+    try:
+        return await DOCUMENT_STAGE.run(
+            VectorStore().export_archive, INDEX_EXPORT_DIR / request.name, request.dtype
+        )
+    except FileExistsError:
+        raise HTTPException(status_code=409, detail=f"归档已存在：{request.name}")
+    except StageSaturated as e:
+        raise _too_busy(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"导出失败：{str(e)}")
+
+
+# 从 INDEX_EXPORT_DIR/<name> 批量导入（不调用嵌入模型），返回导入的文档数、块数和耗时；
+# 多进程部署时查询进程不能写入，需在写进程上调用或在服务停止时使用 manage.py import-index
+@router.post("/import")
+async def import_index(request: ImportRequest):
+    try:
+        return await DOCUMENT_STAGE.run(
+            VectorStore().import_archive, INDEX_EXPORT_DIR / request.name, request.verify, request.force
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"归档不存在：{request.name}")
+    except IndexArchiveError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except StageSaturated as e:
+        raise _too_busy(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"导入失败：{str(e)}")
@@ -1,90 +1,166 @@
-from pydantic import BaseModel
-from datetime import datetime
-from typing import List, Optional
-from fastapi import APIRouter, UploadFile, File, HTTPException
-import os
-import shutil
-import uuid
-from pathlib import Path
+from typing import Optional
+from fastapi import APIRouter, UploadFile, File, HTTPException, Response, Query
+from app.core.data_collection import DataCollection, UploadTooLarge
+from app.core.ingestion_jobs import IngestionJobs, IngestionQueueFull, DuplicateDocument
+from app.core.executors import DOCUMENT_STAGE, StageSaturated
+from app.models.document import (
+    DocumentListResponse,
+    DocumentDeleteResponse,
+    DocumentUploadJobResponse,
+    IngestionJob
+)
 
 router = APIRouter()
 
-# 文档存储路径（指向 backend/data/documents）
-DOCS_DIR = Path(__file__).parent.parent.parent / "data" / "documents"
-DOCS_DIR.mkdir(parents=True, exist_ok=True)  # 自动创建目录
+def _too_busy(e) -> HTTPException:
+    """写盘线程已满或入库任务排队已满时返回429，并通过 Retry-After 告知客户端何时重试"""
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
 
+def _save_and_submit(file) -> tuple[str, Optional[str], bool]:
+    """
+    流式保存上传文件并创建入库任务（在 DOCUMENT_STAGE 的线程中执行）
 
-# 数据模型
-class DocumentMetadata(BaseModel):
-    id: str
-    filename: str
-    size: int
-    created_at: datetime
-    page_count: int
+    Returns:
+        (文档ID, 任务ID, 是否重复)；重复时为已有文档的ID及其进行中的入库任务ID（已入库时为None）
+    """
+    file_id, content_hash, duplicate = DataCollection.save_uploaded_file(file)
+    if duplicate:
+        return file_id, None, True
+    try:
+        job = IngestionJobs().submit(file_id, file.filename, content_hash)
+    except DuplicateDocument as e:
+        DataCollection.delete_document(file_id)
+        return e.document_id, e.job_id, True
+    except IngestionQueueFull:
+        DataCollection.delete_document(file_id)
+        raise
+    return file_id, job["id"], False
 
-class DocumentListResponse(BaseModel):
-    documents: List[DocumentMetadata]
+def _replace_and_submit(document_id: str, file) -> Optional[dict]:
+    """覆盖已保存的文件并创建增量入库任务（在 DOCUMENT_STAGE 的线程中执行），文档不存在时返回None"""
+    if not DataCollection.replace_uploaded_file(document_id, file):
+        return None
+    return IngestionJobs().submit(document_id, file.filename)
 
-class DocumentUploadResponse(BaseModel):
-    id: str
-    filename: str
-    message: str
+def _list_documents_json(limit: int, offset: int) -> str:
+    """查询一页文档并直接序列化为JSON（在 DOCUMENT_STAGE 的线程中执行，模型只构建一次）"""
+    documents, total = DataCollection.list_documents(limit, offset)
+    next_offset = offset + len(documents)
+    return DocumentListResponse(
+        documents=documents,
+        total=total,
+        next_offset=next_offset if next_offset < total else None
+    ).model_dump_json()
 
-class DocumentDeleteResponse(BaseModel):
-    id: str
-    message: str
-
-
-# 1. 获取所有文档列表
 @router.get("/", response_model=DocumentListResponse)
-async def get_all_documents():
-    documents = []
-    for file in DOCS_DIR.glob("*.pdf"):  # 只处理PDF文件
-        # 提取文档ID（文件名前缀，不含后缀）
-        doc_id = file.stem
-        # 获取文件信息
-        stat = file.stat()
-        # 简单起见，页码默认为1（实际项目需用pdfplumber读取）
-        documents.append(DocumentMetadata(
-            id=doc_id,
-            filename=file.name,
-            size=stat.st_size,
-            created_at=datetime.fromtimestamp(stat.st_ctime),
-            page_count=1
-        ))
-    return DocumentListResponse(documents=documents)
+async def get_all_documents(
+    limit: int = Query(default=100, ge=1, le=1000),
+    offset: int = Query(default=0, ge=0)
+):
+    """分页获取文档列表（按创建时间倒序）"""
+    try:
+        # 已按响应模型序列化，直接返回JSON，避免 FastAPI 再按 response_model 校验一遍
+        content = await DOCUMENT_STAGE.run(_list_documents_json, limit, offset)
+        return Response(content=content, media_type="application/json")
+    except StageSaturated as e:
+        raise _too_busy(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/", response_model=DocumentUploadJobResponse, status_code=202)
+async def upload_document(response: Response, file: UploadFile = File(...)):
+    """上传文档，解析和向量化在后台任务中进行；内容与已入库文档相同时直接返回已有文档"""
+    try:
+        # 检查文件类型
+        if not file.filename.lower().endswith(".pdf"):
+            raise HTTPException(status_code=400, detail="只支持PDF文件上传")
+        
+        # 流式保存文件并创建入库任务，立即返回任务ID；与已有文档重复时返回已有文档
+        document_id, job_id, duplicate = await DOCUMENT_STAGE.run(_save_and_submit, file)
+        if duplicate:
+            response.status_code = 200
+            return DocumentUploadJobResponse(
+                id=document_id,
+                job_id=job_id,
+                filename=file.filename,
+                message="相同内容的文档已存在，无需重新处理",
+                duplicate=True
+            )
+        
+        return DocumentUploadJobResponse(
+            id=document_id,
+            job_id=job_id,
+            filename=file.filename,
+            message="文档上传成功，正在后台处理"
+        )
+    except HTTPException:
+        raise
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (IngestionQueueFull, StageSaturated) as e:
+        raise _too_busy(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-# 2. 上传文档
-@router.post("/", response_model=DocumentUploadResponse)
-async def upload_document(file: UploadFile = File(...)):
-    if not file.filename.endswith(".pdf"):
-        raise HTTPException(status_code=400, detail="仅支持PDF文件")
-    
-    # 生成唯一ID
-    doc_id = str(uuid.uuid4())
-    save_path = DOCS_DIR / f"{doc_id}.pdf"
-    
-    # 保存文件
-    with open(save_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    return DocumentUploadResponse(
-        id=doc_id,
-        filename=file.filename,
-        message="文档上传成功"
-    )
+@router.put("/{document_id}", response_model=DocumentUploadJobResponse, status_code=202)
+async def replace_document(document_id: str, file: UploadFile = File(...)):
+    """替换文档内容并增量重新入库（只重新编码内容有变化的块）"""
+    try:
+        # 检查文件类型
+        if not file.filename.lower().endswith(".pdf"):
+            raise HTTPException(status_code=400, detail="只支持PDF文件上传")
+        
+        # 覆盖已保存的文件并创建入库任务
+        job = await DOCUMENT_STAGE.run(_replace_and_submit, document_id, file)
+        if job is None:
+            raise HTTPException(status_code=404, detail="文档未找到")
+        
+        return DocumentUploadJobResponse(
+            id=document_id,
+            job_id=job["id"],
+            filename=file.filename,
+            message="文档替换成功，正在后台增量更新"
+        )
+    except HTTPException:
+        raise
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (IngestionQueueFull, StageSaturated) as e:
+        raise _too_busy(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/jobs/{job_id}", response_model=IngestionJob)
+async def get_ingestion_job(job_id: str):
+    """获取文档入库任务的状态与进度"""
+    try:
+        job = await DOCUMENT_STAGE.run(IngestionJobs().get, job_id)
+    except StageSaturated as e:
+        raise _too_busy(e)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return IngestionJob(**job)
 
-# 3. 删除文档
 @router.delete("/{document_id}", response_model=DocumentDeleteResponse)
 async def delete_document(document_id: str):
-    # 查找对应文件
-    for file in DOCS_DIR.glob(f"{document_id}*.pdf"):
-        file.unlink()  # 删除文件
-        return DocumentDeleteResponse(
-            id=document_id,
-            message="文档已删除"
-        )
-    
-    raise HTTPException(status_code=404, detail="文档不存在")
\ No newline at end of file
+    """删除指定文档"""
+    try:
+        # 删除文档文件
+        file_deleted = await DOCUMENT_STAGE.run(DataCollection.delete_document, document_id)
+        
+        # 删除向量存储中的文档（多进程部署时由写进程异步完成）
+        delete_job = await DOCUMENT_STAGE.run(IngestionJobs().delete_document, document_id)
+        
+        if file_deleted:
+            return DocumentDeleteResponse(
+                id=document_id,
+                message="文档删除成功" if delete_job is None else "文档已删除，索引将在写进程处理后更新"
+            )
+        else:
+            raise HTTPException(status_code=404, detail="文档未找到")
+    except HTTPException:
+        raise
+    except StageSaturated as e:
+        raise _too_busy(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
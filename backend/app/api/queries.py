@@ -1,42 +1,542 @@
-from pydantic import BaseModel
-from typing import List, Optional
-from fastapi import APIRouter, HTTPException
+import asyncio
+import json
+import time
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from app.core.retrieval import Retrieval
+from app.core.embedding import Embedding
+from app.core.rate_limiter import AsyncRateLimiter
+from app.core.context_packing import ContextPacking
+from app.core.generation import Generation, ERROR_PREFIX
+from app.core.llm_resilience import Deadline, GenerationError
+from app.core.data_collection import DataCollection
+from app.core.answer_cache import AnswerCache
+from app.core.embedding_batcher import EmbeddingBatcher
+from app.core.runtime_settings import RuntimeSettings
+from app.core.executors import EMBED_STAGE, SEARCH_STAGE, GENERATE_STAGE, StageSaturated
+from app.core.metrics import QUERIES, CONTEXT_TOKENS, stage_timer, observe_stage
+from app.models.query import QueryRequest, QueryResponse, ReferenceSource, BatchQueryRequest
+from app.config import RETRIEVAL_MODE, CONTEXT_PACKING_ENABLED
 
 router = APIRouter()
 
-# 数据模型
-class QueryRequest(BaseModel):
-    question: str
+# 批量查询的LLM调用并发数和速率上限（进程内所有批量请求共享，避免挤占交互式查询）；
+# 运行时配置修改后换用新的信号量和限流器，已占用旧信号量的调用照常完成
+_batch_llm_slots: asyncio.Semaphore | None = None
+_batch_rate_limiter: AsyncRateLimiter | None = None
+_batch_limits: tuple | None = None
 
-class ReferenceSource(BaseModel):
-    document_id: str
-    filename: str
-    page_number: int
-    content: str
+def _batch_llm_limits() -> tuple[asyncio.Semaphore, AsyncRateLimiter]:
+    """按当前运行时配置返回批量查询共享的并发信号量和限流器"""
+    global _batch_llm_slots, _batch_rate_limiter, _batch_limits
+    settings = RuntimeSettings.get()
+    limits = (settings.batch_llm_concurrency, settings.batch_llm_rate_limit)
+    if limits != _batch_limits:
+        _batch_llm_slots = asyncio.Semaphore(limits[0])
+        _batch_rate_limiter = AsyncRateLimiter(limits[1])
+        _batch_limits = limits
+    return _batch_llm_slots, _batch_rate_limiter
 
-class QueryResponse(BaseModel):
-    answer: str
-    references: List[ReferenceSource]
+def _too_busy(e: StageSaturated) -> HTTPException:
+    """阶段已满时返回429，并通过 Retry-After 告知客户端何时重试"""
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
 
+def _build_references(relevant_chunks: list[dict]) -> list[ReferenceSource]:
+    """根据检索结果准备引用来源（一次批量查询文档目录）"""
+    return _build_references_many([relevant_chunks])[0]
+
+def _build_references_many(chunk_lists: list[list[dict]]) -> list[list[ReferenceSource]]:
+    """为多组检索结果准备引用来源，所有组共用一次文档目录查询"""
+    with stage_timer("query", "references"):
+        documents = DataCollection.get_documents_metadata([
+            chunk["metadata"]["document_id"] for chunks in chunk_lists for chunk in chunks
+        ])
+    results = []
+    for chunks in chunk_lists:
+        references = []
+        for chunk in chunks:
+            metadata = chunk["metadata"]
+            doc_metadata = documents.get(metadata["document_id"])
+            if doc_metadata is None:
+                continue
+            references.append(ReferenceSource(
+                document_id=metadata["document_id"],
+                filename=doc_metadata.filename,
+                page_number=metadata["page_number"],
+                content=chunk["document"]
+            ))
+        results.append(references)
+    return results
+
+def _pack_context(relevant_chunks: list[dict]) -> tuple[list[dict], list[dict]]:
+    """
+    把检索结果组装成LLM上下文（合并重叠块、去重、距离截断、token预算），并记录节省的token数
+
+    Returns:
+        (发送给LLM的上下文块, 上下文实际用到的原始块（用于生成引用）)
+    """
+    if not CONTEXT_PACKING_ENABLED or not relevant_chunks:
+        return relevant_chunks, relevant_chunks
+    with stage_timer("query", "pack_context"):
+        packed, stats = ContextPacking.pack(
+            relevant_chunks, token_budget=RuntimeSettings.get().context_token_budget
+        )
+    CONTEXT_TOKENS.labels("retrieved").inc(stats["tokens_in"])
+    CONTEXT_TOKENS.labels("sent").inc(stats["tokens_out"])
+    saved = stats["tokens_in"] - stats["tokens_out"]
+    print(
+        f"📦 上下文打包：文本块 {stats['chunks_in']} -> {stats['chunks_out']}"
+        f"（合并 {stats['merged']}，重复 {stats['dropped_duplicate']}，"
+        f"超出距离 {stats['dropped_distance']}，超出预算 {stats['dropped_budget']}），"
+        f"token {stats['tokens_in']} -> {stats['tokens_out']}"
+        f"（节省 {saved}，{100 * saved / stats['tokens_in'] if stats['tokens_in'] else 0:.0f}%）"
+    )
+    return packed, ContextPacking.sources(packed)
+
+def _search_and_prepare(
+    question: str,
+    query_embedding: list[float],
+    top_k: int,
+    document_ids: list[str] | None,
+    retrieval_mode: str
+) -> tuple[list[dict], dict | None, list[dict], list[ReferenceSource]]:
+    """
+    查缓存、检索并组装上下文和引用来源（在 SEARCH_STAGE 的线程中执行）
+
+    先用查询向量查语义缓存（命中时跳过检索），再用检索结果查精确缓存；
+    未命中时把检索结果组装成LLM上下文，并为上下文实际用到的块准备引用来源。
+
+    Returns:
+        (相关文档块, 缓存命中的答案或None, 发送给LLM的上下文块, 引用来源)
+    """
+    cache = AnswerCache()
+    with stage_timer("query", "cache_lookup"):
+        cached = cache.get_semantic(query_embedding, top_k, document_ids, retrieval_mode)
+    if cached is not None:
+        return [], cached, [], []
+
+    with stage_timer("query", "retrieve"):
+        relevant_chunks = Retrieval().retrieve_relevant_chunks(
+            query=question,
+            n_results=top_k,
+            document_ids=document_ids,
+            query_embedding=query_embedding,
+            mode=retrieval_mode
+        )
+    if not relevant_chunks:
+        return relevant_chunks, None, [], []
+
+    with stage_timer("query", "cache_lookup"):
+        cached = cache.get_exact(
+            question, top_k, document_ids, retrieval_mode,
+            [chunk["id"] for chunk in relevant_chunks]
+        )
+    if cached is not None:
+        return relevant_chunks, cached, [], []
+
+    context_chunks, cited_chunks = _pack_context(relevant_chunks)
+    return relevant_chunks, None, context_chunks, _build_references(cited_chunks)
+
+async def _retrieve_with_cache(
+    question: str,
+    top_k: int,
+    document_ids: list[str] | None,
+    retrieval_mode: str
+) -> tuple[list[float], list[dict], dict | None, list[dict], list[ReferenceSource]]:
+    """
+    检索相关文档块并查询答案缓存
+
+    编码经过 EMBED_STAGE 的准入控制；缓存查找、检索、上下文组装和引用来源
+    一并在 SEARCH_STAGE 的线程中执行，不占用事件循环。
+
+    Returns:
+        (查询向量, 相关文档块, 缓存命中的答案或None, 发送给LLM的上下文块, 引用来源)
+
+    Raises:
+        StageSaturated: 编码或检索阶段已满
+    """
+    with stage_timer("query", "embed"):
+        async with EMBED_STAGE.admit():
+            query_embedding = await Retrieval().aembed_query(question)
+    relevant_chunks, cached, context_chunks, references = await SEARCH_STAGE.run(
+        _search_and_prepare, question, query_embedding, top_k, document_ids, retrieval_mode
+    )
+    return query_embedding, relevant_chunks, cached, context_chunks, references
+
+def _cache_answer(
+    question: str,
+    top_k: int,
+    document_ids: list[str] | None,
+    retrieval_mode: str,
+    query_embedding: list[float],
+    relevant_chunks: list[dict],
+    answer: str,
+    references: list[ReferenceSource]
+) -> None:
+    """缓存生成的答案"""
+    AnswerCache().put(
+        question=question,
+        top_k=top_k,
+        document_ids=document_ids,
+        retrieval_mode=retrieval_mode,
+        chunk_ids=[chunk["id"] for chunk in relevant_chunks],
+        query_embedding=query_embedding,
+        answer=answer,
+        references=[ref.model_dump() for ref in references],
+        cited_document_ids=[chunk["metadata"]["document_id"] for chunk in relevant_chunks]
+    )
+
+def _sse(event: str, data) -> str:
+    """格式化一条SSE事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-# 处理查询请求
 @router.post("/", response_model=QueryResponse)
-async def process_query(request: QueryRequest):
-    if not request.question.strip():
+async def process_query(
+    query: QueryRequest,
+    top_k: int | None = Query(default=None, ge=1, le=10),
+    document_ids: list[str] = Query(default=None),
+    retrieval_mode: str = Query(default=RETRIEVAL_MODE, pattern="^(vector|hybrid)$")
+):
+    """
+    处理用户查询并返回答案（top_k 未指定时使用运行时配置）
+
+    整个请求受 query_timeout 限制；生成超时返回504，DeepSeek接口熔断时返回503，
+    其他调用失败返回502；编码、检索或生成阶段已满时返回429（附 Retry-After）。
+    """
+    settings = RuntimeSettings.get()
+    deadline = Deadline(settings.query_timeout)
+    top_k = top_k or settings.top_k
+    try:
+        if not query.question.strip():
+            raise HTTPException(status_code=400, detail="问题不能为空")
+        # 检查API密钥
+        if not settings.deepseek_api_key:
+            raise HTTPException(status_code=400, detail="请先配置DeepSeek API密钥")
+
+        # 检索相关文档块（优先使用缓存的答案）
+        query_embedding, relevant_chunks, cached, context_chunks, references = await _retrieve_with_cache(
+            query.question, top_k, document_ids, retrieval_mode
+        )
+        if cached is not None:
+            QUERIES.labels("query", retrieval_mode, "cache_hit").inc()
+            return QueryResponse(**cached)
+
+        # 距离截断后可能没有可用的块
+        if not context_chunks:
+            QUERIES.labels("query", retrieval_mode, "no_context").inc()
+            return QueryResponse(
+                answer="未找到相关文档内容来回答这个问题。",
+                references=[]
+            )
+
+        # 生成答案
+        generator = Generation()
+        try:
+            with stage_timer("query", "generate"):
+                async with GENERATE_STAGE.admit():
+                    answer = await generator.generate_answer(
+                        question=query.question,
+                        context_chunks=context_chunks,
+                        deadline=deadline
+                    )
+        except GenerationError as e:
+            QUERIES.labels("query", retrieval_mode, "error").inc()
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        QUERIES.labels("query", retrieval_mode, "answered").inc()
+
+        _cache_answer(
+            query.question, top_k, document_ids, retrieval_mode,
+            query_embedding, relevant_chunks, answer, references
+        )
+
+        return QueryResponse(
+            answer=answer,
+            references=references
+        )
+    except HTTPException:
+        raise
+    except StageSaturated as e:
+        raise _too_busy(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/stream")
+async def stream_query(
+    query: QueryRequest,
+    top_k: int | None = Query(default=None, ge=1, le=10),
+    document_ids: list[str] = Query(default=None),
+    retrieval_mode: str = Query(default=RETRIEVAL_MODE, pattern="^(vector|hybrid)$")
+):
+    """
+    处理用户查询并以SSE流式返回答案
+
+    事件顺序：references（引用来源）→ 若干 token（答案片段）→ done；
+    生成过程中出错（包括超过 query_timeout）时会在 done 之前发送 error 事件，
+    其中 status 为对应的HTTP状态码（502 / 503 / 504）。
+    编码、检索或生成阶段已满时在开始输出前直接返回429（附 Retry-After）。
+    """
+    settings = RuntimeSettings.get()
+    deadline = Deadline(settings.query_timeout)
+    top_k = top_k or settings.top_k
+    if not query.question.strip():
         raise HTTPException(status_code=400, detail="问题不能为空")
-    
-    # 模拟回答（实际项目需对接RAG逻辑）
-    return QueryResponse(
-        answer=f"这是针对问题「{request.question}」的回答（模拟数据）",
-        references=[
-            ReferenceSource(
-                document_id="test123",
-                filename="示例文档.pdf",
-                page_number=2,
-                content="这是文档中与问题相关的内容片段..."
+    if not settings.deepseek_api_key:
+        raise HTTPException(status_code=400, detail="请先配置DeepSeek API密钥")
+
+    try:
+        # 检索相关文档块（优先使用缓存的答案）
+        query_embedding, relevant_chunks, cached, context_chunks, references = await _retrieve_with_cache(
+            query.question, top_k, document_ids, retrieval_mode
+        )
+        generator = Generation()
+        # 生成名额在返回响应前占用，流结束（包括客户端断开）时释放
+        generate_started = GENERATE_STAGE.acquire() if cached is None and context_chunks else None
+    except StageSaturated as e:
+        raise _too_busy(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def event_stream():
+        try:
+            if cached is not None:
+                # 缓存命中时一次性返回完整答案
+                QUERIES.labels("stream", retrieval_mode, "cache_hit").inc()
+                yield _sse("references", cached["references"])
+                yield _sse("token", {"content": cached["answer"]})
+                yield _sse("done", {})
+                return
+
+            yield _sse("references", [ref.model_dump() for ref in references])
+
+            if not context_chunks:
+                QUERIES.labels("stream", retrieval_mode, "no_context").inc()
+                yield _sse("token", {"content": "未找到相关文档内容来回答这个问题。"})
+            else:
+                tokens = []
+                started = time.perf_counter()
+                try:
+                    async for token in generator.stream_answer(
+                        question=query.question,
+                        context_chunks=context_chunks,
+                        deadline=deadline
+                    ):
+                        tokens.append(token)
+                        yield _sse("token", {"content": token})
+                    observe_stage("query", "generate", time.perf_counter() - started)
+                    QUERIES.labels("stream", retrieval_mode, "answered").inc()
+                    _cache_answer(
+                        query.question, top_k, document_ids, retrieval_mode,
+                        query_embedding, relevant_chunks, "".join(tokens), references
+                    )
+                except GenerationError as e:
+                    QUERIES.labels("stream", retrieval_mode, "error").inc()
+                    yield _sse("error", {"detail": str(e), "status": e.status_code})
+                except Exception as e:
+                    QUERIES.labels("stream", retrieval_mode, "error").inc()
+                    yield _sse("error", {"detail": f"{ERROR_PREFIX}：{str(e)}", "status": 500})
+
+            yield _sse("done", {})
+        finally:
+            if generate_started is not None:
+                GENERATE_STAGE.release(generate_started)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _search_and_prepare_many(
+    questions: list[str],
+    query_embeddings: dict[int, list[float]],
+    top_k: int,
+    document_ids: list[str] | None,
+    retrieval_mode: str
+) -> tuple[dict[int, dict], dict[int, list[dict]], dict[int, list[dict]], dict[int, list[ReferenceSource]]]:
+    """
+    批量查询的缓存查找、检索并组装上下文和引用来源（在 SEARCH_STAGE 的线程中执行）
+
+    所有问题一次批量查语义缓存，其余问题合并为一次多查询检索，引用来源共用一次文档目录查询。
+
+    Args:
+        questions: 全部问题
+        query_embeddings: {问题下标: 查询向量}，只包含需要回答的问题
+
+    Returns:
+        ({下标: 缓存命中的答案}, {下标: 相关文档块}, {下标: 上下文块}, {下标: 引用来源})，
+        后三者只包含未命中缓存的问题
+    """
+    cache = AnswerCache()
+    indexes = list(query_embeddings)
+
+    # 语义缓存命中的问题不再检索
+    with stage_timer("query", "cache_lookup"):
+        hits = cache.get_semantic_many(
+            [query_embeddings[i] for i in indexes], top_k, document_ids, retrieval_mode
+        )
+    cached = {i: hit for i, hit in zip(indexes, hits) if hit is not None}
+    pending = [i for i in indexes if i not in cached]
+
+    # 其余问题合并为一次多查询检索
+    with stage_timer("query", "retrieve"):
+        retrieved = Retrieval().retrieve_many(
+            [questions[i] for i in pending],
+            [query_embeddings[i] for i in pending],
+            top_k,
+            document_ids,
+            retrieval_mode
+        )
+    relevant = dict(zip(pending, retrieved))
+    with stage_timer("query", "cache_lookup"):
+        for i, chunks in relevant.items():
+            if chunks:
+                hit = cache.get_exact(
+                    questions[i], top_k, document_ids, retrieval_mode,
+                    [chunk["id"] for chunk in chunks]
+                )
+                if hit is not None:
+                    cached[i] = hit
+
+    packed = {i: _pack_context(chunks) for i, chunks in relevant.items() if i not in cached}
+    contexts = {i: context_chunks for i, (context_chunks, _) in packed.items()}
+    references = dict(zip(packed, _build_references_many([cited for _, cited in packed.values()])))
+    return cached, relevant, contexts, references
+
+@router.post("/batch")
+async def batch_query(
+    request: BatchQueryRequest,
+    top_k: int | None = Query(default=None, ge=1, le=10),
+    document_ids: list[str] = Query(default=None),
+    retrieval_mode: str = Query(default=RETRIEVAL_MODE, pattern="^(vector|hybrid)$")
+):
+    """
+    批量处理查询，以NDJSON逐条返回
+
+    所有问题一次编码、一次多查询检索，答案生成按运行时配置的 batch_llm_concurrency 和
+    batch_llm_rate_limit 限流并发进行。每个问题完成后立即输出一行：
+        {"index": 下标, "question": 问题, "answer": 答案, "references": [...], "cached": 是否命中缓存}
+    单个问题失败时该行为 {"index", "question", "error", "status"}，不影响其他问题
+    （空问题以400失败，DeepSeek接口熔断后其余问题立即以503失败）；
+    最后一行为 {"done": true, "total": 问题数, "failed": 失败数}。
+    编码或检索阶段已满时在开始输出前直接返回429（附 Retry-After）。
+    """
+    settings = RuntimeSettings.get()
+    top_k = top_k or settings.top_k
+    if not settings.deepseek_api_key:
+        raise HTTPException(status_code=400, detail="请先配置DeepSeek API密钥")
+    if len(request.questions) > settings.batch_query_max_questions:
+        raise HTTPException(
+            status_code=422,
+            detail=f"单次最多提交 {settings.batch_query_max_questions} 个问题"
+        )
+
+    questions = request.questions
+    # 空问题不参与编码和检索，在结果中单独以400失败
+    blank = {i for i, question in enumerate(questions) if not question.strip()}
+    valid = [i for i in range(len(questions)) if i not in blank]
+    try:
+        # 一次编码所有非空问题
+        query_embeddings = {}
+        if valid:
+            with stage_timer("query", "embed"):
+                embeddings = await EMBED_STAGE.run(
+                    Embedding().embed_texts, [questions[i] for i in valid], False
+                )
+            query_embeddings = dict(zip(valid, embeddings))
+
+        # 缓存查找、检索、上下文组装和引用来源在 SEARCH_STAGE 的线程中一次完成
+        cached, relevant, contexts, references = await SEARCH_STAGE.run(
+            _search_and_prepare_many, questions, query_embeddings, top_k, document_ids, retrieval_mode
+        )
+        generator = Generation()
+        llm_slots, rate_limiter = _batch_llm_limits()
+    except StageSaturated as e:
+        raise _too_busy(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def answer(i: int) -> dict:
+        question = questions[i]
+        relevant_chunks = relevant[i]
+        context_chunks = contexts[i]
+        try:
+            async with llm_slots:
+                await rate_limiter.acquire()
+                started = time.perf_counter()
+                # 每个问题从拿到调用名额起单独计时，排队时间不计入
+                answer_text = await generator.generate_answer(
+                    question=question,
+                    context_chunks=context_chunks,
+                    deadline=Deadline(RuntimeSettings.get().query_timeout)
+                )
+                observe_stage("query", "generate", time.perf_counter() - started)
+            _cache_answer(
+                question, top_k, document_ids, retrieval_mode,
+                query_embeddings[i], relevant_chunks, answer_text, references[i]
             )
+            QUERIES.labels("batch", retrieval_mode, "answered").inc()
+            return {
+                "index": i,
+                "question": question,
+                "answer": answer_text,
+                "references": [ref.model_dump() for ref in references[i]],
+                "cached": False
+            }
+        except Exception as e:
+            QUERIES.labels("batch", retrieval_mode, "error").inc()
+            status = e.status_code if isinstance(e, GenerationError) else 500
+            return {"index": i, "question": question, "error": str(e), "status": status}
+
+    def line(item: dict) -> str:
+        return json.dumps(item, ensure_ascii=False) + "\n"
+
+    async def ndjson_stream():
+        failed = 0
+        # 空问题、缓存命中和无相关内容的问题直接返回
+        for i in range(len(questions)):
+            if i in blank:
+                failed += 1
+                QUERIES.labels("batch", retrieval_mode, "error").inc()
+                yield line({"index": i, "question": questions[i], "error": "问题不能为空", "status": 400})
+            elif i in cached:
+                QUERIES.labels("batch", retrieval_mode, "cache_hit").inc()
+                yield line({"index": i, "question": questions[i], **cached[i], "cached": True})
+            elif not contexts[i]:
+                QUERIES.labels("batch", retrieval_mode, "no_context").inc()
+                yield line({
+                    "index": i,
+                    "question": questions[i],
+                    "answer": "未找到相关文档内容来回答这个问题。",
+                    "references": [],
+                    "cached": False
+                })
+
+        tasks = [
+            asyncio.create_task(answer(i))
+            for i in valid
+            if i not in cached and contexts[i]
         ]
+        try:
+            for completed in asyncio.as_completed(tasks):
+                item = await completed
+                failed += "error" in item
+                yield line(item)
+        finally:
+            # 客户端断开时取消尚未完成的生成
+            for task in tasks:
+                task.cancel()
+        yield line({"done": True, "total": len(questions), "failed": failed})
+
+    return StreamingResponse(
+        ndjson_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
-# 在main.py中随便加一行注释，比如：
-# 这是一个测试修改，用于触发提交
\ No newline at end of file
+@router.get("/stats")
+async def get_query_stats():
+    """获取查询链路的运行统计（答案缓存命中率、查询编码批处理等）"""
+    return {
+        "answer_cache": AnswerCache().stats(),
+        "embedding_batcher": EmbeddingBatcher().stats()
+    }
@@ -1,107 +1,74 @@
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-import os
-import re
-from dotenv import load_dotenv  # 用于读取.env文件
-from pathlib import Path
+from pydantic import ConfigDict, create_model
+from typing import Optional
+from app.core.runtime_settings import RuntimeConfig, RuntimeSettings, SettingsValidationError
 
 # 1. 关键：创建APIRouter实例（必须有这行，否则main.py找不到router）
 router = APIRouter()
 
-# 2. 加载环境变量（从backend根目录的.env文件读取）
-# 先确定.env文件路径：backend根目录 → 即 app/api/../.. 目录
-env_file_path = Path(__file__).parent.parent.parent / ".env"
-# 加载.env文件（如果不存在，不会报错，后续用默认值）
-load_dotenv(dotenv_path=env_file_path)
 
+# 2. 定义数据模型（前端传参/后端返回的格式，必须与前端匹配）
+class SettingsResponse(RuntimeConfig):
+    """后端返回给前端的设置格式：全部运行时配置，API密钥脱敏（避免泄露）"""
 
-# 3. 定义数据模型（前端传参/后端返回的格式，必须与前端匹配）
-class SettingsResponse(BaseModel):
-    """后端返回给前端的设置格式"""
-    deepseek_api_key: str  # 脱敏后的API密钥（避免泄露）
-    top_k: int             # 检索相关片段数量（默认3）
 
-class SettingsUpdateRequest(BaseModel):
-    """前端提交设置的格式"""
-    deepseek_api_key: str  # 完整API密钥
-    top_k: int             # 1-10之间的整数
+# 前端提交设置的格式：与运行时配置字段相同，均可省略（只修改提交的字段），不认识的字段直接拒绝；
+# 取值范围在合并到当前配置时统一校验
+SettingsUpdateRequest = create_model(
+    "SettingsUpdateRequest",
+    __config__=ConfigDict(extra="forbid"),
+    **{name: (Optional[field.annotation], None) for name, field in RuntimeConfig.model_fields.items()}
+)
 
 
-# 4. 核心接口1：获取当前设置（前端初始化时调用，这是报错的关键接口）
+def _mask_api_key(api_key: str) -> str:
+    """API密钥脱敏（仅显示前5位+***）"""
+    if len(api_key) >= 5:
+        return api_key[:5] + "***"
+    if len(api_key) > 0:
+        return api_key + "***"
+    return ""
+
+
+def _to_response(config: RuntimeConfig) -> SettingsResponse:
+    return SettingsResponse(**{
+        **config.model_dump(),
+        "deepseek_api_key": _mask_api_key(config.deepseek_api_key)
+    })
+
+
+# 3. 核心接口1：获取当前设置（前端初始化时调用）
 @router.get("/", response_model=SettingsResponse)
 async def get_current_settings():
     try:
-        # 从.env文件读取配置（没有则用默认值）
-        api_key = os.getenv("DEEPSEEK_API_KEY", "")  # 读取API密钥
-        top_k = int(os.getenv("TOP_K", 3))           # 读取检索数量，默认3
-        
-        # API密钥脱敏（仅显示前5位+***，避免前端显示完整密钥）
-        masked_api_key = ""
-        if len(api_key) >= 5:
-            masked_api_key = api_key[:5] + "***"
-        elif len(api_key) > 0:
-            masked_api_key = api_key + "***"
-        
-        # 返回符合前端预期的格式
-        return SettingsResponse(
-            deepseek_api_key=masked_api_key,
-            top_k=top_k
-        )
-    
+        return _to_response(RuntimeSettings.get())
     except Exception as e:
         # 捕获所有异常，返回明确的错误信息
         raise HTTPException(status_code=500, detail=f"获取设置失败：{str(e)}")
 
 
-# 5. 核心接口2：保存设置（前端修改后提交调用）
+# 4. 核心接口2：保存设置（前端修改后提交调用），校验通过后立即生效并写入.env，无需重启
 @router.put("/", response_model=SettingsResponse)
 async def update_settings(request: SettingsUpdateRequest):
+    changes = request.model_dump(exclude_none=True)
+    # 前端未修改API密钥时会原样提交脱敏后的值，此时保持原密钥
+    api_key = changes.get("deepseek_api_key")
+    if api_key is not None and api_key == _mask_api_key(RuntimeSettings.get().deepseek_api_key):
+        del changes["deepseek_api_key"]
+    try:
+        return _to_response(RuntimeSettings().update(changes))
+    except SettingsValidationError as e:
+        raise HTTPException(status_code=400, detail=e.errors)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"保存设置失败：{str(e)}")
+
+
+# 5. 重新加载.env文件中的设置（手动编辑.env后调用；多进程部署时各进程也会自动检测文件变化）
+@router.post("/reload", response_model=SettingsResponse)
+async def reload_settings():
     try:
-        # 验证参数：top_k必须在1-10之间（避免检索数量异常）
-        if not (1 <= request.top_k <= 10):
-            raise HTTPException(status_code=400, detail="检索数量（top_k）必须是1-10之间的整数")
-        
-        # 读取现有.env文件内容（如果不存在，创建空内容）
-        env_content = ""
-        if env_file_path.exists():
-            env_content = env_file_path.read_text(encoding="utf-8")
-        
-        # 替换或添加DEEPSEEK_API_KEY（处理已有配置的情况）
-        if re.search(r"^DEEPSEEK_API_KEY=.*$", env_content, re.MULTILINE):
-            # 替换已有行
-            env_content = re.sub(
-                pattern=r"^DEEPSEEK_API_KEY=.*$",
-                repl=f"DEEPSEEK_API_KEY={request.deepseek_api_key}",
-                string=env_content,
-                flags=re.MULTILINE
-            )
-        else:
-            # 添加新行（如果文件为空，先去掉换行符）
-            env_content = env_content.strip() + f"\nDEEPSEEK_API_KEY={request.deepseek_api_key}"
-        
-        # 替换或添加TOP_K
-        if re.search(r"^TOP_K=.*$", env_content, re.MULTILINE):
-            env_content = re.sub(
-                pattern=r"^TOP_K=.*$",
-                repl=f"TOP_K={request.top_k}",
-                string=env_content,
-                flags=re.MULTILINE
-            )
-        else:
-            env_content += f"\nTOP_K={request.top_k}"
-        
-        # 保存到.env文件（确保有写入权限）
-        env_file_path.write_text(env_content.strip(), encoding="utf-8")
-        
-        # 重新加载环境变量（使新设置立即生效）
-        load_dotenv(dotenv_path=env_file_path, override=True)
-        
-        # 返回脱敏后的设置（与前端格式匹配）
-        masked_api_key = request.deepseek_api_key[:5] + "***" if len(request.deepseek_api_key)>=5 else ""
-        return SettingsResponse(
-            deepseek_api_key=masked_api_key,
-            top_k=request.top_k
-        )
-    
+        return _to_response(RuntimeSettings().reload())
+    except SettingsValidationError as e:
+        raise HTTPException(status_code=400, detail=e.errors)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"保存设置失败：{str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"重新加载设置失败：{str(e)}")
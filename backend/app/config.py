@@ -0,0 +1,2 @@
+# 配置统一定义在 backend/config.py，这里原样重新导出，供 app 内的模块以 app.config 导入
+from config import *  # noqa: F401,F403
@@ -0,0 +1,237 @@
+import re
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+from app.core.runtime_settings import RuntimeSettings
+
+class AnswerCache:
+    """
+    查询答案的两级缓存
+
+    - 精确缓存：以（规范化问题, top_k, 文档过滤条件, 检索模式, 检索到的块ID）为键
+    - 语义缓存：复用查询向量，在相同 top_k、文档过滤条件和检索模式下，
+      与历史问题的余弦相似度超过阈值时直接返回缓存的答案
+
+    两级共用同一份条目，按LRU和TTL淘汰；当答案引用的文档被重新写入或删除时自动失效。
+    容量、有效期和语义相似度阈值为运行时配置，缩小容量时立即淘汰多出的条目。
+    """
+    _instance = None
+    _entries = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if self._entries is None:
+            self._lock = threading.Lock()
+            # 精确键 -> 缓存条目，按最近使用顺序排列
+            self._entries: OrderedDict = OrderedDict()
+            # 文档ID -> 引用了该文档的精确键集合
+            self._by_document: Dict[str, set] = {}
+            self._stats = {
+                "exact_hits": 0,
+                "semantic_hits": 0,
+                "misses": 0,
+                "evictions": 0,
+                "invalidations": 0
+            }
+            RuntimeSettings().subscribe(self._on_settings_changed)
+
+    @staticmethod
+    def normalize_question(question: str) -> str:
+        """规范化问题文本（去除首尾空白、合并空白、统一小写）"""
+        return re.sub(r"\s+", " ", question).strip().lower()
+
+    @staticmethod
+    def _scope(top_k: int, document_ids: Optional[List[str]], retrieval_mode: str) -> tuple:
+        return (top_k, tuple(sorted(document_ids)) if document_ids else None, retrieval_mode)
+
+    def _exact_key(
+        self,
+        question: str,
+        top_k: int,
+        document_ids: Optional[List[str]],
+        retrieval_mode: str,
+        chunk_ids: List[str]
+    ) -> tuple:
+        return (
+            self.normalize_question(question),
+            self._scope(top_k, document_ids, retrieval_mode),
+            tuple(chunk_ids)
+        )
+
+    def _remove(self, key: tuple) -> None:
+        """删除条目并维护文档索引（调用方需持有锁）"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for document_id in entry["document_ids"]:
+            keys = self._by_document.get(document_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_document[document_id]
+
+    def _hit(self, key: tuple, kind: str) -> Dict[str, Any]:
+        self._entries.move_to_end(key)
+        self._stats[kind] += 1
+        entry = self._entries[key]
+        return {"answer": entry["answer"], "references": entry["references"]}
+
+    def get_exact(
+        self,
+        question: str,
+        top_k: int,
+        document_ids: Optional[List[str]],
+        retrieval_mode: str,
+        chunk_ids: List[str]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        精确缓存查找
+
+        Returns:
+            命中时返回 {"answer": ..., "references": [...]}，否则返回None
+        """
+        key = self._exact_key(question, top_k, document_ids, retrieval_mode, chunk_ids)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires_at"] <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            return self._hit(key, "exact_hits")
+
+    def get_semantic(
+        self,
+        query_embedding: List[float],
+        top_k: int,
+        document_ids: Optional[List[str]],
+        retrieval_mode: str
+    ) -> Optional[Dict[str, Any]]:
+        """
+        语义缓存查找：在相同检索范围内找与查询向量最相似的历史问题
+
+        Returns:
+            相似度超过阈值时返回 {"answer": ..., "references": [...]}，否则返回None
+        """
+        return self.get_semantic_many([query_embedding], top_k, document_ids, retrieval_mode)[0]
+
+    def get_semantic_many(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int,
+        document_ids: Optional[List[str]],
+        retrieval_mode: str
+    ) -> List[Optional[Dict[str, Any]]]:
+        """
+        批量语义缓存查找：所有查询向量与同一检索范围内的历史问题一次矩阵乘法算出相似度
+
+        Returns:
+            与 query_embeddings 一一对应的命中答案，未命中为None
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(query_embeddings)
+        threshold = RuntimeSettings.get().answer_cache_semantic_threshold
+        if threshold > 1 or not query_embeddings:
+            return results
+
+        scope = self._scope(top_k, document_ids, retrieval_mode)
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        valid = norms[:, 0] > 0
+        queries = np.divide(queries, norms, out=np.zeros_like(queries), where=norms > 0)
+
+        with self._lock:
+            now = time.monotonic()
+            keys = []
+            vectors = []
+            for key, entry in list(self._entries.items()):
+                if entry["expires_at"] <= now:
+                    self._remove(key)
+                elif key[1] == scope:
+                    keys.append(key)
+                    vectors.append(entry["embedding"])
+            if not keys:
+                return results
+
+            similarities = queries @ np.stack(vectors).T
+            best = np.argmax(similarities, axis=1)
+            for i, j in enumerate(best):
+                if valid[i] and similarities[i, j] >= threshold:
+                    results[i] = self._hit(keys[j], "semantic_hits")
+        return results
+
+    def put(
+        self,
+        question: str,
+        top_k: int,
+        document_ids: Optional[List[str]],
+        retrieval_mode: str,
+        chunk_ids: List[str],
+        query_embedding: List[float],
+        answer: str,
+        references: List[Dict[str, Any]],
+        cited_document_ids: List[str]
+    ) -> None:
+        """写入一条答案缓存"""
+        key = self._exact_key(question, top_k, document_ids, retrieval_mode, chunk_ids)
+        embedding = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        if norm > 0:
+            embedding = embedding / norm
+
+        settings = RuntimeSettings.get()
+        with self._lock:
+            self._remove(key)
+            cited = set(cited_document_ids)
+            self._entries[key] = {
+                "answer": answer,
+                "references": references,
+                "document_ids": cited,
+                "embedding": embedding,
+                "expires_at": time.monotonic() + settings.answer_cache_ttl
+            }
+            for document_id in cited:
+                self._by_document.setdefault(document_id, set()).add(key)
+            self._evict(settings.answer_cache_size)
+
+    def _evict(self, capacity: int) -> None:
+        """按LRU淘汰超出容量的条目（调用方需持有锁）"""
+        while len(self._entries) > capacity:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._stats["evictions"] += 1
+
+    def _on_settings_changed(self, previous, current) -> None:
+        if current.answer_cache_size < previous.answer_cache_size:
+            with self._lock:
+                self._evict(current.answer_cache_size)
+
+    def invalidate_document(self, document_id: str) -> int:
+        """使引用了指定文档的所有缓存答案失效，返回失效的条目数"""
+        with self._lock:
+            keys = list(self._by_document.get(document_id, ()))
+            for key in keys:
+                self._remove(key)
+            self._stats["invalidations"] += len(keys)
+            return len(keys)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._by_document.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中/未命中等统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["exact_hits"] + stats["semantic_hits"]) / lookups if lookups else 0.0
+        return stats
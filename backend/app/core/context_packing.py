@@ -0,0 +1,193 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import (
+    CONTEXT_TOKEN_BUDGET,
+    CONTEXT_MAX_DISTANCE,
+    CONTEXT_DEDUP_THRESHOLD,
+    CONTEXT_MIN_OVERLAP
+)
+
+# 估算token数：中日韩文字每字约一个token，其余按单词/符号计
+_CJK_CHARS = r"\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_CJK_PATTERN = re.compile(f"[{_CJK_CHARS}]")
+_WORD_PATTERN = re.compile(f"[A-Za-z0-9]+|[^\\sA-Za-z0-9{_CJK_CHARS}]")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+# 近似重复判断用的字符n-gram长度
+_SHINGLE_SIZE = 3
+
+class ContextPacking:
+    """
+    检索结果到LLM上下文的组装
+
+    在检索和生成之间依次：按距离阈值截断 → 去掉近似重复的块 →
+    合并同一文档同一页中首尾重叠的相邻块 → 按排名装入token预算。
+    每个组装后的块在 sources 中保留参与合并的原始块，用于生成引用。
+    """
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """
+        估算文本的LLM token数（不依赖具体模型的分词器）
+
+        中日韩文字按每字一个token，英文单词按长度每4个字符约一个token，标点各计一个。
+        """
+        cjk = len(_CJK_PATTERN.findall(text))
+        others = sum(
+            max(1, (len(word) + 3) // 4) if word[0].isalnum() else 1
+            for word in _WORD_PATTERN.findall(text)
+        )
+        return cjk + others
+
+    @staticmethod
+    def _shingles(text: str) -> set:
+        text = _WHITESPACE_PATTERN.sub(" ", text.lower())
+        if len(text) <= _SHINGLE_SIZE:
+            return {text}
+        return {text[i:i + _SHINGLE_SIZE] for i in range(len(text) - _SHINGLE_SIZE + 1)}
+
+    @staticmethod
+    def _overlap(left: str, right: str, min_overlap: int) -> int:
+        """left 的结尾与 right 的开头重叠的最大字符数，不足 min_overlap 时返回0"""
+        for size in range(min(len(left), len(right)), min_overlap - 1, -1):
+            if left.endswith(right[:size]):
+                return size
+        return 0
+
+    @staticmethod
+    def _merge(left: Dict[str, Any], right: Dict[str, Any], min_overlap: int) -> Optional[str]:
+        """尝试把两个块的文本合并为一段（包含或首尾重叠时），无法合并返回None"""
+        a, b = left["document"], right["document"]
+        if b in a:
+            return a
+        if a in b:
+            return b
+        size = ContextPacking._overlap(a, b, min_overlap)
+        if size:
+            return a + b[size:]
+        size = ContextPacking._overlap(b, a, min_overlap)
+        if size:
+            return b + a[size:]
+        return None
+
+    @staticmethod
+    def pack(
+        chunks: List[Dict[str, Any]],
+        token_budget: int = CONTEXT_TOKEN_BUDGET,
+        max_distance: float = CONTEXT_MAX_DISTANCE,
+        dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD,
+        min_overlap: int = CONTEXT_MIN_OVERLAP
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """
+        组装上下文
+
+        Args:
+            chunks: 检索结果（按相关性降序），每个包含 id、document、metadata，可带 distance
+            token_budget: 上下文的token上限（估算值），0表示不限制
+            max_distance: 向量距离（平方L2，归一化向量下为 2 - 2×余弦相似度）上限，
+                超过的块被丢弃；0表示不截断，只被BM25召回的块（distance为None）不受影响
+            dedup_threshold: 字符n-gram的Jaccard相似度达到该值的块视为近似重复，只保留排名靠前的
+            min_overlap: 首尾重叠至少这么多字符才合并
+
+        Returns:
+            (组装后的块列表, 统计信息)；每个块包含 id、document、metadata、distance
+            和 sources（参与合并的原始块，按原排名）
+        """
+        stats = {
+            "chunks_in": len(chunks),
+            "tokens_in": sum(ContextPacking.estimate_tokens(chunk["document"]) for chunk in chunks),
+            "dropped_distance": 0,
+            "dropped_duplicate": 0,
+            "merged": 0,
+            "dropped_budget": 0,
+        }
+
+        # 按距离阈值截断
+        kept = []
+        for chunk in chunks:
+            distance = chunk.get("distance")
+            if max_distance > 0 and distance is not None and distance > max_distance:
+                stats["dropped_distance"] += 1
+            else:
+                kept.append(chunk)
+
+        # 去掉近似重复的块
+        unique = []
+        seen_shingles = []
+        for chunk in kept:
+            shingles = ContextPacking._shingles(chunk["document"])
+            duplicate = any(
+                len(shingles & other) / len(shingles | other) >= dedup_threshold
+                for other in seen_shingles
+            )
+            if duplicate:
+                stats["dropped_duplicate"] += 1
+                continue
+            seen_shingles.append(shingles)
+            unique.append(chunk)
+
+        # 合并同一文档同一页中重叠的块，合并后的块占据其中排名最靠前的位置
+        ranks = {chunk["id"]: rank for rank, chunk in enumerate(unique)}
+        packed: List[Dict[str, Any]] = []
+        for rank, chunk in enumerate(unique):
+            entry = {
+                "rank": rank,
+                "id": chunk["id"],
+                "document": chunk["document"],
+                "metadata": chunk["metadata"],
+                "distance": chunk.get("distance"),
+                "sources": [chunk],
+            }
+            merged = True
+            while merged:
+                merged = False
+                for other in packed:
+                    if (
+                        other["metadata"].get("document_id") != entry["metadata"].get("document_id")
+                        or other["metadata"].get("page_number") != entry["metadata"].get("page_number")
+                    ):
+                        continue
+                    text = ContextPacking._merge(other, entry, min_overlap)
+                    if text is None:
+                        continue
+                    other["document"] = text
+                    other["sources"] = sorted(other["sources"] + entry["sources"], key=lambda c: ranks[c["id"]])
+                    other["rank"] = min(other["rank"], entry["rank"])
+                    other["id"] = other["sources"][0]["id"]
+                    if entry["distance"] is not None and (
+                        other["distance"] is None or entry["distance"] < other["distance"]
+                    ):
+                        other["distance"] = entry["distance"]
+                    stats["merged"] += 1
+                    # 合并后的块可能又能与其他块合并：从列表中取出后重新检查
+                    packed.remove(other)
+                    entry = other
+                    merged = True
+                    break
+            packed.append(entry)
+        # 恢复排名顺序（合并后的块按其中排名最靠前的块排序）
+        packed.sort(key=lambda entry: entry["rank"])
+
+        # 按排名装入token预算，装不下的块跳过（后面更短的块仍可能装得下）
+        result = []
+        used = 0
+        for entry in packed:
+            del entry["rank"]
+            tokens = ContextPacking.estimate_tokens(entry["document"])
+            if token_budget > 0 and used + tokens > token_budget:
+                if result:
+                    stats["dropped_budget"] += len(entry["sources"])
+                    continue
+                # 排名第一的块本身就超出预算时按比例截断，保证至少有一段上下文
+                entry["document"] = entry["document"][:max(1, len(entry["document"]) * token_budget // tokens)]
+                tokens = ContextPacking.estimate_tokens(entry["document"])
+            used += tokens
+            result.append(entry)
+
+        stats["chunks_out"] = len(result)
+        stats["tokens_out"] = used
+        return result, stats
+
+    @staticmethod
+    def sources(packed: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """组装后的上下文实际用到的原始块（用于生成引用）"""
+        return [source for entry in packed for source in entry["sources"]]
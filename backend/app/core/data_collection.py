@@ -1,89 +1,290 @@
 import pdfplumber
+import hashlib
 import os
 import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from app.config import DOCUMENTS_DIR
+from typing import Iterator, Optional
+from app.config import (
+    DOCUMENTS_DIR,
+    PDF_EXTRACT_WORKERS,
+    PDF_PARALLEL_MIN_PAGES,
+    PDF_SHARD_PAGES,
+    PDF_INFLIGHT_PAGES,
+    UPLOAD_MAX_BYTES,
+    UPLOAD_CHUNK_BYTES
+)
+from app.core.document_catalog import DocumentCatalog
 from app.models.document import DocumentMetadata
 
+def _extract_page_range(file_path: str, start: int, end: int) -> list[str]:
+    """在子进程中解析PDF的 [start, end) 页（需为模块级函数以便序列化）"""
+    pages_text = []
+    with pdfplumber.open(file_path) as pdf:
+        for page in pdf.pages[start:end]:
+            pages_text.append(page.extract_text() or "")
+            page.flush_cache()
+    return pages_text
+
+class UploadTooLarge(Exception):
+    """上传的文件超过大小上限"""
+
 class DataCollection:
+    # PDF解析进程池（首次并行解析时创建）
+    _pdf_executor = None
+
     @staticmethod
-    def save_uploaded_file(file) -> str:
-        """保存上传的文件并返回文件ID"""
+    def _stream_to_file(file, path: Path, max_bytes: int = UPLOAD_MAX_BYTES) -> str:
+        """
+        分块把上传文件写入磁盘，同时计算SHA-256
+
+        已知文件大小时先检查上限；写入过程中一旦超过上限立即停止并删除已写入的部分。
+
+        Returns:
+            文件内容的SHA-256
+
+        Raises:
+            UploadTooLarge: 文件超过大小上限
+        """
+        limit_message = f"文件超过大小上限 {max_bytes // (1024 * 1024)}MB"
+        if getattr(file, "size", None) is not None and file.size > max_bytes:
+            raise UploadTooLarge(limit_message)
+
+        sha256 = hashlib.sha256()
+        written = 0
+        try:
+            with open(path, "wb") as buffer:
+                for block in iter(lambda: file.file.read(UPLOAD_CHUNK_BYTES), b""):
+                    written += len(block)
+                    if written > max_bytes:
+                        raise UploadTooLarge(limit_message)
+                    sha256.update(block)
+                    buffer.write(block)
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+        return sha256.hexdigest()
+
+    @staticmethod
+    def save_uploaded_file(file) -> tuple[str, str, bool]:
+        """
+        流式保存上传的文件
+
+        与已入库文档内容相同的文件不保存，直接返回已有文档的ID；与正在入库的文档重复的情况
+        由 IngestionJobs.submit 在创建任务时检查。
+
+        Returns:
+            (文件ID, 内容哈希, 是否与已入库的文档重复)；重复时文件ID为已有文档的ID
+
+        Raises:
+            UploadTooLarge: 文件超过大小上限
+        """
         file_id = str(uuid.uuid4())
         file_extension = os.path.splitext(file.filename)[1]
         file_path = DOCUMENTS_DIR / f"{file_id}{file_extension}"
+        # 写完并确认不是重复文档之后才改为正式文件名（启动时补做入库不会处理写了一半的文件）
+        tmp_path = file_path.with_name(f"{file_path.name}.tmp")
         
-        with open(file_path, "wb") as buffer:
-            buffer.write(file.file.read())
+        content_hash = DataCollection._stream_to_file(file, tmp_path)
+        existing = DocumentCatalog().find_by_hash(content_hash)
+        if existing is not None:
+            tmp_path.unlink(missing_ok=True)
+            return existing["id"], content_hash, True
             
-        return file_id
+        os.replace(tmp_path, file_path)
+        return file_id, content_hash, False
     
     @staticmethod
-    def read_pdf(file_id: str) -> tuple[list[str], int]:
-        """读取PDF文件内容，返回每页文本和总页数"""
-        # 查找文件
+    def replace_uploaded_file(file_id: str, file) -> bool:
+        """
+        用新上传的文件覆盖已有文档（文档ID不变）
+
+        Returns:
+            文档不存在时返回False
+        """
+        try:
+            file_path = DataCollection._find_pdf(file_id)
+        except FileNotFoundError:
+            return False
+
+        # 先写临时文件再原子替换，避免正在解析的任务读到写了一半的文件
+        tmp_path = file_path.with_name(f"{file_path.name}.tmp")
+        DataCollection._stream_to_file(file, tmp_path)
+        os.replace(tmp_path, file_path)
+        return True
+
+    @staticmethod
+    def _find_pdf(file_id: str) -> Path:
+        """查找文档ID对应的PDF文件"""
         for file in DOCUMENTS_DIR.glob(f"{file_id}.*"):
             if file.suffix.lower() == ".pdf":
-                pages_text = []
-                with pdfplumber.open(file) as pdf:
-                    for page in pdf.pages:
-                        text = page.extract_text() or ""
-                        pages_text.append(text)
-                return pages_text, len(pages_text)
-        
+                return file
+
         raise FileNotFoundError(f"PDF文件 {file_id} 未找到")
+
+    @classmethod
+    def _get_pdf_executor(cls) -> ProcessPoolExecutor:
+        if cls._pdf_executor is None:
+            cls._pdf_executor = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS)
+        return cls._pdf_executor
+
+    @staticmethod
+    def get_page_count(file_id: str) -> int:
+        """获取PDF总页数（只读取页面目录，不解析页面内容）"""
+        with pdfplumber.open(DataCollection._find_pdf(file_id)) as pdf:
+            return len(pdf.pages)
+
+    @staticmethod
+    def iter_pdf_pages(file_id: str) -> Iterator[str]:
+        """
+        按页码顺序逐页产出PDF文本
+
+        在进程池中解析（pdfplumber是纯Python实现，在服务进程中解析会长时间占用GIL，
+        拖慢同一进程中的所有请求）；页数较多时按页段分片并行解析。同时在途的页数不超过
+        PDF_INFLIGHT_PAGES，因此内存占用与文档大小无关，调用方可以在后面的
+        页还在解析时就开始处理前面的页。
+
+        Args:
+            file_id: 文档ID
+
+        Yields:
+            每页的文本内容
+        """
+        file = DataCollection._find_pdf(file_id)
+        with pdfplumber.open(file) as pdf:
+            page_count = len(pdf.pages)
+            if PDF_EXTRACT_WORKERS <= 0:
+                # 未启用进程池时在当前进程中逐页解析
+                for page in pdf.pages:
+                    yield page.extract_text() or ""
+                    page.flush_cache()
+                return
+
+        # 小文档整体作为一个分片交给进程池
+        shard_pages = PDF_SHARD_PAGES if page_count >= PDF_PARALLEL_MIN_PAGES else max(1, page_count)
+        shards = iter([
+            (start, min(start + shard_pages, page_count))
+            for start in range(0, page_count, shard_pages)
+        ])
+        max_inflight = max(1, PDF_INFLIGHT_PAGES // shard_pages)
+        executor = DataCollection._get_pdf_executor()
+
+        def submit_next() -> None:
+            shard = next(shards, None)
+            if shard is not None:
+                pending.append(executor.submit(_extract_page_range, str(file), *shard))
+
+        pending = deque()
+        try:
+            for _ in range(max_inflight):
+                submit_next()
+
+            while pending:
+                pages_text = pending.popleft().result()
+                # 取走一个分片后补充下一个，保持在途分片数不变
+                submit_next()
+                yield from pages_text
+        finally:
+            # 调用方提前停止迭代时取消尚未开始的分片
+            for future in pending:
+                future.cancel()
+
+    @staticmethod
+    def read_pdf(file_id: str) -> tuple[list[str], int]:
+        """读取PDF文件内容，返回每页文本和总页数"""
+        pages_text = list(DataCollection.iter_pdf_pages(file_id))
+        return pages_text, len(pages_text)
+    
+    @staticmethod
+    def compute_file_hash(file_id: str) -> str:
+        """计算文档文件内容的SHA-256"""
+        sha256 = hashlib.sha256()
+        with open(DataCollection._find_pdf(file_id), "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(block)
+        return sha256.hexdigest()
+    
+    @staticmethod
+    def register_document(
+        file_id: str,
+        filename: str,
+        page_count: int,
+        chunk_count: int,
+        content_hash: Optional[str] = None,
+        created_at: Optional[datetime] = None
+    ) -> None:
+        """入库完成后将文档元数据写入文档目录"""
+        file = DataCollection._find_pdf(file_id)
+        stat = file.stat()
+        DocumentCatalog().upsert(
+            document_id=file_id,
+            filename=filename,
+            size=stat.st_size,
+            content_hash=content_hash or DataCollection.compute_file_hash(file_id),
+            page_count=page_count,
+            chunk_count=chunk_count,
+            created_at=(created_at or datetime.fromtimestamp(stat.st_ctime)).isoformat()
+        )
+    
+    @staticmethod
+    def _to_metadata(record: dict) -> DocumentMetadata:
+        return DocumentMetadata(
+            id=record["id"],
+            filename=record["filename"],
+            size=record["size"],
+            created_at=datetime.fromisoformat(record["created_at"]),
+            page_count=record["page_count"]
+        )
     
     @staticmethod
     def get_document_metadata(file_id: str) -> DocumentMetadata:
         """获取文档元数据"""
-        for file in DOCUMENTS_DIR.glob(f"{file_id}.*"):
-            # 获取文件创建时间
-            created_at = datetime.fromtimestamp(file.stat().st_ctime)
-            
-            # 如果是PDF，获取页数
-            page_count = 0
-            if file.suffix.lower() == ".pdf":
-                with pdfplumber.open(file) as pdf:
-                    page_count = len(pdf.pages)
-            
-            return DocumentMetadata(
-                id=file_id,
-                filename=file.name,
-                size=file.stat().st_size,
-                created_at=created_at,
-                page_count=page_count
-            )
-        
-        raise FileNotFoundError(f"文件 {file_id} 未找到")
+        record = DocumentCatalog().get(file_id)
+        if record is None:
+            raise FileNotFoundError(f"文件 {file_id} 未找到")
+        return DataCollection._to_metadata(record)
+    
+    @staticmethod
+    def get_documents_metadata(file_ids: list[str]) -> dict[str, DocumentMetadata]:
+        """批量获取文档元数据，返回 {文档ID: 元数据}，不存在的文档不包含在结果中"""
+        records = DocumentCatalog().get_many(file_ids)
+        return {
+            file_id: DataCollection._to_metadata(record)
+            for file_id, record in records.items()
+        }
     
     @staticmethod
-    def get_all_documents() -> list[DocumentMetadata]:
-        """获取所有文档的元数据"""
-        documents = []
-        # 获取所有文件ID（不带扩展名）
-        file_ids = set()
-        for file in DOCUMENTS_DIR.iterdir():
-            if file.is_file():
-                file_id = file.stem
-                file_ids.add(file_id)
+    def list_documents(limit: int, offset: int = 0) -> tuple[list[DocumentMetadata], int]:
+        """
+        分页获取文档的元数据（按创建时间排序，最新的在前）
         
-        # 为每个文件ID获取元数据
-        for file_id in file_ids:
-            try:
-                metadata = DataCollection.get_document_metadata(file_id)
-                documents.append(metadata)
-            except FileNotFoundError:
-                continue
+        Returns:
+            (本页文档元数据列表, 文档总数)
+        """
+        records, total = DocumentCatalog().list_page(limit, offset)
+        return [DataCollection._to_metadata(record) for record in records], total
+    
+    @staticmethod
+    def list_unregistered_files() -> dict[str, str]:
+        """
+        列出文档目录中尚未登记到文档目录的PDF文件（应用启动时补做入库）
         
-        # 按创建时间排序（最新的在前）
-        documents.sort(key=lambda x: x.created_at, reverse=True)
-        return documents
+        Returns:
+            {文档ID: 文件名}
+        """
+        registered = DocumentCatalog().list_ids()
+        return {
+            file.stem: file.name
+            for file in DOCUMENTS_DIR.iterdir()
+            if file.is_file() and file.suffix.lower() == ".pdf" and file.stem not in registered
+        }
     
     @staticmethod
     def delete_document(file_id: str) -> bool:
         """删除文档及其相关文件"""
-        deleted = False
+        deleted = DocumentCatalog().delete(file_id)
         for file in DOCUMENTS_DIR.glob(f"{file_id}.*"):
             file.unlink()
             deleted = True
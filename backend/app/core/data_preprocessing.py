@@ -1,5 +1,23 @@
+import math
 import re
-from typing import List, Tuple
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+# 按token分块用到的正则（模块加载时预编译）
+_CJK_CHARS = r"\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\u3000-\u303f\uff00-\uffef"
+_CJK_CHAR_PATTERN = re.compile(f"[{_CJK_CHARS}]")
+# 控制字符和无法识别的替换字符
+_CONTROL_PATTERN = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f\ufffd]")
+# 空行分隔段落
+_PARAGRAPH_PATTERN = re.compile(r"\n[ \t\u3000]*\n")
+# 英文单词在行尾被连字符断开
+_HYPHEN_BREAK_PATTERN = re.compile(r"(?<=[a-z])-\n(?=[a-z])")
+# 中日韩文字之间的换行（直接拼接，不插入空格）
+_CJK_LINE_BREAK_PATTERN = re.compile(f"(?<=[{_CJK_CHARS}])[ \\t]*\\n[ \\t]*(?=[{_CJK_CHARS}])")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+# 句子：以中文或英文句末标点结尾（可带后引号/括号），英文句点需后跟空白以避开小数和缩写中的点
+_SENTENCE_PATTERN = re.compile(r".+?(?:[。！？!?；;…]+[”’」』）)\]\"']*|\.(?=\s)|$)", re.S)
+# 子句：超长句子再按逗号、顿号、冒号或空白切分
+_CLAUSE_PATTERN = re.compile(r".+?(?:[，,、：:]+|\s+|$)", re.S)
 
 class DataPreprocessing:
     @staticmethod
@@ -13,7 +31,7 @@ class DataPreprocessing:
     
     @staticmethod
     def split_text_into_chunks(
-        pages_text: List[str], 
+        pages_text: Iterable[str], 
         chunk_size: int = 300, 
         chunk_overlap: int = 50
     ) -> List[Tuple[str, int]]:
@@ -28,8 +46,25 @@ class DataPreprocessing:
         Returns:
             元组列表，每个元组包含(文本块, 页码)
         """
-        chunks = []
+        return list(DataPreprocessing.iter_chunks(pages_text, chunk_size, chunk_overlap))
+    
+    @staticmethod
+    def iter_chunks(
+        pages_text: Iterable[str], 
+        chunk_size: int = 300, 
+        chunk_overlap: int = 50
+    ) -> Iterator[Tuple[str, int]]:
+        """
+        逐页分割文本并逐块产出，可直接消费 DataCollection.iter_pdf_pages 的输出
         
+        Args:
+            pages_text: 按页顺序产出文本的可迭代对象
+            chunk_size: 每个块的大致长度（字符数）
+            chunk_overlap: 块之间的重叠长度（字符数）
+            
+        Yields:
+            (文本块, 页码)
+        """
         for page_num, page_text in enumerate(pages_text, 1):
             cleaned_text = DataPreprocessing.clean_text(page_text)
             if not cleaned_text:
@@ -40,7 +75,7 @@ class DataPreprocessing:
             
             for para in paragraphs:
                 if len(para) <= chunk_size:
-                    chunks.append((para, page_num))
+                    yield (para, page_num)
                 else:
                     # 如果段落过长，进一步分割
                     start = 0
@@ -54,11 +89,127 @@ class DataPreprocessing:
                         
                         chunk = para[start:end].strip()
                         if chunk:
-                            chunks.append((chunk, page_num))
+                            yield (chunk, page_num)
                         
                         # 下一次开始位置，考虑重叠
                         start = end - chunk_overlap
                         if start <= 0:
                             start = end
+    
+    @staticmethod
+    def _normalize_paragraph(paragraph: str) -> str:
+        """合并段内换行：中日韩文字间直接拼接，其余换行和连续空白替换为一个空格"""
+        paragraph = _HYPHEN_BREAK_PATTERN.sub("", paragraph)
+        paragraph = _CJK_LINE_BREAK_PATTERN.sub("", paragraph)
+        return _WHITESPACE_PATTERN.sub(" ", paragraph).strip()
+    
+    @staticmethod
+    def _split_long_unit(
+        text: str,
+        tokens: int,
+        max_tokens: int,
+        count_tokens: Callable[[List[str]], List[int]]
+    ) -> List[Tuple[str, int]]:
+        """把超过token上限的句子按子句切分，子句仍超长时按字符数均分"""
+        clauses = [m.group().strip() for m in _CLAUSE_PATTERN.finditer(text)]
+        clauses = [clause for clause in clauses if clause]
+        if len(clauses) <= 1:
+            parts = math.ceil(tokens / max_tokens)
+            size = math.ceil(len(text) / parts)
+            pieces = [text[i:i + size] for i in range(0, len(text), size)]
+            return list(zip(pieces, count_tokens(pieces)))
         
-        return chunks
+        units = []
+        for clause, clause_tokens in zip(clauses, count_tokens(clauses)):
+            if clause_tokens > max_tokens:
+                units.extend(DataPreprocessing._split_long_unit(clause, clause_tokens, max_tokens, count_tokens))
+            else:
+                units.append((clause, clause_tokens))
+        return units
+    
+    @staticmethod
+    def _join_units(units: List[Tuple[str, int, bool]]) -> str:
+        """拼接句子：段落之间换行，中日韩文字之间不加空格，其余加一个空格"""
+        parts = []
+        for i, (text, _, paragraph_start) in enumerate(units):
+            if i > 0:
+                previous = parts[-1]
+                if paragraph_start:
+                    parts.append("\n")
+                elif not (_CJK_CHAR_PATTERN.match(previous[-1]) and _CJK_CHAR_PATTERN.match(text[0])):
+                    parts.append(" ")
+            parts.append(text)
+        return "".join(parts)
+    
+    @staticmethod
+    def iter_token_chunks(
+        pages_text: Iterable[str],
+        count_tokens: Callable[[List[str]], List[int]],
+        max_tokens: int,
+        overlap_tokens: int = 0
+    ) -> Iterator[Tuple[str, int]]:
+        """
+        按嵌入模型的token数分块，逐页流式产出
+        
+        每页先按空行切成段落、再按句末标点（含中文标点）切成句子，然后把句子
+        依次装入当前块，直到再放一句就会超过 max_tokens；块不跨页，也不在句子
+        中间切断（单句超长时才按子句切分）。相邻块按整句重叠不超过 overlap_tokens 个token。
+        
+        Args:
+            pages_text: 按页顺序产出文本的可迭代对象
+            count_tokens: 批量统计文本token数的函数（如 Embedding.count_tokens）
+            max_tokens: 每块的token上限
+            overlap_tokens: 相邻块重叠的token上限
+            
+        Yields:
+            (文本块, 页码)
+        """
+        for page_num, page_text in enumerate(pages_text, 1):
+            page_text = _CONTROL_PATTERN.sub("", page_text)
+            
+            # 切分段落和句子，记录每句是否为段落开头
+            sentences = []
+            paragraph_starts = []
+            for paragraph in _PARAGRAPH_PATTERN.split(page_text):
+                paragraph = DataPreprocessing._normalize_paragraph(paragraph)
+                first = True
+                for match in _SENTENCE_PATTERN.finditer(paragraph):
+                    sentence = match.group().strip()
+                    if sentence:
+                        sentences.append(sentence)
+                        paragraph_starts.append(first)
+                        first = False
+            if not sentences:
+                continue
+            
+            # 整页的句子一次性统计token数
+            units = []
+            for sentence, tokens, paragraph_start in zip(sentences, count_tokens(sentences), paragraph_starts):
+                if tokens > max_tokens:
+                    pieces = DataPreprocessing._split_long_unit(sentence, tokens, max_tokens, count_tokens)
+                    for i, (piece, piece_tokens) in enumerate(pieces):
+                        units.append((piece, piece_tokens, paragraph_start and i == 0))
+                else:
+                    units.append((sentence, tokens, paragraph_start))
+            
+            # 贪心装箱
+            current = []
+            current_tokens = 0
+            for unit in units:
+                if current and current_tokens + unit[1] > max_tokens:
+                    yield (DataPreprocessing._join_units(current), page_num)
+                    # 保留末尾若干整句作为下一块的开头
+                    overlap = []
+                    overlap_total = 0
+                    for previous in reversed(current):
+                        if overlap_total + previous[1] > overlap_tokens:
+                            break
+                        overlap.insert(0, previous)
+                        overlap_total += previous[1]
+                    if overlap_total + unit[1] > max_tokens:
+                        overlap, overlap_total = [], 0
+                    current, current_tokens = overlap, overlap_total
+                current.append(unit)
+                current_tokens += unit[1]
+            if current:
+                yield (DataPreprocessing._join_units(current), page_num)
@@ -0,0 +1,133 @@
+import sqlite3
+import threading
+from typing import Dict, Any, List, Optional
+from app.config import DOCUMENT_CATALOG_DB
+
+class DocumentCatalog:
+    """
+    基于SQLite的文档目录
+
+    文档元数据在入库时写入一次，列表和引用来源解析都走索引查询，
+    不再遍历目录、打开PDF统计页数。
+    """
+    _instance = None
+    _conn = None
+    _init_lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._init_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if self._conn is not None:
+            return
+        with self._init_lock:
+            if self._conn is not None:
+                return
+            self._lock = threading.Lock()
+            conn = sqlite3.connect(str(DOCUMENT_CATALOG_DB), check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS documents (
+                    id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    content_hash TEXT,
+                    page_count INTEGER NOT NULL DEFAULT 0,
+                    chunk_count INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_documents_created_at ON documents (created_at)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents (content_hash)"
+            )
+            conn.commit()
+            # 建表完成后才发布连接，其他线程不会在表创建之前查询
+            self._conn = conn
+
+    def upsert(
+        self,
+        document_id: str,
+        filename: str,
+        size: int,
+        content_hash: Optional[str],
+        page_count: int,
+        chunk_count: int,
+        created_at: str
+    ) -> None:
+        """写入或更新一条文档记录"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents "
+                "(id, filename, size, content_hash, page_count, chunk_count, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (document_id, filename, size, content_hash, page_count, chunk_count, created_at)
+            )
+            self._conn.commit()
+
+    def get(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """获取单个文档记录，不存在时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM documents WHERE id = ?", (document_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def get_many(self, document_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量获取文档记录，返回 {文档ID: 记录}"""
+        unique = list(dict.fromkeys(document_ids))
+        if not unique:
+            return {}
+        placeholders = ",".join("?" * len(unique))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM documents WHERE id IN ({placeholders})", unique
+            ).fetchall()
+        return {row["id"]: dict(row) for row in rows}
+
+    def find_by_hash(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """按内容哈希查找已入库（有文本块）的文档，不存在时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM documents WHERE content_hash = ? AND chunk_count > 0 "
+                "ORDER BY created_at LIMIT 1",
+                (content_hash,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def list_page(self, limit: int, offset: int = 0) -> tuple[List[Dict[str, Any]], int]:
+        """
+        按入库时间倒序分页列出文档记录（走 created_at 索引）
+
+        Returns:
+            (本页记录列表, 文档总数)
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM documents ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                (limit, offset)
+            ).fetchall()
+            total = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        return [dict(row) for row in rows], total
+
+    def list_ids(self) -> set:
+        """获取所有已登记的文档ID"""
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM documents").fetchall()
+        return {row[0] for row in rows}
+
+    def delete(self, document_id: str) -> bool:
+        """删除文档记录，返回是否存在该记录"""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+            self._conn.commit()
+        return cursor.rowcount > 0
@@ -1,23 +1,121 @@
-from sentence_transformers import SentenceTransformer
-from app.config import EMBEDDING_MODEL
+import threading
+import numpy as np
+from app.config import (
+    EMBEDDING_MODEL,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_BACKEND,
+    EMBEDDING_ONNX_DIR,
+    EMBEDDING_ONNX_QUANTIZATION
+)
+from app.core.embedding_cache import EmbeddingCache
+
+# 嵌入模型推理后端
+EMBEDDING_BACKENDS = ("torch", "onnx")
+
+def load_model(backend: str = EMBEDDING_BACKEND):
+    """
+    加载嵌入模型（torch / onnxruntime 在这里才导入，导入本模块本身不加载重依赖）
+
+    Returns:
+        提供 encode / tokenizer / max_seq_length 的模型对象
+    """
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(EMBEDDING_MODEL)
+    if backend == "onnx":
+        from app.core.onnx_embedding import OnnxSentenceEncoder
+        return OnnxSentenceEncoder(EMBEDDING_ONNX_DIR, EMBEDDING_ONNX_QUANTIZATION)
+    raise ValueError(f"不支持的嵌入模型后端：{backend}")
 
 class Embedding:
     _instance = None
     _model = None
-    
+    _cache = None
+    # 缓存键中的模型标识（量化后的向量与原模型略有差异，分开缓存）
+    _cache_key = EMBEDDING_MODEL
+    _ready = threading.Event()
+    # 首次创建时加锁：后台预热和第一个请求可能同时创建实例，模型只能加载一次
+    _init_lock = threading.Lock()
+
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
+            with cls._init_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
         return cls._instance
-    
+
     def __init__(self):
-        if self._model is None:
-            self._model = SentenceTransformer(EMBEDDING_MODEL)
-    
+        if self._model is not None:
+            return
+        with self._init_lock:
+            if self._model is not None:
+                return
+            if EMBEDDING_BACKEND == "onnx" and EMBEDDING_ONNX_QUANTIZATION != "none":
+                self._cache_key = f"{EMBEDDING_MODEL}:onnx-{EMBEDDING_ONNX_QUANTIZATION}"
+            if EMBEDDING_CACHE_ENABLED:
+                self._cache = EmbeddingCache(EMBEDDING_CACHE_PATH)
+            # 最后才设置模型：其他线程看到模型已加载时，实例的其余属性也已就绪
+            self._model = load_model()
+
+    @classmethod
+    def warm_up(cls) -> "Embedding":
+        """加载模型并编码一次样例文本（应用启动时在后台调用），完成后 is_ready() 返回True"""
+        embedding = cls()
+        embedding._model.encode(["warm up"])
+        cls._ready.set()
+        return embedding
+
+    @classmethod
+    def is_ready(cls) -> bool:
+        """模型是否已加载并完成预热"""
+        return cls._ready.is_set()
+
     def embed_text(self, text: str) -> list[float]:
         """将文本转换为向量"""
         return self._model.encode(text).tolist()
-    
-    def embed_texts(self, texts: list[str]) -> list[list[float]]:
-        """将多个文本转换为向量"""
-        return self._model.encode(texts).tolist()
+
+    def count_tokens(self, texts: list[str]) -> list[int]:
+        """用模型的分词器批量统计每段文本的token数（不含[CLS]/[SEP]等特殊token）"""
+        if not texts:
+            return []
+        encoded = self._model.tokenizer(
+            texts,
+            add_special_tokens=False,
+            return_attention_mask=False,
+            return_token_type_ids=False
+        )
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    @property
+    def max_tokens(self) -> int:
+        """单段文本最多可编码的token数（模型最大序列长度减去特殊token）"""
+        return self._model.max_seq_length - 2
+
+    def embed_texts(self, texts: list[str], use_cache: bool = True) -> list[list[float]]:
+        """
+        将多个文本转换为向量（命中缓存的文本不再重复编码）
+
+        Args:
+            texts: 文本列表
+            use_cache: 是否使用嵌入缓存（一次性的查询文本无需缓存）
+        """
+        if self._cache is None or not use_cache or not texts:
+            return self._model.encode(texts).tolist()
+
+        hashes = [EmbeddingCache.hash_text(text) for text in texts]
+        vectors = self._cache.get_many(self._cache_key, hashes)
+
+        # 未命中的文本去重后一次性批量编码
+        missing = {}
+        for text_hash, text in zip(hashes, texts):
+            if text_hash not in vectors:
+                missing.setdefault(text_hash, text)
+
+        if missing:
+            encoded = self._model.encode(list(missing.values())).astype(np.float32)
+            new_vectors = dict(zip(missing.keys(), encoded))
+            self._cache.put_many(self._cache_key, new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[text_hash].tolist() for text_hash in hashes]
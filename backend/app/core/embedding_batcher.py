@@ -0,0 +1,120 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Any
+from app.core.embedding import Embedding
+from app.core.runtime_settings import RuntimeSettings
+
+class EmbeddingBatcher:
+    """
+    查询向量的动态微批处理器
+
+    并发的单条编码请求先进入队列，后台线程在 embed_batch_wait_ms 毫秒内
+    或凑满 embed_batch_max_size 条后合并成一次 encode 调用，再把结果分发给各调用方
+    （两个参数为运行时配置，每批开始时读取）。
+    """
+    _instance = None
+    _thread = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if self._thread is None:
+            self._queue: queue.Queue = queue.Queue()
+            self._embedding = Embedding()
+            self._stats_lock = threading.Lock()
+            self._stats = {
+                "requests": 0,
+                "batches": 0,
+                "max_queue_depth": 0,
+                "total_wait_ms": 0.0,
+                "total_encode_ms": 0.0,
+                # 批大小分布：上界 -> 批次数（1, 2, 4, ... 直至 embed_batch_max_size）
+                "batch_size_histogram": {}
+            }
+            self._thread = threading.Thread(
+                target=self._loop,
+                name="embedding-batcher",
+                daemon=True
+            )
+            self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        """提交一条编码请求，返回结果的Future"""
+        future: Future = Future()
+        self._queue.put((text, future, time.monotonic()))
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            self._stats["requests"] += 1
+            if depth > self._stats["max_queue_depth"]:
+                self._stats["max_queue_depth"] = depth
+        return future
+
+    def embed(self, text: str) -> list[float]:
+        """同步编码单条文本（阻塞当前线程直到所在批次完成）"""
+        return self.submit(text).result()
+
+    async def aembed(self, text: str) -> list[float]:
+        """异步编码单条文本，等待期间不阻塞事件循环"""
+        return await asyncio.wrap_future(self.submit(text))
+
+    def _collect_batch(self) -> list:
+        """阻塞等待第一条请求，然后在等待窗口内继续收集，直到凑满一批"""
+        batch = [self._queue.get()]
+        settings = RuntimeSettings.get()
+        deadline = time.monotonic() + settings.embed_batch_wait_ms / 1000
+        while len(batch) < settings.embed_batch_max_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._collect_batch()
+            started = time.monotonic()
+            try:
+                vectors = self._embedding.embed_texts(
+                    [text for text, _, _ in batch],
+                    use_cache=False
+                )
+                for (_, future, _), vector in zip(batch, vectors):
+                    future.set_result(vector)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            finished = time.monotonic()
+            self._record(batch, started, finished)
+
+    def _record(self, batch: list, started: float, finished: float) -> None:
+        bucket = 1
+        while bucket < len(batch):
+            bucket *= 2
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            self._stats["total_wait_ms"] += sum(started - enqueued for _, _, enqueued in batch) * 1000
+            self._stats["total_encode_ms"] += (finished - started) * 1000
+            histogram = self._stats["batch_size_histogram"]
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """返回队列深度、批大小等指标，用于调整等待窗口"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+            stats["batch_size_histogram"] = dict(sorted(self._stats["batch_size_histogram"].items()))
+        requests = stats["requests"]
+        batches = stats["batches"]
+        stats["queue_depth"] = self._queue.qsize()
+        stats["avg_batch_size"] = requests / batches if batches else 0.0
+        stats["avg_wait_ms"] = stats.pop("total_wait_ms") / requests if requests else 0.0
+        stats["avg_encode_ms"] = stats.pop("total_encode_ms") / batches if batches else 0.0
+        return stats
@@ -0,0 +1,142 @@
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Optional
+from app.config import (
+    EMBED_WORKERS,
+    EMBED_MAX_PENDING,
+    SEARCH_WORKERS,
+    SEARCH_MAX_PENDING,
+    GENERATE_MAX_PENDING,
+    DOCUMENT_WORKERS,
+    DOCUMENT_MAX_PENDING
+)
+from app.core.metrics import STAGE_INFLIGHT, STAGE_REJECTIONS
+
+class StageSaturated(Exception):
+    """阶段正在执行和排队的任务数已达上限，retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, stage: str, retry_after: int):
+        self.stage = stage
+        self.retry_after = retry_after
+        super().__init__(f"服务繁忙（{stage} 阶段已满），请 {retry_after} 秒后重试")
+
+class Stage:
+    """
+    查询链路中的一个执行阶段：专用的有界线程池加准入控制
+
+    正在执行和排队的任务数达到 max_pending 时，新任务立即以 StageSaturated 拒绝，
+    而不是在线程池的无界队列中越排越久；各阶段的线程池互相独立，
+    检索变慢时不会占满编码或上传的线程。workers 为0时只做准入控制，
+    任务在调用方的协程中执行（用于本身就是异步I/O的LLM调用）。
+    """
+
+    # 耗时指数移动平均的平滑系数，用于估算 Retry-After
+    _EWMA_ALPHA = 0.2
+
+    def __init__(self, name: str, workers: int, max_pending: int):
+        self.name = name
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = (
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"stage-{name}")
+            if workers > 0 else None
+        )
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._avg_seconds: Optional[float] = None
+        self._inflight_gauge = STAGE_INFLIGHT.labels(name)
+        self._rejections = STAGE_REJECTIONS.labels(name)
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    def retry_after(self) -> int:
+        """建议的重试等待秒数：按平均耗时估算排在前面的任务完成所需的时间（1到60秒）"""
+        avg = self._avg_seconds or 0.0
+        # 只做准入控制的阶段中所有任务同时进行，最早的一个完成即有空位
+        waves = max(1, math.ceil(self._inflight / self.workers)) if self.workers > 0 else 1
+        return min(60, max(1, math.ceil(avg * waves)))
+
+    def acquire(self) -> float:
+        """
+        占用一个名额，返回开始时间（传给 release）
+
+        Raises:
+            StageSaturated: 名额已满
+        """
+        with self._lock:
+            if self._inflight >= self.max_pending:
+                self._rejections.inc()
+                raise StageSaturated(self.name, self.retry_after())
+            self._inflight += 1
+        self._inflight_gauge.inc()
+        return time.perf_counter()
+
+    def release(self, started: float) -> None:
+        """释放名额并记录本次耗时"""
+        seconds = time.perf_counter() - started
+        with self._lock:
+            self._inflight -= 1
+            if self._avg_seconds is None:
+                self._avg_seconds = seconds
+            else:
+                self._avg_seconds += self._EWMA_ALPHA * (seconds - self._avg_seconds)
+        self._inflight_gauge.dec()
+
+    @asynccontextmanager
+    async def admit(self):
+        """
+        在调用方的协程中执行一段代码前占用名额
+
+        用法：
+            async with GENERATE_STAGE.admit():
+                answer = await generator.generate_answer(...)
+        """
+        started = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(started)
+
+    async def run(self, fn: Callable, *args: Any) -> Any:
+        """
+        在本阶段的线程池中执行同步函数，不阻塞事件循环
+
+        调用方被取消（如客户端断开）时线程中的任务仍会执行完，名额在任务实际结束时才释放。
+
+        Raises:
+            StageSaturated: 名额已满
+        """
+        started = self.acquire()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self.release(started)
+            raise
+        future.add_done_callback(lambda _: self.release(started))
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+# 查询向量编码：单条查询由微批处理线程编码，此处只做准入；批量查询的整批编码在本阶段的线程中执行
+EMBED_STAGE = Stage("embed", EMBED_WORKERS, EMBED_MAX_PENDING)
+# 向量检索和BM25检索（numpy/BM25计算在线程中执行，释放事件循环）
+SEARCH_STAGE = Stage("search", SEARCH_WORKERS, SEARCH_MAX_PENDING)
+# 交互式LLM调用：httpx异步I/O，不占线程，只限制同时进行的调用数
+GENERATE_STAGE = Stage("generate", 0, GENERATE_MAX_PENDING)
+# 上传文件写盘和删除文档
+DOCUMENT_STAGE = Stage("document", DOCUMENT_WORKERS, DOCUMENT_MAX_PENDING)
+
+STAGES = (EMBED_STAGE, SEARCH_STAGE, GENERATE_STAGE, DOCUMENT_STAGE)
+
+def shutdown_stages() -> None:
+    """停止各阶段的线程池（应用关闭时调用）"""
+    for stage in STAGES:
+        stage.shutdown()
@@ -1,35 +1,183 @@
-import requests
+import asyncio
+import httpx
 import json
-from typing import List, Dict, Any
-from app.config import DEEPSEEK_API_KEY, DEEPSEEK_API_URL
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import List, Dict, Any, AsyncIterator, Awaitable, Callable, Optional
+from app.config import (
+    DEEPSEEK_API_URL,
+    DEEPSEEK_MODEL,
+    LLM_RETRY_STATUS_CODES,
+    LLM_HEDGE_QUANTILE,
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_HEDGE_MIN_DELAY
+)
+from app.core.runtime_settings import RuntimeSettings
+from app.core.llm_resilience import (
+    GenerationError,
+    UpstreamError,
+    DeadlineExceeded,
+    Deadline,
+    CircuitBreaker,
+    LatencyTracker,
+    backoff_delay
+)
+from app.core.metrics import (
+    LLM_REQUESTS,
+    LLM_ERRORS,
+    LLM_TOKENS,
+    LLM_FIRST_TOKEN_SECONDS,
+    LLM_RETRIES,
+    LLM_HEDGES
+)
+
+# 调用失败时错误信息的前缀
+ERROR_PREFIX = "调用DeepSeek API时出错"
+
+def _error_kind(e: Exception) -> str:
+    """把异常归类为有限的几种，用作指标标签"""
+    if isinstance(e, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(e, httpx.HTTPStatusError):
+        return f"http_{e.response.status_code}"
+    if isinstance(e, httpx.TransportError):
+        return "connection"
+    return "other"
+
+def _is_upstream_fault(e: Exception) -> tuple:
+    """
+    判断失败是否可重试、是否说明上游不健康
+
+    Returns:
+        (可重试, 计入熔断器的失败)；400/401等请求本身的错误既不重试也不计入熔断
+    """
+    if isinstance(e, httpx.HTTPStatusError):
+        retryable = e.response.status_code in LLM_RETRY_STATUS_CODES
+        return retryable, retryable
+    if isinstance(e, (httpx.TimeoutException, httpx.TransportError)):
+        return True, True
+    # 响应格式不对等其他错误：重试通常也无济于事
+    return False, True
+
+def _retry_after(e: Exception) -> Optional[float]:
+    """读取429/503响应的 Retry-After 头（秒数或HTTP日期），没有时返回None"""
+    if not isinstance(e, httpx.HTTPStatusError):
+        return None
+    value = e.response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _record_usage(usage: Optional[Dict[str, Any]]) -> None:
+    """累计接口返回的token用量"""
+    if not usage:
+        return
+    LLM_TOKENS.labels("prompt").inc(usage.get("prompt_tokens", 0))
+    LLM_TOKENS.labels("completion").inc(usage.get("completion_tokens", 0))
 
 class Generation:
-    def __init__(self, api_key: str = None):
-        self.api_key = api_key or DEEPSEEK_API_KEY
+    # 所有实例共享同一个异步HTTP客户端，复用连接池，避免每次调用都重新握手
+    _client: Optional[httpx.AsyncClient] = None
+    # 创建共享客户端时的连接池大小（运行时配置修改后重建客户端）
+    _client_limits: Optional[tuple] = None
+    # 连接池大小修改前的客户端：可能仍有进行中的请求，全部结束后关闭
+    _retired_clients: List[httpx.AsyncClient] = []
+    # 各客户端上进行中的请求数（流式请求直到响应关闭才结束）
+    _client_inflight: Dict[httpx.AsyncClient, int] = {}
+    # 进程内所有调用共享的熔断器，以及用于计算对冲延迟的近期耗时
+    breaker = CircuitBreaker()
+    _latency = LatencyTracker()
+
+    def __init__(self, api_key: str = None, api_url: str = None):
+        self.api_key = api_key or RuntimeSettings.get().deepseek_api_key
+        self.api_url = api_url or DEEPSEEK_API_URL
         if not self.api_key:
             raise ValueError("DeepSeek API密钥未配置，请先设置API密钥")
-    
-    def generate_answer(
-        self, 
-        question: str, 
-        context_chunks: List[Dict[str, Any]]
-    ) -> str:
+
+    @staticmethod
+    def _timeout(deadline: Optional[Deadline] = None) -> httpx.Timeout:
+        """按当前运行时配置构造每个请求的超时，不超过请求截止时间的剩余时间"""
+        settings = RuntimeSettings.get()
+        deadline = deadline or Deadline()
+        return httpx.Timeout(
+            deadline.cap(settings.llm_read_timeout),
+            connect=deadline.cap(settings.llm_connect_timeout)
+        )
+
+    @classmethod
+    def get_client(cls) -> httpx.AsyncClient:
+        """获取共享的异步HTTP客户端（首次调用或连接池大小被修改后创建）"""
+        settings = RuntimeSettings.get()
+        limits = (settings.llm_max_connections, settings.llm_max_keepalive_connections)
+        if cls._client is not None and not cls._client.is_closed and cls._client_limits != limits:
+            cls._retired_clients.append(cls._client)
+            cls._client = None
+        if cls._client is None or cls._client.is_closed:
+            cls._client = httpx.AsyncClient(
+                timeout=cls._timeout(),
+                limits=httpx.Limits(
+                    max_connections=limits[0],
+                    max_keepalive_connections=limits[1]
+                )
+            )
+            cls._client_limits = limits
+        return cls._client
+
+    @classmethod
+    @asynccontextmanager
+    async def _use_client(cls):
         """
-        调用DeepSeek API生成基于上下文的答案
-        
-        Args:
-            question: 用户问题
-            context_chunks: 检索到的相关上下文块
-            
-        Returns:
-            生成的答案
+        取得共享客户端并在使用期间计数，结束时关闭已被替换、且请求已全部结束的旧客户端
+
+        用法：
+            async with self._use_client() as client:
+                response = await client.post(...)
         """
+        client = cls.get_client()
+        cls._client_inflight[client] = cls._client_inflight.get(client, 0) + 1
+        try:
+            yield client
+        finally:
+            cls._client_inflight[client] -= 1
+            if not cls._client_inflight[client]:
+                del cls._client_inflight[client]
+            drained = [c for c in cls._retired_clients if c not in cls._client_inflight]
+            for retired in drained:
+                cls._retired_clients.remove(retired)
+            for retired in drained:
+                await retired.aclose()
+
+    @classmethod
+    async def aclose(cls) -> None:
+        """关闭共享的HTTP客户端（应用关闭时调用）"""
+        for client in [cls._client, *cls._retired_clients]:
+            if client is not None and not client.is_closed:
+                await client.aclose()
+        cls._client = None
+        cls._retired_clients = []
+        cls._client_inflight = {}
+
+    def _build_payload(
+        self,
+        question: str,
+        context_chunks: List[Dict[str, Any]],
+        stream: bool = False
+    ) -> Dict[str, Any]:
+        """构建DeepSeek（OpenAI兼容）聊天补全请求体"""
         # 构建上下文
         context = "\n\n".join([
-            f"文档片段 {i+1}：{chunk['document']}" 
+            f"文档片段 {i+1}：{chunk['document']}"
             for i, chunk in enumerate(context_chunks)
         ])
-        
+
         # 构建提示词
         prompt = f"""基于以下提供的上下文信息，回答用户的问题。
 如果上下文信息不足以回答问题，请明确说明无法回答，不要编造信息。
@@ -43,33 +191,244 @@ class Generation:
 
 回答：
 """
-        
-        # 调用DeepSeek API
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-        
-        data = {
-            "model": "deepseek-chat",
+
+        payload = {
+            "model": DEEPSEEK_MODEL,
             "messages": [
                 {"role": "system", "content": "你是一个帮助用户解答问题的助手，只根据提供的上下文回答问题。"},
                 {"role": "user", "content": prompt}
             ],
             "temperature": 0.7,
-            "max_tokens": 1024
+            "max_tokens": 1024,
+            "stream": stream
         }
-        
-        try:
-            response = requests.post(
-                DEEPSEEK_API_URL,
-                headers=headers,
-                data=json.dumps(data)
+        if stream:
+            # 让流式响应在最后一个片段中附带token用量
+            payload["stream_options"] = {"include_usage": True}
+        return payload
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+
+    async def _with_retries(
+        self,
+        mode: str,
+        deadline: Deadline,
+        attempt: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        执行一次LLM调用，可重试的失败按指数退避（带随机抖动）重试
+
+        每次尝试前先检查截止时间和熔断器；退避等待会超过截止时间时直接放弃。
+
+        Raises:
+            DeadlineExceeded: 截止时间已到
+            CircuitOpenError: 熔断器打开
+            UpstreamError: 不可重试的失败，或重试次数用完
+        """
+        max_retries = RuntimeSettings.get().llm_max_retries
+        retries = 0
+        while True:
+            if deadline.expired():
+                raise DeadlineExceeded(f"{ERROR_PREFIX}：生成答案超过请求时限")
+            self.breaker.before_call()
+            try:
+                result = await attempt()
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                kind = _error_kind(e)
+                LLM_ERRORS.labels(mode, kind).inc()
+                retryable, upstream_fault = _is_upstream_fault(e)
+                if upstream_fault:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.release()
+                if isinstance(e, httpx.TimeoutException) and deadline.expired():
+                    raise DeadlineExceeded(f"{ERROR_PREFIX}：生成答案超过请求时限") from e
+                if not retryable or retries >= max_retries:
+                    raise UpstreamError(f"{ERROR_PREFIX}：{str(e) or kind}") from e
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = backoff_delay(retries)
+                remaining = deadline.remaining()
+                if remaining is not None and delay >= remaining:
+                    raise DeadlineExceeded(f"{ERROR_PREFIX}：{str(e) or kind}（剩余时间不足以重试）") from e
+                LLM_RETRIES.labels(mode, kind).inc()
+                retries += 1
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def _hedge_delay(self) -> Optional[float]:
+        """对冲请求的发送延迟：近期成功调用耗时的分位数（样本不足时不对冲）"""
+        quantile = self._latency.quantile(LLM_HEDGE_QUANTILE, LLM_HEDGE_MIN_SAMPLES)
+        if quantile is None:
+            return None
+        return max(LLM_HEDGE_MIN_DELAY, quantile)
+
+    async def _post(self, payload: Dict[str, Any], deadline: Deadline) -> Dict[str, Any]:
+        async with self._use_client() as client:
+            response = await client.post(
+                self.api_url,
+                headers=self._headers(),
+                json=payload,
+                timeout=self._timeout(deadline)
             )
-            
-            response.raise_for_status()
-            result = response.json()
+        response.raise_for_status()
+        return response.json()
+
+    async def _hedged_post(self, payload: Dict[str, Any], deadline: Deadline) -> Dict[str, Any]:
+        """
+        发送一次非流式请求；启用对冲时，原请求超过对冲延迟仍未返回则再并发发送一次，
+        先成功返回的结果生效，另一个请求被取消。两个请求都失败时抛出原请求的异常。
+        """
+        started = time.monotonic()
+        tasks = [asyncio.ensure_future(self._post(payload, deadline))]
+        try:
+            hedge_delay = self._hedge_delay() if RuntimeSettings.get().llm_hedge_enabled else None
+            remaining = deadline.remaining()
+            if hedge_delay is not None and (remaining is None or hedge_delay < remaining):
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+                if not done:
+                    LLM_HEDGES.labels("sent").inc()
+                    tasks.append(asyncio.ensure_future(self._post(payload, deadline)))
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            LLM_HEDGES.labels("won").inc()
+                        self._latency.record(time.monotonic() - started)
+                        return task.result()
+            raise tasks[0].exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def generate_answer(
+        self,
+        question: str,
+        context_chunks: List[Dict[str, Any]],
+        deadline: Optional[Deadline] = None
+    ) -> str:
+        """
+        调用DeepSeek API生成基于上下文的答案
+
+        Args:
+            question: 用户问题
+            context_chunks: 检索到的相关上下文块
+            deadline: 请求的截止时间（由查询接口创建），None表示只受单次调用超时限制
+
+        Returns:
+            生成的答案
+
+        Raises:
+            GenerationError: 调用失败（UpstreamError / DeadlineExceeded / CircuitOpenError）
+        """
+        LLM_REQUESTS.labels("blocking").inc()
+        deadline = deadline or Deadline()
+        payload = self._build_payload(question, context_chunks)
+        result = await self._with_retries(
+            "blocking", deadline, lambda: self._hedged_post(payload, deadline)
+        )
+        try:
+            _record_usage(result.get("usage"))
             return result["choices"][0]["message"]["content"]
-        
-        except Exception as e:
-            return f"调用DeepSeek API时出错：{str(e)}"
+        except (AttributeError, KeyError, IndexError, TypeError) as e:
+            raise UpstreamError(f"{ERROR_PREFIX}：响应格式不正确") from e
+
+    async def _open_stream(self, client: httpx.AsyncClient, payload: Dict[str, Any], deadline: Deadline) -> httpx.Response:
+        request = client.build_request(
+            "POST",
+            self.api_url,
+            headers=self._headers(),
+            json=payload,
+            timeout=self._timeout(deadline)
+        )
+        response = await client.send(request, stream=True)
+        try:
+            response.raise_for_status()
+        except Exception:
+            await response.aclose()
+            raise
+        return response
+
+    async def stream_answer(
+        self,
+        question: str,
+        context_chunks: List[Dict[str, Any]],
+        deadline: Optional[Deadline] = None
+    ) -> AsyncIterator[str]:
+        """
+        以流式方式调用DeepSeek API，逐个产出生成的文本片段
+
+        只在收到响应之前重试（已输出的片段无法撤回），流式调用不发送对冲请求。
+
+        Args:
+            question: 用户问题
+            context_chunks: 检索到的相关上下文块
+            deadline: 请求的截止时间，超过后中断输出
+
+        Yields:
+            模型增量输出的文本片段
+
+        Raises:
+            GenerationError: 调用失败或输出中断
+        """
+        LLM_REQUESTS.labels("stream").inc()
+        deadline = deadline or Deadline()
+        payload = self._build_payload(question, context_chunks, stream=True)
+        started = time.perf_counter()
+        first_token = True
+        async with self._use_client() as client:
+            response = await self._with_retries(
+                "stream", deadline, lambda: self._open_stream(client, payload, deadline)
+            )
+            try:
+                # OpenAI兼容的SSE格式：每行 "data: {...}"，以 "data: [DONE]" 结束
+                lines = response.aiter_lines()
+                while True:
+                    # 等待下一行的时间不超过剩余时间：上游停止输出时也能按时中断；
+                    # 只限制等待上游，不包括调用方处理已产出片段的时间
+                    try:
+                        async with asyncio.timeout(deadline.remaining()):
+                            line = await anext(lines)
+                    except StopAsyncIteration:
+                        break
+                    except TimeoutError as e:
+                        raise DeadlineExceeded(f"{ERROR_PREFIX}：生成答案超过请求时限") from e
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    event = json.loads(data)
+                    # 附带用量的最后一个片段没有choices
+                    _record_usage(event.get("usage"))
+                    if not event.get("choices"):
+                        continue
+                    content = event["choices"][0].get("delta", {}).get("content")
+                    if content:
+                        if first_token:
+                            LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started)
+                            first_token = False
+                        yield content
+            except GenerationError:
+                raise
+            except Exception as e:
+                LLM_ERRORS.labels("stream", _error_kind(e)).inc()
+                if _is_upstream_fault(e)[1]:
+                    self.breaker.record_failure()
+                if isinstance(e, httpx.TimeoutException) and deadline.expired():
+                    raise DeadlineExceeded(f"{ERROR_PREFIX}：生成答案超过请求时限") from e
+                raise UpstreamError(f"{ERROR_PREFIX}：{str(e) or _error_kind(e)}") from e
+            finally:
+                await response.aclose()
@@ -0,0 +1,244 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import struct
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+import numpy as np
+from app.config import EMBEDDING_MODEL
+from app.core.vector_index import VectorIndex
+from app.core.document_catalog import DocumentCatalog
+
+# 归档格式
+FORMAT = "qa-index-archive"
+FORMAT_VERSION = 1
+DTYPES = ("float32", "float16")
+
+# 归档中的文件
+MANIFEST = "manifest.json"
+VECTORS = "vectors.npy"  # (块数, 维度) 的连续矩阵，第i行对应 chunks 中的第i个块
+CHUNKS = "chunks.jsonl.gz"  # 每行一批块的列式记录：{"ids": [...], "documents": [...], "metadatas": [...]}
+DOCUMENTS = "documents.json"  # 归档中每个文档的目录记录
+
+# 预留的 .npy 文件头长度：先写向量、最后按实际行数回填文件头，导出只需遍历索引一遍
+_NPY_HEADER_SIZE = 128
+
+class IndexArchiveError(ValueError):
+    """归档不完整、校验失败或与当前嵌入模型不匹配"""
+
+def _npy_header(dtype: np.dtype, shape: Tuple[int, int]) -> bytes:
+    """生成固定长度（_NPY_HEADER_SIZE 字节）的 .npy 1.0 版文件头"""
+    header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (dtype.str, shape)
+    header = header.ljust(_NPY_HEADER_SIZE - 10 - 1) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+def _file_digest(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def write_archive(
+    index: VectorIndex,
+    directory: Path,
+    dtype: str = "float32",
+    batch_size: int = 8192
+) -> Dict[str, Any]:
+    """
+    把向量索引和文档目录导出为归档目录
+
+    向量写成一个连续的 .npy 矩阵（可选float16，体积减半），块文本和元数据按批写成
+    gzip压缩的列式JSON行，另附文档目录记录和清单（嵌入模型、维度、块数、各文件的SHA-256）。
+    先写入临时目录，完整写完后再改名，目标目录中不会出现写了一半的归档。
+
+    Args:
+        index: 要导出的向量索引
+        directory: 归档目录（不能已存在）
+        dtype: 向量类型，float32 或 float16
+        batch_size: 每批读取的块数
+
+    Returns:
+        归档清单
+
+    Raises:
+        FileExistsError: 归档目录已存在
+        ValueError: 不支持的向量类型
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"不支持的向量类型：{dtype}")
+    directory = Path(directory)
+    if directory.exists():
+        raise FileExistsError(f"归档目录已存在：{directory}")
+    staging = directory.with_name(directory.name + ".tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+
+    np_dtype = np.dtype(dtype)
+    count = 0
+    dim = None
+    document_ids = set()
+    with open(staging / VECTORS, "wb") as vectors_file, gzip.open(staging / CHUNKS, "wt", encoding="utf-8") as chunks_file:
+        vectors_file.write(b"\0" * _NPY_HEADER_SIZE)
+        for ids, embeddings, documents, metadatas in index.iter_rows(batch_size):
+            if dim is None:
+                dim = int(embeddings.shape[1])
+            vectors_file.write(np.ascontiguousarray(embeddings, dtype=np_dtype).tobytes())
+            chunks_file.write(json.dumps(
+                {"ids": ids, "documents": documents, "metadatas": metadatas}, ensure_ascii=False
+            ) + "\n")
+            document_ids.update(metadata["document_id"] for metadata in metadatas)
+            count += len(ids)
+        vectors_file.seek(0)
+        vectors_file.write(_npy_header(np_dtype, (count, dim or 0)))
+
+    # 未登记到文档目录的文档只记录ID，导入时仍会先清除其已有的块
+    records = DocumentCatalog().get_many(sorted(document_ids))
+    (staging / DOCUMENTS).write_text(
+        json.dumps([records.get(d, {"id": d}) for d in sorted(document_ids)], ensure_ascii=False),
+        encoding="utf-8"
+    )
+
+    manifest = {
+        "format": FORMAT,
+        "version": FORMAT_VERSION,
+        "created_at": datetime.now().isoformat(),
+        "embedding_model": EMBEDDING_MODEL,
+        "dim": dim,
+        "dtype": dtype,
+        "chunks": count,
+        "documents": len(document_ids),
+        "files": {
+            name: {"sha256": _file_digest(staging / name), "bytes": (staging / name).stat().st_size}
+            for name in (VECTORS, CHUNKS, DOCUMENTS)
+        }
+    }
+    (staging / MANIFEST).write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.rename(staging, directory)
+    return manifest
+
+def read_manifest(directory: Path) -> Dict[str, Any]:
+    """
+    读取归档清单
+
+    Raises:
+        FileNotFoundError: 归档目录或清单不存在
+        IndexArchiveError: 不是本系统导出的归档，或格式版本不支持
+    """
+    manifest = json.loads((Path(directory) / MANIFEST).read_text(encoding="utf-8"))
+    if manifest.get("format") != FORMAT:
+        raise IndexArchiveError("不是索引归档（清单格式不符）")
+    if manifest.get("version") != FORMAT_VERSION:
+        raise IndexArchiveError(f"不支持的归档版本：{manifest.get('version')}")
+    return manifest
+
+def verify_archive(directory: Path, manifest: Dict[str, Any]) -> None:
+    """
+    校验归档文件的大小和SHA-256
+
+    Raises:
+        IndexArchiveError: 文件缺失或内容与清单不符
+    """
+    directory = Path(directory)
+    for name, expected in manifest["files"].items():
+        path = directory / name
+        if not path.exists():
+            raise IndexArchiveError(f"归档缺少文件：{name}")
+        if path.stat().st_size != expected["bytes"] or _file_digest(path) != expected["sha256"]:
+            raise IndexArchiveError(f"归档文件校验失败：{name}")
+
+def check_compatible(manifest: Dict[str, Any], embedding_model: str = EMBEDDING_MODEL) -> None:
+    """
+    检查归档的嵌入模型与当前配置一致（不一致时向量与查询向量不在同一空间）
+
+    Raises:
+        IndexArchiveError: 嵌入模型不一致
+    """
+    if manifest["embedding_model"] != embedding_model:
+        raise IndexArchiveError(
+            f"归档的嵌入模型（{manifest['embedding_model']}）与当前配置（{embedding_model}）不一致"
+        )
+
+def check_contents(directory: Path, manifest: Dict[str, Any], dim: Optional[int] = None) -> None:
+    """
+    导入前检查归档内容与清单一致、向量维度与当前索引一致（不读取向量数据，只解压一遍块记录）
+
+    在修改索引之前调用，检查不通过时索引保持原样。
+
+    Args:
+        directory: 归档目录
+        manifest: 归档清单
+        dim: 当前索引的向量维度（索引为空时为None，不检查）
+
+    Raises:
+        IndexArchiveError: 维度不一致、文件缺失或无法读取、向量数或块数与清单不符
+    """
+    directory = Path(directory)
+    if dim is not None and manifest["chunks"] and manifest["dim"] != dim:
+        raise IndexArchiveError(f"归档的向量维度（{manifest['dim']}）与当前索引（{dim}）不一致")
+
+    try:
+        vectors = np.load(directory / VECTORS, mmap_mode="r")
+        shape, dtype = vectors.shape, vectors.dtype
+        del vectors
+        chunk_count = 0
+        with gzip.open(directory / CHUNKS, "rt", encoding="utf-8") as f:
+            for line in f:
+                batch = json.loads(line)
+                if not len(batch["ids"]) == len(batch["documents"]) == len(batch["metadatas"]):
+                    raise IndexArchiveError("归档中的块记录不完整")
+                chunk_count += len(batch["ids"])
+    except IndexArchiveError:
+        raise
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        raise IndexArchiveError(f"归档文件无法读取：{e}") from e
+
+    expected_shape = (manifest["chunks"], manifest["dim"] or 0)
+    if shape != expected_shape or dtype != np.dtype(manifest["dtype"]):
+        raise IndexArchiveError(
+            f"归档中的向量矩阵（{shape}，{dtype}）与清单（{expected_shape}，{manifest['dtype']}）不符"
+        )
+    if chunk_count != manifest["chunks"]:
+        raise IndexArchiveError(f"归档中的块数（{chunk_count}）与清单（{manifest['chunks']}）不符")
+
+def read_documents(directory: Path) -> List[Dict[str, Any]]:
+    """读取归档中的文档目录记录"""
+    return json.loads((Path(directory) / DOCUMENTS).read_text(encoding="utf-8"))
+
+def iter_archive(directory: Path) -> Iterator[Tuple[List[str], np.ndarray, List[str], List[Dict[str, Any]]]]:
+    """
+    按导出时的批次产出归档中的块：(块ID列表, float32向量矩阵, 文本列表, 元数据列表)
+
+    向量矩阵以内存映射方式读取，每次只把当前批次转换为float32。
+    """
+    directory = Path(directory)
+    vectors = np.load(directory / VECTORS, mmap_mode="r")
+    start = 0
+    with gzip.open(directory / CHUNKS, "rt", encoding="utf-8") as f:
+        for line in f:
+            batch = json.loads(line)
+            end = start + len(batch["ids"])
+            if end > len(vectors):
+                raise IndexArchiveError("归档中的块数多于向量数")
+            yield batch["ids"], np.asarray(vectors[start:end], dtype=np.float32), batch["documents"], batch["metadatas"]
+            start = end
+    if start != len(vectors):
+        raise IndexArchiveError("归档中的向量数多于块数")
+
+def list_archives(root: Path) -> List[Dict[str, Any]]:
+    """列出目录下的所有归档（按名称排序），每项为清单加上归档名 name"""
+    root = Path(root)
+    if not root.exists():
+        return []
+    archives = []
+    for path in sorted(root.iterdir()):
+        if not path.is_dir() or path.name.endswith(".tmp"):
+            continue
+        try:
+            archives.append({"name": path.name, **read_manifest(path)})
+        except (FileNotFoundError, ValueError):
+            continue
+    return archives
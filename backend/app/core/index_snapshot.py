@@ -0,0 +1,130 @@
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+from app.config import SNAPSHOT_KEEP
+from app.core.vector_index import VectorIndex, NumpyVectorIndex
+
+# 指向当前快照版本的文件名
+_CURRENT = "CURRENT"
+
+def _version_dir(root: Path, version: int) -> Path:
+    return root / f"v{version:08d}"
+
+def current_version(root: Path) -> Optional[int]:
+    """读取当前发布的快照版本，尚未发布时返回None"""
+    try:
+        return int((Path(root) / _CURRENT).read_text().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+def publish_snapshot(index: NumpyVectorIndex, root: Path, keep: int = SNAPSHOT_KEEP) -> int:
+    """
+    把索引导出为新版本的只读快照并原子切换 CURRENT
+
+    快照先写入临时目录，完整写完后改名为 v{版本号}，最后用 os.replace 更新 CURRENT，
+    读进程要么看到旧版本，要么看到完整的新版本。
+
+    Args:
+        index: 写进程持有的可写索引
+        root: 快照根目录
+        keep: 保留的历史版本数（读进程仍映射着的旧文件在其关闭前依然可读）
+
+    Returns:
+        新发布的版本号
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    versions = _list_versions(root)
+    version = (versions[-1] if versions else 0) + 1
+
+    staging = root / f"v{version:08d}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    index.export_compacted(staging)
+    os.rename(staging, _version_dir(root, version))
+
+    pointer = root / f"{_CURRENT}.tmp"
+    pointer.write_text(str(version))
+    os.replace(pointer, root / _CURRENT)
+
+    for old in _list_versions(root)[:-max(1, keep)]:
+        shutil.rmtree(_version_dir(root, old), ignore_errors=True)
+    return version
+
+def _list_versions(root: Path) -> List[int]:
+    versions = []
+    for path in root.glob("v*"):
+        if path.is_dir() and not path.name.endswith(".tmp"):
+            try:
+                versions.append(int(path.name[1:]))
+            except ValueError:
+                continue
+    return sorted(versions)
+
+class SnapshotVectorIndex(VectorIndex):
+    """
+    只读的快照索引（多进程部署中的查询进程使用）
+
+    以只读方式映射写进程发布的最新快照；refresh() 发现新版本时在后台打开，
+    打开完成后一次性替换引用，正在进行的检索继续使用旧版本直到结束。
+    """
+
+    def __init__(self, root: Path):
+        self._root = Path(root)
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._index: Optional[NumpyVectorIndex] = None
+        self.refresh()
+
+    @property
+    def version(self) -> Optional[int]:
+        return self._version
+
+    def refresh(self) -> bool:
+        """切换到最新发布的快照，有切换时返回True"""
+        with self._lock:
+            version = current_version(self._root)
+            if version is None or version == self._version:
+                return False
+            index = NumpyVectorIndex(_version_dir(self._root, version), read_only=True)
+            self._index, self._version = index, version
+            return True
+
+    def add(self, ids, embeddings, documents, metadatas) -> None:
+        raise RuntimeError("查询进程的索引是只读的，写入需由写进程完成")
+
+    def delete(self, ids=None, document_id=None) -> None:
+        raise RuntimeError("查询进程的索引是只读的，写入需由写进程完成")
+
+    def update_metadata(self, ids, metadatas) -> None:
+        raise RuntimeError("查询进程的索引是只读的，写入需由写进程完成")
+
+    def search(self, query_embeddings, n_results, document_ids=None) -> List[List[Dict[str, Any]]]:
+        index = self._index
+        if index is None:
+            return [[] for _ in query_embeddings]
+        return index.search(query_embeddings, n_results, document_ids)
+
+    def get(self, document_id=None) -> Dict[str, List]:
+        index = self._index
+        if index is None:
+            return {"ids": [], "documents": [], "metadatas": []}
+        return index.get(document_id)
+
+    def list_ids(self, document_id=None) -> List[str]:
+        index = self._index
+        return index.list_ids(document_id) if index is not None else []
+
+    def iter_rows(self, batch_size=8192):
+        index = self._index
+        if index is not None:
+            yield from index.iter_rows(batch_size)
+
+    def count(self) -> int:
+        index = self._index
+        return index.count() if index is not None else 0
+
+    def dimension(self) -> Optional[int]:
+        index = self._index
+        return index.dimension() if index is not None else None
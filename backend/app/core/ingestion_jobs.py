@@ -0,0 +1,485 @@
+import math
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, Optional
+from app.config import INGESTION_JOBS_DB, SERVER_ROLE, SNAPSHOT_POLL_INTERVAL
+from app.core.data_collection import DataCollection
+from app.core.document_catalog import DocumentCatalog
+from app.core.data_preprocessing import DataPreprocessing
+from app.core.embedding import Embedding
+from app.core.vector_store import VectorStore
+from app.core.runtime_settings import RuntimeSettings
+from app.core.metrics import (
+    INGESTION_JOBS,
+    INGESTION_PAGES,
+    INGESTION_CHUNKS,
+    CHUNKS_PER_DOCUMENT,
+    stage_timer,
+    observe_stage
+)
+
+class IngestionQueueFull(Exception):
+    """排队中的入库任务已达上限，retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, message: str, retry_after: int):
+        self.retry_after = retry_after
+        super().__init__(message)
+
+class DuplicateDocument(Exception):
+    """内容与已入库或正在入库的文档相同；job_id 为该文档进行中的入库任务（已入库时为None）"""
+
+    def __init__(self, document_id: str, job_id: Optional[str] = None):
+        self.document_id = document_id
+        self.job_id = job_id
+        super().__init__(f"相同内容的文档已存在：{document_id}")
+
+class IngestionJobs:
+    """
+    文档入库任务队列
+
+    上传接口只保存文件并创建任务，PDF解析、分块、编码和写入向量库在
+    有界的后台线程池中完成。任务状态持久化在SQLite中，进程重启后
+    未完成的任务会重新排队。
+
+    多进程部署时任务表是查询进程与写进程之间的队列：查询进程（reader）只写入
+    排队的任务，写进程（writer）轮询任务表并执行，结果通过索引快照发布。
+
+    线程池大小（ingestion_workers）为运行时配置，修改后换用新的线程池，
+    旧线程池中尚未开始的任务转到新线程池；分块和编码参数在每个任务开始时读取。
+    """
+    _instance = None
+    _conn = None
+    # 后台预热和第一个上传请求可能同时创建实例
+    _init_lock = threading.Lock()
+
+    # 任务状态
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+    # 任务类型
+    INGEST = "ingest"
+    DELETE = "delete"
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._init_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if self._conn is not None:
+            return
+        with self._init_lock:
+            if self._conn is not None:
+                return
+            self._lock = threading.Lock()
+            conn = sqlite3.connect(str(INGESTION_JOBS_DB), check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL DEFAULT 'ingest',
+                    document_id TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    content_hash TEXT,
+                    status TEXT NOT NULL,
+                    pages_total INTEGER NOT NULL DEFAULT 0,
+                    pages_parsed INTEGER NOT NULL DEFAULT 0,
+                    chunks_total INTEGER NOT NULL DEFAULT 0,
+                    chunks_embedded INTEGER NOT NULL DEFAULT 0,
+                    chunks_stored INTEGER NOT NULL DEFAULT 0,
+                    chunks_reused INTEGER NOT NULL DEFAULT 0,
+                    chunks_deleted INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+                """
+            )
+            # 旧版本创建的任务表缺少的列
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column in ("chunks_reused", "chunks_deleted"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+            if "kind" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN kind TEXT NOT NULL DEFAULT 'ingest'")
+            if "content_hash" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN content_hash TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_content_hash ON jobs (content_hash)")
+            conn.commit()
+            self._executor = ThreadPoolExecutor(
+                max_workers=RuntimeSettings.get().ingestion_workers,
+                thread_name_prefix="ingestion"
+            )
+            # 已提交到线程池的任务（写进程轮询时避免重复提交）
+            self._scheduled = set()
+            # 已提交但尚未结束的任务 -> Future（调整线程池大小时转移未开始的任务）
+            self._futures: Dict[str, Future] = {}
+            self._stop_polling = threading.Event()
+            self._poller = None
+            RuntimeSettings().subscribe(self._on_settings_changed)
+            # 最后才发布连接：其他线程看到连接时，任务表和实例的其余属性都已就绪
+            self._conn = conn
+
+    def _on_settings_changed(self, previous, current) -> None:
+        if current.ingestion_workers != previous.ingestion_workers:
+            self.resize(current.ingestion_workers)
+
+    def resize(self, workers: int) -> None:
+        """换用 workers 个线程的线程池；正在执行的任务在旧线程池中完成，未开始的任务转到新线程池"""
+        with self._lock:
+            previous = self._executor
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingestion")
+            previous.shutdown(wait=False, cancel_futures=True)
+            moved = [job_id for job_id, future in list(self._futures.items()) if future.cancelled()]
+            for job_id in moved:
+                self._submit(job_id)
+
+    def _submit(self, job_id: str) -> None:
+        """提交任务到当前线程池（调用方需持有锁）"""
+        future = self._executor.submit(self._run, job_id)
+        self._futures[job_id] = future
+        future.add_done_callback(lambda done: self._forget(job_id, done))
+
+    def _forget(self, job_id: str, future: Future) -> None:
+        # 被取消的任务由 resize 转移到新线程池，保留记录；
+        # 任务在提交时可能已经结束，回调会在持有锁的线程中直接执行，因此这里不加锁
+        if not future.cancelled() and self._futures.get(job_id) is future:
+            self._futures.pop(job_id, None)
+            # 已结束的任务状态不再是排队中，不会被重新轮询到，无需继续记录
+            self._scheduled.discard(job_id)
+
+    def _update(self, job_id: str, **fields) -> None:
+        fields["updated_at"] = datetime.now().isoformat()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ?",
+                [*fields.values(), job_id]
+            )
+            self._conn.commit()
+
+    def _count_pending(self) -> int:
+        """排队中和正在执行的任务数（调用方需持有锁）"""
+        row = self._conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)",
+            (self.QUEUED, self.RUNNING)
+        ).fetchone()
+        return row[0]
+
+    def _retry_after(self) -> int:
+        """按最近完成的任务的平均耗时（自创建到完成）估算排队任务让出名额的时间（1到300秒，调用方需持有锁）"""
+        row = self._conn.execute(
+            "SELECT AVG((julianday(updated_at) - julianday(created_at)) * 86400) FROM ("
+            "SELECT created_at, updated_at FROM jobs WHERE kind = ? AND status = ? "
+            "ORDER BY updated_at DESC LIMIT 20)",
+            (self.INGEST, self.COMPLETED)
+        ).fetchone()
+        avg = row[0] or 0.0
+        return min(300, max(1, math.ceil(avg / RuntimeSettings.get().ingestion_workers)))
+
+    def _schedule(self, job_id: str) -> None:
+        """把任务提交到后台线程池；查询进程不执行任务，由写进程轮询任务表后执行"""
+        if SERVER_ROLE == "reader":
+            return
+        with self._lock:
+            if job_id in self._scheduled:
+                return
+            self._scheduled.add(job_id)
+            self._submit(job_id)
+
+    def _insert_locked(self, kind: str, document_id: str, filename: str, content_hash: Optional[str] = None) -> str:
+        """写入一条排队中的任务（调用方需持有锁）"""
+        job_id = str(uuid.uuid4())
+        now = datetime.now().isoformat()
+        self._conn.execute(
+            "INSERT INTO jobs (id, kind, document_id, filename, content_hash, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, document_id, filename, content_hash, self.QUEUED, now, now)
+        )
+        self._conn.commit()
+        return job_id
+
+    def _insert(self, kind: str, document_id: str, filename: str) -> str:
+        with self._lock:
+            return self._insert_locked(kind, document_id, filename)
+
+    def submit(self, document_id: str, filename: str, content_hash: Optional[str] = None) -> Dict[str, Any]:
+        """
+        创建入库任务并提交到后台线程池
+
+        传入 content_hash 时先查重：与排队中或正在执行的任务、或已入库的文档内容相同时不创建任务。
+        查重和写入任务在同一把锁内完成，同时上传的相同文件只会入库一次；入库任务先写文档目录
+        再标记完成，因此任务表中查不到进行中的任务时，文档目录中一定已有该文档。
+
+        Args:
+            document_id: 已保存文件的文档ID
+            filename: 原始文件名
+            content_hash: 文件内容的SHA-256（用于查重，同时供入库任务直接使用）
+
+        Returns:
+            新建的任务信息
+
+        Raises:
+            DuplicateDocument: 内容与已入库或正在入库的文档相同
+            IngestionQueueFull: 排队任务数已达上限
+        """
+        with self._lock:
+            if content_hash is not None:
+                row = self._conn.execute(
+                    "SELECT id, document_id FROM jobs WHERE content_hash = ? AND kind = ? AND status IN (?, ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (content_hash, self.INGEST, self.QUEUED, self.RUNNING)
+                ).fetchone()
+                if row is not None and row["document_id"] != document_id:
+                    raise DuplicateDocument(row["document_id"], row["id"])
+                existing = DocumentCatalog().find_by_hash(content_hash)
+                if existing is not None and existing["id"] != document_id:
+                    raise DuplicateDocument(existing["id"])
+
+            if self._count_pending() >= RuntimeSettings.get().ingestion_max_pending:
+                retry_after = self._retry_after()
+                raise IngestionQueueFull(f"入库任务排队已满，请 {retry_after} 秒后重试", retry_after)
+            job_id = self._insert_locked(self.INGEST, document_id, filename, content_hash)
+
+        self._schedule(job_id)
+        return self.get(job_id)
+
+    def delete_document(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """
+        从向量库中删除文档的所有块
+
+        单进程和写进程中直接删除并返回None；查询进程不能写入向量库，
+        改为创建删除任务交给写进程执行，返回该任务信息。
+        """
+        if SERVER_ROLE != "reader":
+            VectorStore().delete_document(document_id)
+            return None
+        job_id = self._insert(self.DELETE, document_id, "")
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """获取任务状态与进度，任务不存在时返回None"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def resume(self) -> int:
+        """重新排队上次进程退出时未完成的任务（应用启动时调用），返回任务数"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                (self.QUEUED, self.RUNNING)
+            ).fetchall()
+        for row in rows:
+            self._update(row["id"], status=self.QUEUED)
+            self._schedule(row["id"])
+        return len(rows)
+
+    def ingest_unregistered(self) -> int:
+        """
+        为文档目录中尚未登记、也从未创建过入库任务的文件创建入库任务（应用启动时调用）
+
+        文件只在入库任务完成后才登记到文档目录；进程在保存文件之后、创建任务之前退出时
+        留下的文件在这里补做入库。已有任务的文件不再补做：排队中的任务由 resume 继续，
+        失败的任务（如文件已损坏）不在每次启动时重复失败，可通过接口查看失败原因。
+        启动时补做的任务不受排队上限限制。
+
+        Returns:
+            新建的任务数
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT document_id FROM jobs WHERE kind = ?",
+                (self.INGEST,)
+            ).fetchall()
+        known = {row[0] for row in rows}
+        added = 0
+        for document_id, filename in DataCollection.list_unregistered_files().items():
+            if document_id in known:
+                continue
+            self._schedule(self._insert(self.INGEST, document_id, filename))
+            added += 1
+        return added
+
+    def start_polling(self) -> None:
+        """写进程启动后台线程，定期执行查询进程写入任务表的排队任务"""
+        if self._poller is not None:
+            return
+        self._poller = threading.Thread(target=self._poll_loop, name="ingestion-poller", daemon=True)
+        self._poller.start()
+
+    def _poll_loop(self) -> None:
+        while not self._stop_polling.wait(SNAPSHOT_POLL_INTERVAL):
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? ORDER BY created_at",
+                    (self.QUEUED,)
+                ).fetchall()
+            for row in rows:
+                self._schedule(row["id"])
+            # 任务结束时距上次发布不足最小间隔而未发布的写入，由轮询补发
+            self._publish()
+
+    def _publish(self) -> None:
+        """写进程按最小间隔发布新的索引快照（单进程部署中不做任何事）"""
+        try:
+            VectorStore().publish_if_due()
+        except Exception as e:
+            print(f"❌ 发布索引快照失败：{e}")
+
+    def shutdown(self) -> None:
+        """停止后台线程池（排队中的任务保留在数据库中，下次启动时继续）"""
+        self._stop_polling.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job_id: str) -> None:
+        """执行一个入库任务：流式解析PDF → 分块 → 分批编码新增块并逐批写入向量库 → 删除已不存在的块"""
+        job = self.get(job_id)
+        if job is None or job["status"] not in (self.QUEUED, self.RUNNING):
+            return
+        document_id = job["document_id"]
+        if job["kind"] == self.DELETE:
+            self._run_delete(job_id, document_id)
+            return
+        self._update(
+            job_id, status=self.RUNNING, error=None,
+            pages_parsed=0, chunks_embedded=0, chunks_stored=0,
+            chunks_reused=0, chunks_deleted=0
+        )
+
+        job_started = time.perf_counter()
+        # 整个任务使用同一份配置
+        settings = RuntimeSettings.get()
+        try:
+            page_count = DataCollection.get_page_count(document_id)
+            self._update(job_id, pages_total=page_count)
+
+            def tracked_pages():
+                # 边解析边汇报已解析页数；只统计等待解析结果的时间
+                pages = DataCollection.iter_pdf_pages(document_id)
+                parse_seconds = 0.0
+                page_num = 0
+                while True:
+                    started = time.perf_counter()
+                    page_text = next(pages, None)
+                    parse_seconds += time.perf_counter() - started
+                    if page_text is None:
+                        break
+                    page_num += 1
+                    yield page_text
+                    if page_num % 10 == 0:
+                        self._update(job_id, pages_parsed=page_num)
+                observe_stage("ingestion", "parse", parse_seconds)
+                INGESTION_PAGES.inc(page_num)
+
+            # 流式处理：前面的页分块、编码时，后面的页仍在并行解析；
+            # 块ID由内容哈希生成，已在向量库中的块不再重新编码。
+            # 每凑满一批新增块就编码并写入向量库，文本和向量只在当前批次中保留，
+            # 整篇文档只保留块ID（用于最后删除已不存在的块）
+            vector_store = VectorStore()
+            existing_pages = vector_store.get_chunk_pages(document_id)
+            embedding = Embedding()
+            seen_ids = set()
+            added = []
+            updated = []
+            counts = {"embedded": 0, "store_seconds": 0.0}
+            batch_size = settings.ingestion_embed_batch_size
+
+            def write_pending():
+                embeddings = []
+                if added:
+                    with stage_timer("ingestion", "embed"):
+                        embeddings = embedding.embed_texts([chunk[0] for _, chunk in added])
+                started = time.perf_counter()
+                vector_store.write_chunk_batch(document_id, added, embeddings, updated)
+                counts["store_seconds"] += time.perf_counter() - started
+                counts["embedded"] += len(added)
+                added.clear()
+                updated.clear()
+                self._update(
+                    job_id, chunks_total=len(seen_ids),
+                    chunks_embedded=counts["embedded"], chunks_stored=len(seen_ids)
+                )
+
+            if settings.chunking_mode == "tokens":
+                chunk_stream = DataPreprocessing.iter_token_chunks(
+                    tracked_pages(),
+                    embedding.count_tokens,
+                    max_tokens=min(settings.chunk_max_tokens or embedding.max_tokens, embedding.max_tokens),
+                    overlap_tokens=settings.chunk_overlap_tokens
+                )
+            else:
+                chunk_stream = DataPreprocessing.iter_chunks(
+                    tracked_pages(),
+                    chunk_size=settings.chunk_size,
+                    chunk_overlap=settings.chunk_overlap
+                )
+            for chunk_id, chunk in VectorStore.iter_chunk_ids(document_id, chunk_stream):
+                seen_ids.add(chunk_id)
+                if chunk_id not in existing_pages:
+                    added.append((chunk_id, chunk))
+                elif existing_pages[chunk_id] != chunk[1]:
+                    updated.append((chunk_id, chunk))
+                if max(len(added), len(updated)) >= batch_size:
+                    write_pending()
+            if added or updated:
+                write_pending()
+
+            # 全部写入后再删除已不存在的块：任务中途失败时文档保留旧块，重新入库时按差异补齐
+            removed = [chunk_id for chunk_id in existing_pages if chunk_id not in seen_ids]
+            started = time.perf_counter()
+            vector_store.remove_chunks(document_id, removed)
+            observe_stage("ingestion", "store", counts["store_seconds"] + time.perf_counter() - started)
+
+            chunk_count = len(seen_ids)
+            INGESTION_CHUNKS.labels("embedded").inc(counts["embedded"])
+            INGESTION_CHUNKS.labels("reused").inc(chunk_count - counts["embedded"])
+            INGESTION_CHUNKS.labels("deleted").inc(len(removed))
+            CHUNKS_PER_DOCUMENT.observe(chunk_count)
+            self._update(
+                job_id, pages_parsed=page_count,
+                chunks_total=chunk_count,
+                chunks_embedded=counts["embedded"],
+                chunks_stored=chunk_count,
+                chunks_reused=chunk_count - counts["embedded"],
+                chunks_deleted=len(removed)
+            )
+
+            # 写入文档目录，之后的列表和引用解析都直接查目录
+            DataCollection.register_document(
+                document_id,
+                filename=job["filename"],
+                page_count=page_count,
+                chunk_count=chunk_count,
+                content_hash=job["content_hash"],
+                created_at=datetime.fromisoformat(job["created_at"])
+            )
+            self._update(job_id, status=self.COMPLETED)
+            INGESTION_JOBS.labels(self.COMPLETED).inc()
+        except Exception as e:
+            self._update(job_id, status=self.FAILED, error=str(e))
+            INGESTION_JOBS.labels(self.FAILED).inc()
+        finally:
+            observe_stage("ingestion", "total", time.perf_counter() - job_started)
+        self._publish()
+
+    def _run_delete(self, job_id: str, document_id: str) -> None:
+        """执行查询进程提交的删除任务"""
+        self._update(job_id, status=self.RUNNING, error=None)
+        try:
+            VectorStore().delete_document(document_id)
+            self._update(job_id, status=self.COMPLETED)
+        except Exception as e:
+            self._update(job_id, status=self.FAILED, error=str(e))
+        self._publish()
@@ -0,0 +1,206 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple
+
+# 英文/数字词（保留型号、错误码中的连接符，如 "ab-1234"、"v2.1"）
+_WORD_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+# 连续的中日韩文字
+_CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+")
+_TOKEN_PATTERN = re.compile(f"{_WORD_PATTERN.pattern}|{_CJK_PATTERN.pattern}")
+_SEPARATOR_PATTERN = re.compile(r"[-_./]")
+
+def tokenize(text: str) -> List[str]:
+    """
+    中日韩文字感知的分词
+
+    - 英文/数字词整体作为一个词，带连接符的词额外拆出各部分
+    - 中日韩文字按单字 + 相邻双字切分（无需词典即可匹配任意词语）
+    """
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        if _CJK_PATTERN.fullmatch(token):
+            tokens.extend(token)
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            tokens.append(token)
+            if _SEPARATOR_PATTERN.search(token):
+                tokens.extend(part for part in _SEPARATOR_PATTERN.split(token) if part)
+    return tokens
+
+class LexicalIndex:
+    """
+    增量维护的BM25倒排索引
+
+    与向量库中的文本块一一对应，随 VectorStore 的写入和删除同步更新。
+    """
+    _instance = None
+    _postings = None
+
+    # BM25参数
+    K1 = 1.5
+    B = 0.75
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if self._postings is None:
+            self._lock = threading.RLock()
+            # 词 -> {块ID: 词频}
+            self._postings: Dict[str, Dict[str, int]] = {}
+            # 块ID -> 块信息（文本、元数据、长度、词频）
+            self._chunks: Dict[str, Dict[str, Any]] = {}
+            # 文档ID -> 块ID集合
+            self._document_chunks: Dict[str, set] = {}
+            self._total_length = 0
+
+    def add(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]]
+    ) -> None:
+        """将文本块加入索引（已存在的块ID会先被移除）"""
+        with self._lock:
+            for chunk_id, text, metadata in zip(ids, documents, metadatas):
+                self._remove_chunk(chunk_id)
+                term_freqs = Counter(tokenize(text))
+                length = sum(term_freqs.values())
+                self._chunks[chunk_id] = {
+                    "document": text,
+                    "metadata": metadata,
+                    "length": length,
+                    "term_freqs": term_freqs
+                }
+                for term, freq in term_freqs.items():
+                    self._postings.setdefault(term, {})[chunk_id] = freq
+                self._document_chunks.setdefault(metadata["document_id"], set()).add(chunk_id)
+                self._total_length += length
+
+    def _remove_chunk(self, chunk_id: str) -> None:
+        chunk = self._chunks.pop(chunk_id, None)
+        if chunk is None:
+            return
+        for term in chunk["term_freqs"]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
+        document_id = chunk["metadata"]["document_id"]
+        chunk_ids = self._document_chunks.get(document_id)
+        if chunk_ids is not None:
+            chunk_ids.discard(chunk_id)
+            if not chunk_ids:
+                del self._document_chunks[document_id]
+        self._total_length -= chunk["length"]
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """原地更新块的元数据（文本未变，倒排表无需重建）"""
+        with self._lock:
+            for chunk_id, metadata in zip(ids, metadatas):
+                chunk = self._chunks.get(chunk_id)
+                if chunk is not None:
+                    chunk["metadata"] = metadata
+
+    def delete_chunk(self, chunk_id: str) -> None:
+        """从索引中移除单个块"""
+        with self._lock:
+            self._remove_chunk(chunk_id)
+
+    def delete_document(self, document_id: str) -> None:
+        """从索引中移除指定文档的所有块"""
+        with self._lock:
+            for chunk_id in list(self._document_chunks.get(document_id, ())):
+                self._remove_chunk(chunk_id)
+
+    def rebuild(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]]
+    ) -> None:
+        """
+        用给定的块整体重建索引（查询进程切换到新快照时调用）
+
+        新的倒排表在锁外构建，构建完成后一次性替换，重建期间的检索继续使用旧索引。
+        """
+        # 绕过单例的 __new__，构建一个独立的临时索引
+        fresh = object.__new__(LexicalIndex)
+        fresh._lock = threading.RLock()
+        fresh._postings = {}
+        fresh._chunks = {}
+        fresh._document_chunks = {}
+        fresh._total_length = 0
+        fresh.add(ids, documents, metadatas)
+        with self._lock:
+            self._postings = fresh._postings
+            self._chunks = fresh._chunks
+            self._document_chunks = fresh._document_chunks
+            self._total_length = fresh._total_length
+
+    def clear(self) -> None:
+        with self._lock:
+            self._postings.clear()
+            self._chunks.clear()
+            self._document_chunks.clear()
+            self._total_length = 0
+
+    def search(
+        self,
+        query: str,
+        n_results: int,
+        document_ids: Optional[List[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        BM25检索
+
+        Args:
+            query: 查询文本
+            n_results: 返回结果数量
+            document_ids: 可选，只在这些文档的块中检索
+
+        Returns:
+            [(块ID, BM25得分)]，按得分降序
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            total = len(self._chunks)
+            if not terms or total == 0:
+                return []
+            avg_length = self._total_length / total
+
+            allowed = None
+            if document_ids:
+                allowed = set()
+                for document_id in document_ids:
+                    allowed |= self._document_chunks.get(document_id, set())
+
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, freq in postings.items():
+                    if allowed is not None and chunk_id not in allowed:
+                        continue
+                    length = self._chunks[chunk_id]["length"]
+                    norm = self.K1 * (1 - self.B + self.B * length / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * freq * (self.K1 + 1) / (freq + norm)
+
+        return heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+
+    def get_chunk(self, chunk_id: str) -> Optional[Dict[str, Any]]:
+        """获取块的文本和元数据"""
+        with self._lock:
+            chunk = self._chunks.get(chunk_id)
+            if chunk is None:
+                return None
+            return {"id": chunk_id, "document": chunk["document"], "metadata": chunk["metadata"]}
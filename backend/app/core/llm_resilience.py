@@ -0,0 +1,152 @@
+import random
+import threading
+import time
+from collections import deque
+from typing import Optional
+from app.config import (
+    LLM_RETRY_BASE_DELAY,
+    LLM_RETRY_MAX_DELAY,
+    LLM_BREAKER_FAILURE_THRESHOLD,
+    LLM_BREAKER_RESET_TIMEOUT
+)
+from app.core.metrics import LLM_CIRCUIT_TRANSITIONS
+
+class GenerationError(Exception):
+    """LLM调用失败，status_code 为查询接口应返回的HTTP状态码"""
+    status_code = 502
+
+class UpstreamError(GenerationError):
+    """DeepSeek接口返回错误或连接失败（重试后仍未成功）"""
+    status_code = 502
+
+class DeadlineExceeded(GenerationError):
+    """请求的截止时间已到，放弃等待或重试"""
+    status_code = 504
+
+class CircuitOpenError(GenerationError):
+    """熔断器打开：上游近期连续失败，直接拒绝调用"""
+    status_code = 503
+
+class Deadline:
+    """
+    请求的截止时间（单调时钟）
+
+    在HTTP处理函数入口创建，传入生成等下游调用，每次尝试的超时和重试前的
+    退避都不超过剩余时间。timeout 为None表示不限时。
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.expires_at = time.monotonic() + timeout if timeout else None
+
+    def remaining(self) -> Optional[float]:
+        """剩余秒数（不限时返回None，已过期返回0）"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def cap(self, seconds: float) -> float:
+        """把一个超时时长限制在剩余时间以内"""
+        remaining = self.remaining()
+        return seconds if remaining is None else min(seconds, remaining)
+
+def backoff_delay(attempt: int, base: float = LLM_RETRY_BASE_DELAY, max_delay: float = LLM_RETRY_MAX_DELAY) -> float:
+    """第 attempt 次重试（从0开始）前的等待时间：指数退避加完全随机抖动，避免大量请求同时重试"""
+    return random.uniform(0, min(max_delay, base * (2 ** attempt)))
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    - closed：正常放行，连续失败 failure_threshold 次后打开
+    - open：在 reset_timeout 秒内直接拒绝（CircuitOpenError），不再占用连接和等待超时
+    - half_open：冷却结束后只放行一个探测请求，成功则关闭，失败则重新打开
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = LLM_BREAKER_RESET_TIMEOUT
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def _transition(self, state: str) -> None:
+        self._state = state
+        LLM_CIRCUIT_TRANSITIONS.labels(state).inc()
+
+    def before_call(self) -> None:
+        """
+        调用前检查是否放行
+
+        Raises:
+            CircuitOpenError: 熔断器打开，或半开状态下已有探测请求在进行
+        """
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            if self._state == self.OPEN:
+                retry_in = self._opened_at + self.reset_timeout - time.monotonic()
+                if retry_in > 0:
+                    raise CircuitOpenError(f"DeepSeek API暂时不可用（连续失败已熔断），约{retry_in:.0f}秒后重试")
+                self._transition(self.HALF_OPEN)
+            if self._state == self.HALF_OPEN:
+                if self._probing:
+                    raise CircuitOpenError("DeepSeek API暂时不可用（熔断恢复探测中），请稍后重试")
+                self._probing = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            if self._state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED and self.failure_threshold > 0
+                and self._failures >= self.failure_threshold
+            ):
+                self._opened_at = time.monotonic()
+                self._transition(self.OPEN)
+
+    def release(self) -> None:
+        """调用既未成功也不算上游故障（如客户端取消、4xx）时释放探测名额"""
+        with self._lock:
+            self._probing = False
+
+class LatencyTracker:
+    """最近若干次成功调用的耗时，用于计算对冲请求的延迟"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        """耗时的q分位数，样本不足 min_samples 时返回None"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples or len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
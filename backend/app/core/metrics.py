@@ -0,0 +1,81 @@
+from typing import Dict, Tuple
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+# 阶段耗时的分桶（秒）：覆盖从亚毫秒的检索到数十秒的LLM调用和大文档入库
+_LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0
+)
+
+STAGE_SECONDS = Histogram(
+    "qa_stage_duration_seconds",
+    "查询和入库链路各阶段的耗时",
+    ["pipeline", "stage"],
+    buckets=_LATENCY_BUCKETS
+)
+QUERIES = Counter(
+    "qa_queries_total",
+    "处理的查询数",
+    ["endpoint", "retrieval_mode", "outcome"]  # outcome: answered / cache_hit / no_context / error
+)
+LLM_REQUESTS = Counter("qa_llm_requests_total", "LLM调用次数", ["mode"])  # mode: blocking / stream
+LLM_ERRORS = Counter("qa_llm_errors_total", "LLM调用失败次数", ["mode", "kind"])
+LLM_TOKENS = Counter("qa_llm_tokens_total", "LLM消耗的token数（来自接口返回的usage）", ["kind"])
+LLM_RETRIES = Counter("qa_llm_retries_total", "LLM调用的重试次数", ["mode", "kind"])
+LLM_HEDGES = Counter(
+    "qa_llm_hedged_requests_total",
+    "LLM对冲请求数",
+    ["outcome"]  # outcome: sent / won（对冲请求先于原请求返回）
+)
+LLM_CIRCUIT_TRANSITIONS = Counter("qa_llm_circuit_transitions_total", "LLM熔断器状态切换次数", ["state"])
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    "qa_llm_time_to_first_token_seconds",
+    "流式生成时收到第一个片段的耗时",
+    buckets=_LATENCY_BUCKETS
+)
+CONTEXT_TOKENS = Counter(
+    "qa_context_tokens_total",
+    "上下文组装前后的估算token数",
+    ["kind"]  # kind: retrieved / sent
+)
+STAGE_INFLIGHT = Gauge("qa_stage_inflight", "各执行阶段正在执行和排队的任务数", ["stage"])
+STAGE_REJECTIONS = Counter("qa_stage_rejections_total", "阶段已满被拒绝（429）的请求数", ["stage"])
+INGESTION_JOBS = Counter("qa_ingestion_jobs_total", "结束的入库任务数", ["status"])
+INGESTION_PAGES = Counter("qa_ingestion_pages_total", "入库解析的页数")
+INGESTION_CHUNKS = Counter(
+    "qa_ingestion_chunks_total",
+    "入库处理的块数",
+    ["outcome"]  # outcome: embedded / reused / deleted
+)
+CHUNKS_PER_DOCUMENT = Histogram(
+    "qa_ingestion_chunks_per_document",
+    "每个文档的块数",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+)
+
+# 已绑定标签的子指标缓存，热路径上避免重复解析标签
+_stage_children: Dict[Tuple[str, str], Histogram] = {}
+
+def _stage(pipeline: str, stage: str) -> Histogram:
+    child = _stage_children.get((pipeline, stage))
+    if child is None:
+        child = _stage_children.setdefault((pipeline, stage), STAGE_SECONDS.labels(pipeline, stage))
+    return child
+
+def stage_timer(pipeline: str, stage: str):
+    """
+    统计一个阶段耗时的上下文管理器
+
+    用法：
+        with stage_timer("query", "retrieve"):
+            ...
+    """
+    return _stage(pipeline, stage).time()
+
+def observe_stage(pipeline: str, stage: str, seconds: float) -> None:
+    """记录一次已测得的阶段耗时（无法用 with 包裹的阶段，如流式生成）"""
+    _stage(pipeline, stage).observe(seconds)
+
+def render_latest() -> Tuple[bytes, str]:
+    """返回Prometheus文本格式的指标内容及其Content-Type"""
+    return generate_latest(), CONTENT_TYPE_LATEST
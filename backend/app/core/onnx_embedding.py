@@ -0,0 +1,182 @@
+import json
+from pathlib import Path
+from typing import Dict, List, Union
+import numpy as np
+from app.config import EMBEDDING_MODEL, EMBEDDING_ONNX_THREADS
+
+# 导出目录中的文件
+_MODEL_FILES = {"none": "model.onnx", "int8": "model.int8.onnx"}
+_EXPORT_INFO = "export.json"
+# 支持的池化方式（与 sentence-transformers 的 Pooling 模块一致）
+_POOLING_MODES = ("mean", "cls")
+
+class OnnxSentenceEncoder:
+    """
+    用onnxruntime在CPU上运行导出的 sentence-transformers 模型
+
+    导出的ONNX图只包含Transformer主干，池化和归一化在这里用numpy完成，
+    与 SentenceTransformer 的 encode / tokenizer / max_seq_length 接口保持一致，
+    可以直接替换 Embedding 中的模型。
+    """
+
+    def __init__(self, directory: Path, quantization: str = "none", threads: int = EMBEDDING_ONNX_THREADS):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        if quantization not in _MODEL_FILES:
+            raise ValueError(f"不支持的ONNX量化方式：{quantization}")
+        directory = Path(directory)
+        model_path = directory / _MODEL_FILES[quantization]
+        if not model_path.exists():
+            raise FileNotFoundError(f"未找到ONNX模型 {model_path}，请先运行 python manage.py export-onnx")
+
+        info = json.loads((directory / _EXPORT_INFO).read_text(encoding="utf-8"))
+        self.max_seq_length = info["max_seq_length"]
+        self._pooling = info["pooling"]
+        self._normalize = info["normalize"]
+        self.tokenizer = AutoTokenizer.from_pretrained(str(directory))
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self._session = ort.InferenceSession(
+            str(model_path), options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = [node.name for node in self._session.get_inputs()]
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np"
+        )
+        feeds = {name: encoded[name].astype(np.int64) for name in self._input_names}
+        token_embeddings = self._session.run(None, feeds)[0]
+
+        if self._pooling == "cls":
+            pooled = token_embeddings[:, 0]
+        else:
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self._normalize:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        """
+        编码文本
+
+        与 SentenceTransformer.encode 一样，先按长度排序再分批，减少批内的填充。
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        outputs = [None] * len(texts)
+        for start in range(0, len(texts), batch_size):
+            batch = order[start:start + batch_size]
+            for i, vector in zip(batch, self._encode_batch([texts[i] for i in batch])):
+                outputs[i] = vector
+        vectors = np.stack(outputs)
+        return vectors[0] if single else vectors
+
+def export_onnx(
+    directory: Path,
+    model_name: str = EMBEDDING_MODEL,
+    quantize: bool = True,
+    opset: int = 14
+) -> Dict[str, str]:
+    """
+    把 sentence-transformers 模型导出为ONNX（需要torch，只在导出时使用）
+
+    Args:
+        directory: 导出目录
+        model_name: 模型名称
+        quantize: 是否额外生成int8动态量化的模型
+        opset: ONNX算子集版本
+
+    Returns:
+        量化方式 -> 模型文件路径
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0]
+    module_types = [type(module).__name__ for module in model]
+    if "Pooling" not in module_types:
+        raise ValueError(f"模型 {model_name} 没有Pooling模块，无法导出")
+    pooling = model[module_types.index("Pooling")].get_pooling_mode_str()
+    if pooling not in _POOLING_MODES:
+        raise ValueError(f"不支持的池化方式：{pooling}")
+
+    sample = transformer.tokenizer(["warm up"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+    class _Backbone(torch.nn.Module):
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, *inputs):
+            return self.auto_model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["token_embeddings"]}
+    model_path = directory / _MODEL_FILES["none"]
+    with torch.no_grad():
+        torch.onnx.export(
+            _Backbone(transformer.auto_model).eval(),
+            tuple(sample[name] for name in input_names),
+            str(model_path),
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset
+        )
+    transformer.tokenizer.save_pretrained(str(directory))
+    (directory / _EXPORT_INFO).write_text(json.dumps({
+        "model": model_name,
+        "max_seq_length": model.max_seq_length,
+        "pooling": pooling,
+        "normalize": "Normalize" in module_types
+    }, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    paths = {"none": str(model_path)}
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = directory / _MODEL_FILES["int8"]
+        quantize_dynamic(str(model_path), str(int8_path), weight_type=QuantType.QInt8)
+        paths["int8"] = str(int8_path)
+    return paths
+
+def compare_with_torch(
+    directory: Path,
+    texts: List[str],
+    quantizations: tuple = ("none", "int8"),
+    model_name: str = EMBEDDING_MODEL
+) -> Dict[str, Dict[str, float]]:
+    """
+    对比ONNX模型与torch模型对同一批文本的编码结果
+
+    Returns:
+        量化方式 -> {"min_cosine": 最小余弦相似度, "mean_cosine": 平均余弦相似度}
+    """
+    from sentence_transformers import SentenceTransformer
+
+    reference = SentenceTransformer(model_name, device="cpu").encode(texts)
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    results = {}
+    for quantization in quantizations:
+        vectors = OnnxSentenceEncoder(directory, quantization).encode(texts)
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        cosines = np.einsum("ij,ij->i", reference, vectors)
+        results[quantization] = {"min_cosine": float(cosines.min()), "mean_cosine": float(cosines.mean())}
+    return results
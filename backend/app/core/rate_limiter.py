@@ -0,0 +1,24 @@
+import asyncio
+import time
+
+class AsyncRateLimiter:
+    """
+    异步的匀速限流器
+
+    每次 acquire() 至少间隔 1 / rate 秒，等待期间不阻塞事件循环；rate <= 0 时不限流。
+    """
+
+    def __init__(self, rate: float):
+        self._interval = 1 / rate if rate > 0 else 0.0
+        self._next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if not self._interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_at - now
+            self._next_at = max(now, self._next_at) + self._interval
+        if wait > 0:
+            await asyncio.sleep(wait)
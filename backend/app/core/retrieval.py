@@ -1,16 +1,31 @@
 from typing import List, Dict, Any, Optional
 from app.core.vector_store import VectorStore
-from app.config import TOP_K
+from app.core.embedding_batcher import EmbeddingBatcher
+from app.core.metrics import stage_timer
+from app.config import TOP_K, RETRIEVAL_MODE, HYBRID_CANDIDATES, RRF_K
+
+# 支持的检索模式
+RETRIEVAL_MODES = ("vector", "hybrid")
 
 class Retrieval:
     def __init__(self):
         self.vector_store = VectorStore()
     
+    def embed_query(self, query: str) -> List[float]:
+        """计算查询向量（可在检索和语义缓存之间复用）"""
+        return EmbeddingBatcher().embed(query)
+    
+    async def aembed_query(self, query: str) -> List[float]:
+        """异步计算查询向量，并发的查询会被合并成一批编码"""
+        return await EmbeddingBatcher().aembed(query)
+    
     def retrieve_relevant_chunks(
         self, 
         query: str, 
         n_results: int = TOP_K,
-        document_ids: Optional[List[str]] = None
+        document_ids: Optional[List[str]] = None,
+        query_embedding: Optional[List[float]] = None,
+        mode: str = RETRIEVAL_MODE
     ) -> List[Dict[str, Any]]:
         """
         检索与查询相关的文档块
@@ -19,12 +34,96 @@ class Retrieval:
             query: 查询文本
             n_results: 返回结果数量
             document_ids: 可选，指定文档ID列表，只在这些文档中搜索
+            query_embedding: 可选，已计算好的查询向量
+            mode: 检索模式，vector（纯向量）或 hybrid（BM25 + 向量，倒数排名融合）
             
         Returns:
             相关文档块列表
         """
-        return self.vector_store.search(
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"不支持的检索模式：{mode}")
+        
+        if mode == "vector":
+            return self.vector_store.search(
+                query=query,
+                n_results=n_results,
+                document_ids=document_ids,
+                query_embedding=query_embedding
+            )
+        
+        # 混合检索：两路各取若干候选，再用倒数排名融合（RRF）合并
+        n_candidates = max(n_results, HYBRID_CANDIDATES)
+        vector_results = self.vector_store.search(
             query=query,
-            n_results=n_results,
-            document_ids=document_ids
+            n_results=n_candidates,
+            document_ids=document_ids,
+            query_embedding=query_embedding
         )
+        return self._fuse(query, vector_results, n_results, document_ids)
+    
+    def retrieve_many(
+        self,
+        queries: List[str],
+        query_embeddings: List[List[float]],
+        n_results: int = TOP_K,
+        document_ids: Optional[List[str]] = None,
+        mode: str = RETRIEVAL_MODE
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        批量检索：所有查询的向量检索合并为一次多查询搜索（用于批量查询接口）
+        
+        Args:
+            queries: 查询文本列表
+            query_embeddings: 与 queries 一一对应的查询向量
+            n_results: 每个查询返回的结果数量
+            document_ids: 可选，指定文档ID列表，只在这些文档中搜索
+            mode: 检索模式，同 retrieve_relevant_chunks
+            
+        Returns:
+            与 queries 一一对应的相关文档块列表
+        """
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"不支持的检索模式：{mode}")
+        
+        n_candidates = n_results if mode == "vector" else max(n_results, HYBRID_CANDIDATES)
+        vector_results = self.vector_store.search_many(query_embeddings, n_candidates, document_ids)
+        if mode == "vector":
+            return vector_results
+        return [
+            self._fuse(query, results, n_results, document_ids)
+            for query, results in zip(queries, vector_results)
+        ]
+    
+    def _fuse(
+        self,
+        query: str,
+        vector_results: List[Dict[str, Any]],
+        n_results: int,
+        document_ids: Optional[List[str]]
+    ) -> List[Dict[str, Any]]:
+        """取BM25候选，与向量检索候选做倒数排名融合（RRF）"""
+        n_candidates = max(n_results, HYBRID_CANDIDATES)
+        with stage_timer("query", "lexical_search"):
+            lexical_results = self.vector_store.lexical_index.search(
+                query=query,
+                n_results=n_candidates,
+                document_ids=document_ids
+            )
+        
+        scores: Dict[str, float] = {}
+        chunks: Dict[str, Dict[str, Any]] = {}
+        for rank, result in enumerate(vector_results):
+            scores[result["id"]] = 1 / (RRF_K + rank + 1)
+            chunks[result["id"]] = result
+        for rank, (chunk_id, _) in enumerate(lexical_results):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1 / (RRF_K + rank + 1)
+            if chunk_id not in chunks:
+                chunk = self.vector_store.lexical_index.get_chunk(chunk_id)
+                if chunk is None:
+                    del scores[chunk_id]
+                    continue
+                # 只被BM25召回的块没有向量距离
+                chunks[chunk_id] = {**chunk, "distance": None}
+        
+        ranked = sorted(scores, key=scores.get, reverse=True)[:n_results]
+        return [{**chunks[chunk_id], "score": scores[chunk_id]} for chunk_id in ranked]
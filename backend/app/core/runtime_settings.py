@@ -0,0 +1,247 @@
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, Literal, Optional
+from dotenv import dotenv_values
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, model_validator
+from app.config import (
+    ENV_FILE,
+    SETTINGS_WATCH_INTERVAL,
+    DEEPSEEK_API_KEY,
+    TOP_K,
+    EMBED_BATCH_WAIT_MS,
+    EMBED_BATCH_MAX_SIZE,
+    INGESTION_EMBED_BATCH_SIZE,
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_TTL,
+    ANSWER_CACHE_SEMANTIC_THRESHOLD,
+    LLM_CONNECT_TIMEOUT,
+    LLM_READ_TIMEOUT,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE_CONNECTIONS,
+    QUERY_TIMEOUT,
+    LLM_MAX_RETRIES,
+    LLM_HEDGE_ENABLED,
+    BATCH_QUERY_MAX_QUESTIONS,
+    BATCH_LLM_CONCURRENCY,
+    BATCH_LLM_RATE_LIMIT,
+    CONTEXT_TOKEN_BUDGET,
+    CHUNKING_MODE,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    CHUNK_MAX_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
+    INGESTION_WORKERS,
+    INGESTION_MAX_PENDING
+)
+
+class RuntimeConfig(BaseModel):
+    """
+    可在运行时修改的配置（不可变，修改时整体替换）
+
+    字段名的大写形式即对应的环境变量名（如 top_k → TOP_K），默认值取自 app.config。
+    """
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
+    # DeepSeek API密钥
+    deepseek_api_key: str = Field(DEEPSEEK_API_KEY, pattern=r"^\S*$")
+    # 检索
+    top_k: int = Field(TOP_K, ge=1, le=10)
+    # 查询向量微批处理
+    embed_batch_wait_ms: float = Field(EMBED_BATCH_WAIT_MS, ge=0, le=1000)
+    embed_batch_max_size: int = Field(EMBED_BATCH_MAX_SIZE, ge=1, le=1024)
+    # 入库时每批编码的文本块数
+    ingestion_embed_batch_size: int = Field(INGESTION_EMBED_BATCH_SIZE, ge=1, le=4096)
+    # 答案缓存
+    answer_cache_size: int = Field(ANSWER_CACHE_SIZE, ge=0, le=1_000_000)
+    answer_cache_ttl: float = Field(ANSWER_CACHE_TTL, gt=0)
+    answer_cache_semantic_threshold: float = Field(ANSWER_CACHE_SEMANTIC_THRESHOLD, ge=0)
+    # LLM客户端
+    llm_connect_timeout: float = Field(LLM_CONNECT_TIMEOUT, gt=0, le=600)
+    llm_read_timeout: float = Field(LLM_READ_TIMEOUT, gt=0, le=3600)
+    llm_max_connections: int = Field(LLM_MAX_CONNECTIONS, ge=1, le=1000)
+    llm_max_keepalive_connections: int = Field(LLM_MAX_KEEPALIVE_CONNECTIONS, ge=0, le=1000)
+    # 查询时限、LLM重试和对冲请求
+    query_timeout: float = Field(QUERY_TIMEOUT, gt=0, le=3600)
+    llm_max_retries: int = Field(LLM_MAX_RETRIES, ge=0, le=10)
+    llm_hedge_enabled: bool = LLM_HEDGE_ENABLED
+    # 批量查询
+    batch_query_max_questions: int = Field(BATCH_QUERY_MAX_QUESTIONS, ge=1, le=10_000)
+    batch_llm_concurrency: int = Field(BATCH_LLM_CONCURRENCY, ge=1, le=1000)
+    batch_llm_rate_limit: float = Field(BATCH_LLM_RATE_LIMIT, ge=0)
+    # 上下文组装
+    context_token_budget: int = Field(CONTEXT_TOKEN_BUDGET, ge=0)
+    # 分块（只影响之后入库的文档）
+    chunking_mode: Literal["chars", "tokens"] = CHUNKING_MODE
+    chunk_size: int = Field(CHUNK_SIZE, ge=50, le=10_000)
+    chunk_overlap: int = Field(CHUNK_OVERLAP, ge=0)
+    chunk_max_tokens: int = Field(CHUNK_MAX_TOKENS, ge=0)
+    chunk_overlap_tokens: int = Field(CHUNK_OVERLAP_TOKENS, ge=0)
+    # 入库任务
+    ingestion_workers: int = Field(INGESTION_WORKERS, ge=1, le=64)
+    ingestion_max_pending: int = Field(INGESTION_MAX_PENDING, ge=1)
+
+    @model_validator(mode="after")
+    def _check_consistency(self) -> "RuntimeConfig":
+        if self.chunk_overlap >= self.chunk_size:
+            raise ValueError("chunk_overlap 必须小于 chunk_size")
+        if self.chunk_max_tokens and self.chunk_overlap_tokens >= self.chunk_max_tokens:
+            raise ValueError("chunk_overlap_tokens 必须小于 chunk_max_tokens")
+        if self.llm_max_keepalive_connections > self.llm_max_connections:
+            raise ValueError("llm_max_keepalive_connections 不能大于 llm_max_connections")
+        return self
+
+class SettingsValidationError(ValueError):
+    """运行时配置校验失败"""
+
+    def __init__(self, errors: List[Dict[str, Any]]):
+        self.errors = errors
+        super().__init__("; ".join(f"{error['field']}: {error['message']}" for error in errors))
+
+def _validate(values: Dict[str, Any]) -> RuntimeConfig:
+    try:
+        return RuntimeConfig(**values)
+    except ValidationError as e:
+        raise SettingsValidationError([
+            {"field": ".".join(str(part) for part in error["loc"]) or "settings", "message": error["msg"]}
+            for error in e.errors()
+        ]) from None
+
+class RuntimeSettings:
+    """
+    运行时配置的持有者
+
+    当前配置是一个不可变的 RuntimeConfig 对象，修改时先完整校验，再整体替换引用，
+    读取方不会看到只改了一半的配置；一次操作中需要多个参数时应只调用一次 get()。
+    修改会写回 .env 文件；多进程部署时各进程监视该文件的变化并重新加载，
+    这样在任意一个进程上的修改都会同步到所有进程。
+
+    读取参数的组件在使用时调用 get()，自然取到新值；需要重建资源的组件
+    （如入库线程池）通过 subscribe() 注册回调，在配置替换后调整。
+    """
+    _instance = None
+    _current = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if self._current is None:
+            # 可重入：订阅者的回调中可能首次创建其他也要订阅的单例
+            self._lock = threading.RLock()
+            self._listeners: List[Callable[[RuntimeConfig, RuntimeConfig], None]] = []
+            self._env_mtime = self._read_env_mtime()
+            self._watcher = None
+            self._stop_watching = threading.Event()
+            self._current = RuntimeConfig()
+
+    @staticmethod
+    def get() -> RuntimeConfig:
+        """获取当前配置"""
+        return RuntimeSettings()._current
+
+    def subscribe(self, callback: Callable[[RuntimeConfig, RuntimeConfig], None]) -> None:
+        """注册配置变化的回调，参数为 (旧配置, 新配置)，在修改配置的线程中调用"""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def _replace(self, config: RuntimeConfig) -> RuntimeConfig:
+        """替换当前配置并通知订阅者（调用方需持有锁）"""
+        previous = self._current
+        if config == previous:
+            return config
+        self._current = config
+        for callback in list(self._listeners):
+            try:
+                callback(previous, config)
+            except Exception as e:
+                print(f"❌ 应用运行时配置失败：{e}")
+        return config
+
+    def update(self, changes: Dict[str, Any], persist: bool = True) -> RuntimeConfig:
+        """
+        修改配置：校验通过后整体替换，并写回 .env 文件
+
+        Args:
+            changes: 字段名 -> 新值，未包含的字段保持不变
+            persist: 是否写回 .env 文件（脚本中临时调整参数时传False）
+
+        Returns:
+            修改后的配置
+
+        Raises:
+            SettingsValidationError: 字段不存在或取值不合法（此时配置保持不变）
+        """
+        with self._lock:
+            config = _validate({**self._current.model_dump(), **changes})
+            changed = {
+                name: value for name, value in config.model_dump().items()
+                if value != getattr(self._current, name)
+            }
+            if changed and persist:
+                self._write_env(changed)
+            return self._replace(config)
+
+    def reload(self) -> RuntimeConfig:
+        """
+        从 .env 文件重新加载配置：文件中的值覆盖启动时的配置，文件中没有的字段恢复为启动时的值
+
+        Raises:
+            SettingsValidationError: 文件中的取值不合法（此时配置保持不变）
+        """
+        with self._lock:
+            self._env_mtime = self._read_env_mtime()
+            values = dotenv_values(ENV_FILE) if ENV_FILE.exists() else {}
+            config = _validate({
+                name: values[name.upper()]
+                for name in RuntimeConfig.model_fields
+                if values.get(name.upper()) is not None
+            })
+            return self._replace(config)
+
+    @staticmethod
+    def _read_env_mtime() -> Optional[int]:
+        try:
+            return os.stat(ENV_FILE).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _write_env(self, changed: Dict[str, Any]) -> None:
+        """把修改的字段写回 .env 文件（替换已有的行，没有的追加；先写临时文件再替换）"""
+        content = ENV_FILE.read_text(encoding="utf-8") if ENV_FILE.exists() else ""
+        for name, value in changed.items():
+            key = name.upper()
+            line = f"{key}={value}"
+            pattern = re.compile(rf"^{key}=.*$", re.MULTILINE)
+            if pattern.search(content):
+                content = pattern.sub(lambda _: line, content)
+            else:
+                content = content.rstrip("\n") + ("\n" if content.strip() else "") + line
+        tmp_path = ENV_FILE.with_name(ENV_FILE.name + ".tmp")
+        tmp_path.write_text(content.strip("\n") + "\n", encoding="utf-8")
+        os.replace(tmp_path, ENV_FILE)
+        self._env_mtime = self._read_env_mtime()
+
+    def start_watching(self, interval: float = SETTINGS_WATCH_INTERVAL) -> None:
+        """启动后台线程，.env 文件被修改（包括其他进程通过设置接口修改）后重新加载配置"""
+        if self._watcher is not None or interval <= 0:
+            return
+        self._watcher = threading.Thread(
+            target=self._watch_loop, args=(interval,), name="settings-watcher", daemon=True
+        )
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        self._stop_watching.set()
+
+    def _watch_loop(self, interval: float) -> None:
+        while not self._stop_watching.wait(interval):
+            if self._read_env_mtime() == self._env_mtime:
+                continue
+            try:
+                self.reload()
+                print("✅ 已重新加载运行时配置")
+            except SettingsValidationError as e:
+                print(f"❌ .env 中的运行时配置不合法，保持原配置：{e}")
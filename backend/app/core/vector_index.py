@@ -0,0 +1,868 @@
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from app.config import (
+    VECTOR_BACKEND,
+    VECTOR_DB_DIR,
+    NUMPY_INDEX_DIR,
+    NUMPY_INDEX_COMPACT_RATIO,
+    NUMPY_INDEX_PREFILTER_RATIO,
+    VECTOR_QUANTIZATION,
+    VECTOR_RESCORE_FACTOR
+)
+from app.core.vector_quantization import create_quantizer
+
+class VectorIndex(ABC):
+    """
+    向量索引后端接口
+
+    每个块由ID、向量、文本和元数据组成，元数据中必须包含 document_id。
+    search 返回的距离为平方L2距离（与chroma默认的距离度量一致）。
+    """
+
+    @abstractmethod
+    def add(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]]
+    ) -> None:
+        """添加块（已存在的ID会被覆盖）"""
+
+    @abstractmethod
+    def delete(self, ids: Optional[List[str]] = None, document_id: Optional[str] = None) -> None:
+        """按块ID和/或文档ID删除块"""
+
+    @abstractmethod
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """原地更新已有块的元数据（不改动向量和文本）"""
+
+    @abstractmethod
+    def search(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int,
+        document_ids: Optional[List[str]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        向量检索
+
+        Args:
+            query_embeddings: 查询向量列表
+            n_results: 每个查询返回的结果数量
+            document_ids: 可选，只在这些文档的块中检索
+
+        Returns:
+            每个查询一个结果列表，结果包含 id、document、metadata、distance，按距离升序
+        """
+
+    @abstractmethod
+    def get(self, document_id: Optional[str] = None) -> Dict[str, List]:
+        """获取（指定文档的）所有块，返回 {"ids": [...], "documents": [...], "metadatas": [...]}"""
+
+    @abstractmethod
+    def list_ids(self, document_id: Optional[str] = None) -> List[str]:
+        """获取（指定文档的）所有块ID"""
+
+    @abstractmethod
+    def iter_rows(self, batch_size: int = 8192) -> Iterator[Tuple[List[str], np.ndarray, List[str], List[Dict[str, Any]]]]:
+        """按批产出所有块：(块ID列表, float32向量矩阵, 文本列表, 元数据列表)，用于导出索引"""
+
+    @abstractmethod
+    def count(self) -> int:
+        """块总数"""
+
+    def dimension(self) -> Optional[int]:
+        """向量维度，索引中尚无向量时返回None"""
+        return None
+
+    def persist(self) -> None:
+        """将此前的写入落盘（默认无需额外操作）"""
+
+class ChromaVectorIndex(VectorIndex):
+    """基于chromadb集合的向量索引"""
+
+    def __init__(self, persist_directory: Path, collection_name: str = "documents"):
+        # 只有选用该后端时才导入chromadb
+        import chromadb
+        from chromadb.config import Settings
+
+        self._client = chromadb.Client(
+            Settings(
+                persist_directory=str(persist_directory),
+                anonymized_telemetry=False
+            )
+        )
+        self._collection = self._client.get_or_create_collection(name=collection_name)
+
+    def add(self, ids, embeddings, documents, metadatas) -> None:
+        if not ids:
+            return
+        self._collection.upsert(
+            ids=ids,
+            documents=documents,
+            metadatas=metadatas,
+            # chromadb只接受列表形式的向量
+            embeddings=embeddings.tolist() if isinstance(embeddings, np.ndarray) else embeddings
+        )
+
+    def delete(self, ids=None, document_id=None) -> None:
+        if ids:
+            self._collection.delete(ids=ids)
+        if document_id is not None:
+            self._collection.delete(where={"document_id": document_id})
+
+    def update_metadata(self, ids, metadatas) -> None:
+        if not ids:
+            return
+        self._collection.update(ids=ids, metadatas=metadatas)
+
+    def search(self, query_embeddings, n_results, document_ids=None) -> List[List[Dict[str, Any]]]:
+        if not query_embeddings:
+            return []
+
+        # 构建过滤条件
+        where = None
+        if document_ids:
+            where = {"document_id": {"$in": document_ids}}
+
+        results = self._collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where
+        )
+
+        return [
+            [
+                {
+                    "id": results["ids"][q][i],
+                    "document": results["documents"][q][i],
+                    "metadata": results["metadatas"][q][i],
+                    "distance": results["distances"][q][i]
+                }
+                for i in range(len(results["ids"][q]))
+            ]
+            for q in range(len(query_embeddings))
+        ]
+
+    def get(self, document_id=None) -> Dict[str, List]:
+        where = {"document_id": document_id} if document_id is not None else None
+        results = self._collection.get(where=where, include=["documents", "metadatas"])
+        return {
+            "ids": results["ids"],
+            "documents": results["documents"],
+            "metadatas": results["metadatas"]
+        }
+
+    def list_ids(self, document_id=None) -> List[str]:
+        where = {"document_id": document_id} if document_id is not None else None
+        return self._collection.get(where=where, include=[])["ids"]
+
+    def iter_rows(self, batch_size=8192):
+        offset = 0
+        while True:
+            results = self._collection.get(
+                include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset
+            )
+            if not results["ids"]:
+                return
+            yield (
+                results["ids"],
+                np.asarray(results["embeddings"], dtype=np.float32),
+                results["documents"],
+                results["metadatas"]
+            )
+            offset += len(results["ids"])
+
+    def count(self) -> int:
+        return self._collection.count()
+
+    def dimension(self) -> Optional[int]:
+        embeddings = self._collection.get(limit=1, include=["embeddings"])["embeddings"]
+        return len(embeddings[0]) if embeddings is not None and len(embeddings) else None
+
+    def persist(self) -> None:
+        # 新版chromadb会自动持久化，不再提供persist()
+        if hasattr(self._client, "persist"):
+            self._client.persist()
+
+class NumpyVectorIndex(VectorIndex):
+    """
+    基于内存映射NumPy矩阵的向量索引
+
+    - 向量按行追加写入连续的float32文件，通过 np.memmap 访问，容量按倍数扩展
+    - 块ID、文档ID、文本和元数据保存在同目录的SQLite中
+    - 删除只打墓碑标记，已删除行占比超过阈值时压缩重写向量文件
+    - 每个文档维护自己的行号列表：限定文档的检索只计算这些行的距离，
+      所选文档占比较大时退回全量扫描 + 掩码
+    - 写入只进入SQLite的未提交事务和向量文件的页缓存，persist() 时才刷盘并提交
+    - 可选量化（float16 / int8）：检索时先在内存中的量化向量上粗排，
+      再从float32文件中读取候选行精确重排，float32文件只有候选行会被换入内存
+
+    内存占用约为 行数 × 维度 × 4 字节（向量，由操作系统页缓存管理）
+    加上每行十几字节的辅助数组；启用量化后常驻部分降为 × 2（float16）或 × 1（int8）字节。
+
+    read_only=True 时以只读方式映射向量文件和打开SQLite（用于多进程共享的索引快照），
+    多个进程映射同一文件时共享操作系统页缓存中的同一份数据。
+    """
+    _INITIAL_CAPACITY = 1024
+    # 粗排时每次转换为float32计算的行数（限制临时内存）
+    _SCAN_BLOCK = 65536
+
+    def __init__(
+        self,
+        directory: Path,
+        compact_ratio: float = NUMPY_INDEX_COMPACT_RATIO,
+        quantization: str = VECTOR_QUANTIZATION,
+        rescore_factor: int = VECTOR_RESCORE_FACTOR,
+        read_only: bool = False,
+        prefilter_ratio: float = NUMPY_INDEX_PREFILTER_RATIO
+    ):
+        self._dir = Path(directory)
+        self._compact_ratio = compact_ratio
+        self._prefilter_ratio = prefilter_ratio
+        self._quantization = quantization
+        self._rescore_factor = max(1, rescore_factor)
+        self._read_only = read_only
+        self._lock = threading.RLock()
+        # 正在进行的导出数：导出期间推迟压缩，保持行号不变
+        self._exports = 0
+
+        if read_only:
+            self._conn = sqlite3.connect(
+                f"file:{self._dir / 'rows.sqlite3'}?mode=ro", uri=True, check_same_thread=False
+            )
+        else:
+            self._dir.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self._dir / "rows.sqlite3"), check_same_thread=False)
+            self.create_schema(self._conn)
+        self._load()
+
+    @staticmethod
+    def create_schema(conn: sqlite3.Connection) -> None:
+        """创建行表和元数据表"""
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rows (
+                row INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                document_id TEXT NOT NULL,
+                document TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_rows_document_id ON rows (document_id)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.commit()
+
+    def _check_writable(self) -> None:
+        if self._read_only:
+            raise RuntimeError("只读索引不支持写入")
+
+    # ---------- 内部状态 ----------
+
+    def _get_meta(self, key: str, default=None):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _set_meta(self, key: str, value) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            (key, json.dumps(value))
+        )
+
+    def _vectors_path(self, generation: int) -> Path:
+        return self._dir / f"vectors.{generation}.f32"
+
+    def _open_vectors(self, capacity: int) -> None:
+        """按给定容量（行数）打开当前代的向量文件"""
+        path = self._vectors_path(self._generation)
+        if self._read_only:
+            # 只读映射不能扩展文件，按文件实际大小映射
+            capacity = path.stat().st_size // (self._dim * 4)
+            self._vectors = np.memmap(path, dtype=np.float32, mode="r", shape=(capacity, self._dim))
+            self._capacity = capacity
+            return
+        with open(path, "ab") as f:
+            f.truncate(capacity * self._dim * 4)
+        self._vectors = np.memmap(path, dtype=np.float32, mode="r+", shape=(capacity, self._dim))
+        self._capacity = capacity
+
+    def _load(self) -> None:
+        """从磁盘恢复索引状态"""
+        self._dim = self._get_meta("dim")
+        self._generation = self._get_meta("generation", 0)
+        self._count = self._get_meta("count", 0)  # 已使用的行数（含已删除行）
+        self._vectors = None
+        self._capacity = 0
+
+        capacity = max(self._count, self._INITIAL_CAPACITY)
+        if self._dim is not None:
+            path = self._vectors_path(self._generation)
+            if path.exists():
+                capacity = max(capacity, path.stat().st_size // (self._dim * 4))
+            self._open_vectors(capacity)
+
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._doc_codes = np.full(capacity, -1, dtype=np.int32)
+        self._norms = np.zeros(capacity, dtype=np.float32)
+        self._row_ids: List[Optional[str]] = [None] * self._count
+        self._id_to_row: Dict[str, int] = {}
+        self._document_codes: Dict[str, int] = {}
+        # 文档代号 -> 该文档的行号（含已删除的行，压缩时重建）
+        self._document_rows: List[List[int]] = []
+
+        for row, chunk_id, document_id in self._conn.execute(
+            "SELECT row, id, document_id FROM rows ORDER BY row"
+        ):
+            self._alive[row] = True
+            code = self._document_code(document_id)
+            self._doc_codes[row] = code
+            self._document_rows[code].append(row)
+            self._row_ids[row] = chunk_id
+            self._id_to_row[chunk_id] = row
+
+        if self._vectors is not None and self._count:
+            vectors = self._vectors[:self._count]
+            self._norms[:self._count] = np.einsum("ij,ij->i", vectors, vectors)
+
+        # 量化编码只保存在内存中，每次加载时由float32文件重建
+        self._quantizer = create_quantizer(self._quantization)
+        self._codes = None
+        if self._quantizer is not None and self._dim is not None:
+            self._codes = np.zeros((capacity, self._dim), dtype=self._quantizer.dtype)
+            live_rows = np.flatnonzero(self._alive[:self._count])
+            if len(live_rows):
+                self._quantizer.fit(self._vectors[live_rows])
+                self._encode_rows(0, self._count)
+
+    def _encode_rows(self, start: int, end: int) -> None:
+        """把 [start, end) 行的float32向量编码到量化数组中"""
+        for block_start in range(start, end, self._SCAN_BLOCK):
+            block_end = min(block_start + self._SCAN_BLOCK, end)
+            self._codes[block_start:block_end] = self._quantizer.encode(self._vectors[block_start:block_end])
+
+    def _document_code(self, document_id: str) -> int:
+        code = self._document_codes.get(document_id)
+        if code is None:
+            code = len(self._document_codes)
+            self._document_codes[document_id] = code
+            self._document_rows.append([])
+        return code
+
+    def _ensure_capacity(self, extra: int) -> None:
+        needed = self._count + extra
+        if needed <= self._capacity:
+            return
+        capacity = max(needed, self._capacity * 2, self._INITIAL_CAPACITY)
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        self._open_vectors(capacity)
+        grow = capacity - len(self._alive)
+        if grow > 0:
+            self._alive = np.concatenate([self._alive, np.zeros(grow, dtype=bool)])
+            self._doc_codes = np.concatenate([self._doc_codes, np.full(grow, -1, dtype=np.int32)])
+            self._norms = np.concatenate([self._norms, np.zeros(grow, dtype=np.float32)])
+        if self._quantizer is not None:
+            codes = np.zeros((capacity, self._dim), dtype=self._quantizer.dtype)
+            if self._codes is not None:
+                codes[:self._count] = self._codes[:self._count]
+            self._codes = codes
+
+    def _remove_rows(self, rows: List[int]) -> None:
+        if not rows:
+            return
+        self._alive[rows] = False
+        for row in rows:
+            chunk_id = self._row_ids[row]
+            self._id_to_row.pop(chunk_id, None)
+        self._conn.executemany("DELETE FROM rows WHERE row = ?", [(row,) for row in rows])
+
+    def _fetch_rows(self, rows: List[int]) -> Dict[int, tuple]:
+        placeholders = ",".join("?" * len(rows))
+        return {
+            row: (chunk_id, document, json.loads(metadata))
+            for row, chunk_id, document, metadata in self._conn.execute(
+                f"SELECT row, id, document, metadata FROM rows WHERE row IN ({placeholders})",
+                rows
+            )
+        }
+
+    def _candidate_rows(self, document_ids: Optional[List[str]]) -> Optional[np.ndarray]:
+        """
+        所选文档的存活行号（升序）
+
+        未限定文档，或所选文档的行数占比超过 prefilter_ratio 时返回None，由调用方全量扫描。
+        """
+        if not document_ids:
+            return None
+        row_lists = [
+            self._document_rows[self._document_codes[d]]
+            for d in set(document_ids) if d in self._document_codes
+        ]
+        if sum(len(rows) for rows in row_lists) > self._prefilter_ratio * self._count:
+            return None
+        if not row_lists:
+            return np.empty(0, dtype=np.int64)
+        rows = np.sort(np.concatenate([np.asarray(rows, dtype=np.int64) for rows in row_lists]))
+        return rows[self._alive[rows]]
+
+    def _candidate_mask(self, document_ids: Optional[List[str]]) -> np.ndarray:
+        mask = self._alive[:self._count]
+        if document_ids:
+            codes = [self._document_codes[d] for d in document_ids if d in self._document_codes]
+            mask = mask & np.isin(self._doc_codes[:self._count], codes)
+        return mask
+
+    # ---------- 接口实现 ----------
+
+    def add(self, ids, embeddings, documents, metadatas) -> None:
+        self._check_writable()
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+
+        with self._lock:
+            if self._dim is None:
+                self._dim = int(vectors.shape[1])
+                self._set_meta("dim", self._dim)
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"向量维度不匹配：期望 {self._dim}，实际 {vectors.shape[1]}")
+
+            # 覆盖已存在的ID
+            self._remove_rows([self._id_to_row[i] for i in ids if i in self._id_to_row])
+
+            self._ensure_capacity(len(ids))
+            start = self._count
+            end = start + len(ids)
+            self._vectors[start:end] = vectors
+            self._norms[start:end] = np.einsum("ij,ij->i", vectors, vectors)
+            self._alive[start:end] = True
+            codes = [self._document_code(m["document_id"]) for m in metadatas]
+            self._doc_codes[start:end] = codes
+            for offset, code in enumerate(codes):
+                self._document_rows[code].append(start + offset)
+            self._row_ids.extend(ids)
+            for offset, chunk_id in enumerate(ids):
+                self._id_to_row[chunk_id] = start + offset
+            self._count = end
+
+            if self._quantizer is not None:
+                if self._quantizer.covers(vectors):
+                    self._encode_rows(start, end)
+                else:
+                    # 新向量超出量化范围：扩展范围后把全部行重新编码到新数组
+                    # （量化器换成新对象，锁外正在粗排的检索继续使用旧的量化器和编码）
+                    self._quantizer = copy.deepcopy(self._quantizer)
+                    self._quantizer.fit(vectors)
+                    self._codes = np.zeros_like(self._codes)
+                    self._encode_rows(0, end)
+
+            self._conn.executemany(
+                "INSERT INTO rows (row, id, document_id, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (start + offset, chunk_id, metadata["document_id"], text, json.dumps(metadata, ensure_ascii=False))
+                    for offset, (chunk_id, text, metadata) in enumerate(zip(ids, documents, metadatas))
+                ]
+            )
+            self._set_meta("count", self._count)
+
+    def delete(self, ids=None, document_id=None) -> None:
+        self._check_writable()
+        with self._lock:
+            rows = []
+            if ids:
+                rows.extend(self._id_to_row[i] for i in ids if i in self._id_to_row)
+            if document_id is not None and document_id in self._document_codes:
+                code = self._document_codes[document_id]
+                rows.extend(row for row in self._document_rows[code] if self._alive[row])
+            self._remove_rows(sorted(set(rows)))
+
+            dead = self._count - len(self._id_to_row)
+            if self._count and not self._exports and dead / self._count > self._compact_ratio:
+                self.compact()
+
+    def update_metadata(self, ids, metadatas) -> None:
+        self._check_writable()
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE rows SET metadata = ? WHERE id = ?",
+                [
+                    (json.dumps(metadata, ensure_ascii=False), chunk_id)
+                    for chunk_id, metadata in zip(ids, metadatas)
+                ]
+            )
+
+    def search(self, query_embeddings, n_results, document_ids=None) -> List[List[Dict[str, Any]]]:
+        # 锁内只取数组引用和候选行，距离计算和top-k在锁外进行，只在读取SQLite时再次加锁。
+        # 扩容、压缩和量化重新编码都换成新数组而不修改旧数组，追加只写入 count 之后的行，
+        # 因此锁外使用的快照保持一致；计算期间发生压缩（行号变化）时重新检索
+        if not query_embeddings:
+            return []
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+
+        while True:
+            with self._lock:
+                if self._vectors is None or self._count == 0:
+                    return [[] for _ in range(len(queries))]
+                generation = self._generation
+                count = self._count
+                vectors = self._vectors
+                norms = self._norms
+                codes = self._codes
+                quantizer = self._quantizer
+                candidate_rows = self._candidate_rows(document_ids)
+                # 删除会原地修改 _alive，掩码需要复制
+                mask = None if candidate_rows is not None else self._candidate_mask(document_ids).copy()
+
+            if candidate_rows is not None:
+                # 预过滤：只计算所选文档的行
+                if len(candidate_rows) == 0:
+                    return [[] for _ in range(len(queries))]
+                top_rows = self._subset_search(
+                    vectors, norms, queries, candidate_rows, min(n_results, len(candidate_rows))
+                )
+            else:
+                n_candidates = int(mask.sum())
+                if n_candidates == 0:
+                    return [[] for _ in range(len(queries))]
+                k = min(n_results, n_candidates)
+
+                if quantizer is None:
+                    top_rows = self._exact_search(vectors[:count], norms[:count], queries, mask, k)
+                else:
+                    top_rows = self._quantized_search(
+                        vectors, norms[:count], codes[:count], quantizer, queries, mask, k, n_candidates
+                    )
+
+            with self._lock:
+                if self._generation != generation:
+                    continue
+                rows = self._fetch_rows(sorted({row for top in top_rows for row, _ in top}))
+            break
+
+        results = []
+        for top in top_rows:
+            query_results = []
+            for row, distance in top:
+                # 计算期间被删除的行已不在SQLite中，跳过
+                if row not in rows:
+                    continue
+                chunk_id, document, metadata = rows[row]
+                query_results.append({
+                    "id": chunk_id,
+                    "document": document,
+                    "metadata": metadata,
+                    "distance": float(max(distance, 0.0))
+                })
+            results.append(query_results)
+        return results
+
+    @staticmethod
+    def _top_k(distances: np.ndarray, k: int) -> np.ndarray:
+        """返回距离最小的k个下标（按距离升序）"""
+        top = np.argpartition(distances, k - 1)[:k]
+        return top[np.argsort(distances[top])]
+
+    @classmethod
+    def _exact_search(
+        cls,
+        vectors: np.ndarray,
+        norms: np.ndarray,
+        queries: np.ndarray,
+        mask: np.ndarray,
+        k: int
+    ) -> List[List[tuple]]:
+        """在float32向量上精确检索，返回每个查询的 [(行号, 平方L2距离)]"""
+        # 平方L2距离：|x|² + |q|² - 2x·q
+        dots = vectors @ queries.T
+        distances = norms[:, None] + np.einsum("ij,ij->i", queries, queries)[None, :] - 2 * dots
+        distances[~mask] = np.inf
+
+        top_rows = []
+        for q in range(len(queries)):
+            top = cls._top_k(distances[:, q], k)
+            top_rows.append([(int(row), float(distances[row, q])) for row in top])
+        return top_rows
+
+    @classmethod
+    def _subset_search(
+        cls,
+        vectors: np.ndarray,
+        norms: np.ndarray,
+        queries: np.ndarray,
+        rows: np.ndarray,
+        k: int
+    ) -> List[List[tuple]]:
+        """
+        只在给定行上用float32向量精确检索（候选行较少，无需量化粗排）
+
+        Returns:
+            每个查询的 [(行号, 平方L2距离)]
+        """
+        subset = vectors[rows]
+        dots = subset @ queries.T
+        distances = norms[rows, None] + np.einsum("ij,ij->i", queries, queries)[None, :] - 2 * dots
+
+        top_rows = []
+        for q in range(len(queries)):
+            top = cls._top_k(distances[:, q], k)
+            top_rows.append([(int(rows[i]), float(distances[i, q])) for i in top])
+        return top_rows
+
+    def _quantized_search(
+        self,
+        vectors: np.ndarray,
+        norms: np.ndarray,
+        codes: np.ndarray,
+        quantizer,
+        queries: np.ndarray,
+        mask: np.ndarray,
+        k: int,
+        n_candidates: int
+    ) -> List[List[tuple]]:
+        """先在量化向量上粗排出 k × rescore_factor 个候选，再用float32向量精确重排"""
+        count = len(codes)
+        distances = np.empty((count, len(queries)), dtype=np.float32)
+        for start in range(0, count, self._SCAN_BLOCK):
+            end = min(start + self._SCAN_BLOCK, count)
+            distances[start:end] = -2 * quantizer.dot(codes[start:end], queries)
+        distances += norms[:, None]
+        distances[~mask] = np.inf
+
+        n_rescore = min(k * self._rescore_factor, n_candidates)
+        top_rows = []
+        for q, query in enumerate(queries):
+            candidates = np.sort(self._top_k(distances[:, q], n_rescore))
+            exact = ((vectors[candidates] - query) ** 2).sum(axis=1)
+            top = self._top_k(exact, k)
+            top_rows.append([(int(candidates[i]), float(exact[i])) for i in top])
+        return top_rows
+
+    def get(self, document_id=None) -> Dict[str, List]:
+        with self._lock:
+            if document_id is None:
+                cursor = self._conn.execute("SELECT id, document, metadata FROM rows ORDER BY row")
+            else:
+                cursor = self._conn.execute(
+                    "SELECT id, document, metadata FROM rows WHERE document_id = ? ORDER BY row",
+                    (document_id,)
+                )
+            rows = cursor.fetchall()
+        return {
+            "ids": [row[0] for row in rows],
+            "documents": [row[1] for row in rows],
+            "metadatas": [json.loads(row[2]) for row in rows]
+        }
+
+    def list_ids(self, document_id=None) -> List[str]:
+        with self._lock:
+            if document_id is None:
+                return [self._row_ids[row] for row in np.flatnonzero(self._alive[:self._count])]
+            return [
+                row[0] for row in self._conn.execute(
+                    "SELECT id FROM rows WHERE document_id = ? ORDER BY row", (document_id,)
+                )
+            ]
+
+    def iter_rows(self, batch_size=8192):
+        # 按行号分批读取：每批只在锁内复制，产出时不持有锁，导出期间写入和检索不被阻塞；
+        # 导出期间推迟压缩，行号保持不变，已删除的行不会再出现，新写入的行排在后面
+        with self._lock:
+            self._exports += 1
+        try:
+            last_row = -1
+            while True:
+                with self._lock:
+                    rows = self._conn.execute(
+                        "SELECT row, id, document, metadata FROM rows WHERE row > ? ORDER BY row LIMIT ?",
+                        (last_row, batch_size)
+                    ).fetchall()
+                    if not rows:
+                        return
+                    vectors = np.array(self._vectors[[row[0] for row in rows]], dtype=np.float32)
+                last_row = rows[-1][0]
+                yield (
+                    [row[1] for row in rows],
+                    vectors,
+                    [row[2] for row in rows],
+                    [json.loads(row[3]) for row in rows]
+                )
+        finally:
+            with self._lock:
+                self._exports -= 1
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._id_to_row)
+
+    def dimension(self) -> Optional[int]:
+        return self._dim
+
+    def persist(self) -> None:
+        if self._read_only:
+            return
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+            self._conn.commit()
+
+    def compact(self) -> None:
+        """
+        压缩：把存活的行按顺序写入新一代向量文件并重新编号
+
+        新文件写完后，行号更新和代号切换在同一个SQLite事务中提交，
+        中途崩溃时仍可按旧代号恢复。
+        """
+        self._check_writable()
+        with self._lock:
+            if self._vectors is None:
+                return
+            live_rows = np.flatnonzero(self._alive[:self._count])
+            new_count = len(live_rows)
+            new_generation = self._generation + 1
+            capacity = max(new_count, self._INITIAL_CAPACITY)
+
+            new_path = self._vectors_path(new_generation)
+            new_vectors = np.memmap(new_path, dtype=np.float32, mode="w+", shape=(capacity, self._dim))
+            block = 8192
+            for start in range(0, new_count, block):
+                end = min(start + block, new_count)
+                new_vectors[start:end] = self._vectors[live_rows[start:end]]
+            new_vectors.flush()
+            del new_vectors
+
+            # 行号只会变小，按升序更新不会与尚未移动的行冲突
+            self._conn.executemany(
+                "UPDATE rows SET row = ? WHERE row = ?",
+                [(new_row, int(old_row)) for new_row, old_row in enumerate(live_rows) if new_row != old_row]
+            )
+            self._set_meta("generation", new_generation)
+            self._set_meta("count", new_count)
+            self._conn.commit()
+
+            old_path = self._vectors_path(self._generation)
+            self._vectors = None
+            os.remove(old_path)
+            self._load()
+
+    def export_compacted(self, directory: Path) -> int:
+        """
+        把当前索引的存活行写成一个新的、紧凑的索引目录（可用 NumpyVectorIndex 直接打开）
+
+        Returns:
+            导出的块数
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self.persist()
+            conn = sqlite3.connect(str(directory / "rows.sqlite3"))
+            try:
+                self.create_schema(conn)
+                # rows表中只有存活行，按行号排序后与 live_rows 一一对应
+                live_rows = np.flatnonzero(self._alive[:self._count])
+                cursor = self._conn.execute("SELECT id, document_id, document, metadata FROM rows ORDER BY row")
+                conn.executemany(
+                    "INSERT INTO rows (row, id, document_id, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                    ((new_row, *row) for new_row, row in enumerate(cursor))
+                )
+                if self._dim is not None:
+                    vectors = np.memmap(
+                        directory / "vectors.0.f32", dtype=np.float32, mode="w+",
+                        shape=(max(len(live_rows), 1), self._dim)
+                    )
+                    block = 8192
+                    for start in range(0, len(live_rows), block):
+                        end = min(start + block, len(live_rows))
+                        vectors[start:end] = self._vectors[live_rows[start:end]]
+                    vectors.flush()
+                    del vectors
+                    conn.execute("INSERT INTO meta (key, value) VALUES ('dim', ?)", (json.dumps(self._dim),))
+                conn.execute("INSERT INTO meta (key, value) VALUES ('generation', '0')")
+                conn.execute("INSERT INTO meta (key, value) VALUES ('count', ?)", (json.dumps(len(live_rows)),))
+                conn.commit()
+            finally:
+                conn.close()
+            return len(live_rows)
+
+def create_vector_index(backend: str = VECTOR_BACKEND) -> VectorIndex:
+    """根据配置创建向量索引后端"""
+    if backend == "chroma":
+        return ChromaVectorIndex(VECTOR_DB_DIR)
+    if backend == "numpy":
+        return NumpyVectorIndex(NUMPY_INDEX_DIR)
+    raise ValueError(f"不支持的向量索引后端：{backend}")
+
+def evaluate_quantization(
+    directory: Path = NUMPY_INDEX_DIR,
+    modes: tuple = ("float16", "int8"),
+    n_queries: int = 200,
+    k: int = 10,
+    rescore_factor: int = VECTOR_RESCORE_FACTOR,
+    noise: float = 0.05,
+    seed: int = 0
+) -> List[Dict[str, Any]]:
+    """
+    评估量化模式相对float32精确检索的 Recall@k
+
+    查询向量从索引中已有的向量随机抽样并加入少量高斯噪声（模拟与原文相近的问题）。
+
+    Args:
+        directory: numpy后端的索引目录
+        modes: 需要评估的量化模式
+        n_queries: 查询数量
+        k: 每个查询返回的结果数
+        rescore_factor: 粗排候选数 = k × 该值
+        noise: 噪声标准差（按向量范数缩放）
+        seed: 随机种子
+
+    Returns:
+        每种模式一条结果：{"mode", "recall", "search_ms", "resident_bytes"}，第一条为float32基线
+    """
+    baseline = NumpyVectorIndex(directory, quantization="none")
+    live_rows = np.flatnonzero(baseline._alive[:baseline._count])
+    if len(live_rows) == 0:
+        raise ValueError(f"索引为空：{directory}")
+
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(live_rows, size=min(n_queries, len(live_rows)), replace=False)
+    queries = np.asarray(baseline._vectors[np.sort(sample)], dtype=np.float32)
+    scale = np.linalg.norm(queries, axis=1, keepdims=True) / np.sqrt(queries.shape[1])
+    queries = queries + rng.standard_normal(queries.shape).astype(np.float32) * noise * scale
+
+    def run(index: NumpyVectorIndex) -> tuple:
+        started = time.perf_counter()
+        ids = [[r["id"] for r in index.search([query.tolist()], k)[0]] for query in queries]
+        return ids, (time.perf_counter() - started) * 1000 / len(queries)
+
+    expected, baseline_ms = run(baseline)
+    results = [{
+        "mode": "none",
+        "recall": 1.0,
+        "search_ms": baseline_ms,
+        "resident_bytes": len(live_rows) * baseline._dim * 4
+    }]
+    for mode in modes:
+        index = NumpyVectorIndex(directory, quantization=mode, rescore_factor=rescore_factor)
+        actual, search_ms = run(index)
+        hits = sum(len(set(e) & set(a)) for e, a in zip(expected, actual))
+        results.append({
+            "mode": mode,
+            "recall": hits / sum(len(e) for e in expected),
+            "search_ms": search_ms,
+            "resident_bytes": len(live_rows) * baseline._dim * np.dtype(index._quantizer.dtype).itemsize
+        })
+    return results
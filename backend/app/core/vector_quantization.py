@@ -0,0 +1,106 @@
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import Optional
+
+QUANTIZATION_MODES = ("none", "float16", "int8")
+
+class Quantizer(ABC):
+    """
+    向量量化器
+
+    量化后的编码只用于近似的内积计算（粗排），精确得分仍由float32原始向量计算。
+    """
+    dtype = None
+
+    @property
+    def fitted(self) -> bool:
+        return True
+
+    def fit(self, vectors: np.ndarray) -> None:
+        """根据样本向量确定量化参数"""
+
+    def covers(self, vectors: np.ndarray) -> bool:
+        """判断新向量是否落在当前量化范围内（否则需要重新拟合）"""
+        return True
+
+    @abstractmethod
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """将float32向量编码为量化表示"""
+
+    @abstractmethod
+    def dot(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """
+        计算量化向量与查询向量的近似内积
+
+        Args:
+            codes: 量化编码，形状 (n, dim)
+            queries: float32查询向量，形状 (m, dim)
+
+        Returns:
+            近似内积矩阵，形状 (n, m)
+        """
+
+class Float16Quantizer(Quantizer):
+    """半精度存储，内存占用为float32的一半"""
+    dtype = np.float16
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float16)
+
+    def dot(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        # NumPy的float16矩阵乘法没有BLAS加速，先转回float32再计算
+        return codes.astype(np.float32) @ queries.T
+
+class Int8Quantizer(Quantizer):
+    """
+    按维度的int8标量量化，内存占用为float32的四分之一
+
+    每个维度按 [min, max] 均匀划分为256级：x ≈ min + scale × (code + 128)
+    """
+    dtype = np.int8
+
+    def __init__(self):
+        self._min: Optional[np.ndarray] = None
+        self._max: Optional[np.ndarray] = None
+        self._scale: Optional[np.ndarray] = None
+
+    @property
+    def fitted(self) -> bool:
+        return self._min is not None
+
+    def fit(self, vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        low = vectors.min(axis=0)
+        high = vectors.max(axis=0)
+        if self._min is not None and len(self._min) == len(low):
+            # 只扩展不收缩，避免已有向量超出范围
+            low = np.minimum(low, self._min)
+            high = np.maximum(high, self._max)
+        self._min = low
+        self._max = high
+        self._scale = np.maximum(high - low, 1e-12) / 255
+
+    def covers(self, vectors: np.ndarray) -> bool:
+        if not self.fitted:
+            return False
+        return bool((vectors >= self._min).all() and (vectors <= self._max).all())
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        levels = np.rint((np.asarray(vectors, dtype=np.float32) - self._min) / self._scale)
+        return (np.clip(levels, 0, 255) - 128).astype(np.int8)
+
+    def dot(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        # x·q = min·q + (code + 128)·(scale ⊙ q)
+        scaled = queries * self._scale
+        offset = queries @ self._min + 128 * scaled.sum(axis=1)
+        return codes.astype(np.float32) @ scaled.T + offset[None, :]
+
+def create_quantizer(mode: str) -> Optional[Quantizer]:
+    """根据模式名创建量化器，"none" 返回None"""
+    if mode == "none":
+        return None
+    if mode == "float16":
+        return Float16Quantizer()
+    if mode == "int8":
+        return Int8Quantizer()
+    raise ValueError(f"不支持的量化模式：{mode}")
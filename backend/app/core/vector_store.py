@@ -1,73 +1,398 @@
-import chromadb
-from chromadb.config import Settings
-from typing import List, Dict, Any, Optional
-from app.config import VECTOR_DB_DIR
+import hashlib
+import threading
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Iterable, Iterator, Optional
+from app.config import (
+    VECTOR_PERSIST_MODE,
+    VECTOR_PERSIST_INTERVAL,
+    VECTOR_PERSIST_MAX_PENDING,
+    SERVER_ROLE,
+    SNAPSHOT_DIR,
+    SNAPSHOT_POLL_INTERVAL,
+    SNAPSHOT_MIN_INTERVAL
+)
 from app.core.embedding import Embedding
+from app.core.vector_index import VectorIndex, NumpyVectorIndex, create_vector_index
+from app.core.index_snapshot import SnapshotVectorIndex, publish_snapshot
+from app.core.index_archive import (
+    write_archive,
+    read_manifest,
+    verify_archive,
+    check_compatible,
+    check_contents,
+    read_documents,
+    iter_archive
+)
+from app.core.document_catalog import DocumentCatalog
+from app.core.answer_cache import AnswerCache
+from app.core.lexical_index import LexicalIndex
+from app.core.metrics import stage_timer
+
+# 持久化方式
+PERSIST_MODES = ("per_write", "grouped", "on_shutdown")
+# 进程角色
+SERVER_ROLES = ("standalone", "writer", "reader")
 
 class VectorStore:
     _instance = None
-    _client = None
-    _collection = None
+    _index: Optional[VectorIndex] = None
+    # 后台预热和第一个请求可能同时创建实例，索引只能加载一次
+    _init_lock = threading.Lock()
     
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
+            with cls._init_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
         return cls._instance
     
     def __init__(self):
-        if self._client is None:
-            # 初始化Chroma客户端
-            self._client = chromadb.Client(
-                Settings(
-                    persist_directory=str(VECTOR_DB_DIR),
-                    anonymized_telemetry=False
-                )
-            )
-            # 获取或创建集合
-            self._collection = self._client.get_or_create_collection(name="documents")
+        if self._index is not None:
+            return
+        with self._init_lock:
+            if self._index is not None:
+                return
+            if SERVER_ROLE not in SERVER_ROLES:
+                raise ValueError(f"不支持的进程角色：{SERVER_ROLE}")
+            if SERVER_ROLE == "reader":
+                # 查询进程只读映射写进程发布的最新快照
+                index = SnapshotVectorIndex(SNAPSHOT_DIR)
+            else:
+                # 按配置创建向量索引后端（chroma / numpy）
+                index = create_vector_index()
+                if SERVER_ROLE == "writer" and not isinstance(index, NumpyVectorIndex):
+                    raise ValueError("多进程部署需要numpy向量索引后端（VECTOR_BACKEND=numpy）")
             # 初始化嵌入模型
             self.embedding = Embedding()
+            # 用集合中已有的块构建BM25倒排索引
+            self.lexical_index = LexicalIndex()
+            existing = index.get()
+            self.lexical_index.add(existing["ids"], existing["documents"], existing["metadatas"])
+            
+            # 合并刷盘：写入只记录待刷盘的块数，由后台线程按间隔或数量阈值统一持久化
+            if VECTOR_PERSIST_MODE not in PERSIST_MODES:
+                raise ValueError(f"不支持的持久化方式：{VECTOR_PERSIST_MODE}")
+            self._persist_lock = threading.Lock()
+            self._pending_writes = 0
+            # 写进程的快照发布：发布需复制整个索引，与刷盘分开加锁，按最小间隔合并发布
+            self._publish_lock = threading.Lock()
+            self._unpublished = False
+            self._published_at = 0.0
+            self._stop_flusher = threading.Event()
+            self._closed = False
+            self._flusher = None
+            # 其余属性就绪后才设置索引，其他线程看到索引时实例已初始化完成
+            self._index = index
+            if SERVER_ROLE == "reader":
+                # 查询进程没有写入，改为定期检查并切换到新快照
+                self._flusher = threading.Thread(
+                    target=self._watch_snapshots,
+                    name="vector-store-snapshot-watcher",
+                    daemon=True
+                )
+                self._flusher.start()
+            elif VECTOR_PERSIST_MODE == "grouped":
+                self._flusher = threading.Thread(
+                    target=self._flush_loop,
+                    name="vector-store-flusher",
+                    daemon=True
+                )
+                self._flusher.start()
     
-    def add_documents(self, document_id: str, chunks: List[tuple[str, int]]) -> None:
+    def _flush_loop(self) -> None:
+        while not self._stop_flusher.wait(VECTOR_PERSIST_INTERVAL):
+            if self._pending_writes:
+                self.flush()
+    
+    def _watch_snapshots(self) -> None:
+        while not self._stop_flusher.wait(SNAPSHOT_POLL_INTERVAL):
+            try:
+                self.refresh_snapshot()
+            except Exception as e:
+                # 快照可能正被清理，下次轮询时重试
+                print(f"切换索引快照失败：{e}")
+    
+    def refresh_snapshot(self) -> bool:
+        """
+        查询进程切换到写进程发布的最新快照
+        
+        切换后用新快照重建BM25索引并清空答案缓存（缓存中的答案可能引用了已变化的文档）。
+        
+        Returns:
+            是否切换到了新版本
+        """
+        if not isinstance(self._index, SnapshotVectorIndex) or not self._index.refresh():
+            return False
+        existing = self._index.get()
+        self.lexical_index.rebuild(existing["ids"], existing["documents"], existing["metadatas"])
+        AnswerCache().clear()
+        return True
+    
+    def publish_snapshot(self) -> Optional[int]:
+        """
+        写进程持久化当前索引并发布为新快照
+        
+        导出快照时只持有索引自身的锁，不阻塞入库任务记录写入和刷盘。
+        
+        Returns:
+            新快照的版本号，非写进程返回None
+        """
+        if SERVER_ROLE != "writer":
+            return None
+        with self._publish_lock:
+            # 先清除标记：导出期间的新写入会重新标记，留给下一次发布
+            self._unpublished = False
+            try:
+                version = publish_snapshot(self._index, SNAPSHOT_DIR)
+            except BaseException:
+                self._unpublished = True
+                raise
+            self._published_at = time.monotonic()
+            return version
+    
+    def publish_if_due(self) -> Optional[int]:
+        """
+        写进程在有未发布的写入、且距上次发布已超过 SNAPSHOT_MIN_INTERVAL 秒时发布新快照
+        
+        发布要复制整个索引，查询进程切换后还要重建BM25索引，因此不在每次刷盘时发布，
+        而是在入库任务结束时和写进程轮询任务表时调用，期间的写入合并到一次发布中。
+        
+        Returns:
+            新快照的版本号，未发布时返回None
+        """
+        if SERVER_ROLE != "writer" or not self._unpublished:
+            return None
+        if time.monotonic() - self._published_at < SNAPSHOT_MIN_INTERVAL:
+            return None
+        return self.publish_snapshot()
+    
+    def _check_writable(self) -> None:
+        if SERVER_ROLE == "reader":
+            raise RuntimeError("查询进程不能写入向量库，入库和删除由写进程完成")
+    
+    def _record_writes(self, count: int) -> None:
+        """记录一次写入涉及的块数，并按持久化方式决定是否立即刷盘"""
+        if count == 0:
+            return
+        with self._persist_lock:
+            self._pending_writes += count
+            pending = self._pending_writes
+        self._unpublished = True
+        if self._closed or VECTOR_PERSIST_MODE == "per_write" or (
+            VECTOR_PERSIST_MODE == "grouped" and pending >= VECTOR_PERSIST_MAX_PENDING
+        ):
+            self.flush()
+    
+    def flush(self) -> int:
+        """
+        立即持久化所有未刷盘的写入
+        
+        Returns:
+            本次刷盘涉及的块数
+        """
+        with self._persist_lock:
+            pending = self._pending_writes
+            self._pending_writes = 0
+            self._index.persist()
+        return pending
+    
+    @classmethod
+    def close(cls) -> None:
+        """停止后台刷盘线程并做最后一次刷盘（应用关闭时调用；未初始化时不做任何事）"""
+        store = cls._instance
+        if store is None or store._index is None:
+            return
+        # 关闭后仍在进行的写入（如未结束的入库任务）改为每次写入后立即刷盘
+        store._closed = True
+        store._stop_flusher.set()
+        if store._flusher is not None:
+            store._flusher.join()
+        store.flush()
+        # 写进程退出前发布尚未发布的写入
+        if store._unpublished:
+            store.publish_snapshot()
+    
+    @staticmethod
+    def iter_chunk_ids(document_id: str, chunks: Iterable[tuple[str, int]]) -> Iterator[tuple[str, tuple[str, int]]]:
+        """
+        根据块内容生成块ID，逐个产出 (块ID, 块)
+
+        ID由文档ID和文本哈希组成，插入或删除段落不会改变其他块的ID；
+        同一文档中重复出现的相同文本按出现次序追加序号。
+        """
+        occurrences: Dict[str, int] = {}
+        for chunk in chunks:
+            digest = hashlib.sha1(chunk[0].encode("utf-8")).hexdigest()[:16]
+            seen = occurrences.get(digest, 0)
+            occurrences[digest] = seen + 1
+            chunk_id = f"{document_id}_{digest}" if seen == 0 else f"{document_id}_{digest}_{seen}"
+            yield chunk_id, chunk
+
+    def get_chunk_pages(self, document_id: str) -> Dict[str, Any]:
+        """获取文档已有的块ID及其页码"""
+        existing = self._index.get(document_id)
+        return {
+            chunk_id: metadata.get("page_number")
+            for chunk_id, metadata in zip(existing["ids"], existing["metadatas"])
+        }
+
+    @staticmethod
+    def build_diff(
+        ids: List[str],
+        chunks: List[tuple[str, int]],
+        existing_pages: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        对比新分块与已有的块
+        
+        Args:
+            ids: 每个新块的ID（iter_chunk_ids 生成）
+            chunks: 新的文档块列表，每个元素是(文本, 页码)
+            existing_pages: get_chunk_pages 的结果
+            
+        Returns:
+            {
+                "ids": 每个新块的ID,
+                "added": 需要编码并写入的块下标,
+                "updated": 内容未变但页码变化的块下标,
+                "removed": 需要删除的已有块ID,
+                "reused": 可直接复用的块数
+            }
+        """
+        added = []
+        updated = []
+        for i, (chunk_id, (_, page_num)) in enumerate(zip(ids, chunks)):
+            if chunk_id not in existing_pages:
+                added.append(i)
+            elif existing_pages[chunk_id] != page_num:
+                updated.append(i)
+
+        new_ids = set(ids)
+        return {
+            "ids": ids,
+            "added": added,
+            "updated": updated,
+            "removed": [chunk_id for chunk_id in existing_pages if chunk_id not in new_ids],
+            "reused": len(ids) - len(added)
+        }
+
+    def diff_document(self, document_id: str, chunks: List[tuple[str, int]]) -> Dict[str, Any]:
+        """对比文档的新分块与向量库中已有的块，返回值见 build_diff"""
+        ids = [chunk_id for chunk_id, _ in self.iter_chunk_ids(document_id, chunks)]
+        return self.build_diff(ids, chunks, self.get_chunk_pages(document_id))
+
+    def add_documents(
+        self,
+        document_id: str,
+        chunks: List[tuple[str, int]],
+        embeddings: Optional[List[List[float]]] = None,
+        diff: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, int]:
         """
-        添加文档块到向量存储
+        添加或增量更新文档块
+        
+        只编码并写入新增的块，删除已不存在的块，内容未变的块原地更新页码。
         
         Args:
             document_id: 文档ID
             chunks: 文档块列表，每个元素是(文本, 页码)
+            embeddings: 可选，与 diff["added"] 中的块一一对应的已计算好的嵌入向量
+            diff: 可选，diff_document 的结果（未传入时在此计算）
+            
+        Returns:
+            写入报告：块总数、复用数、重新编码数、删除数、更新页码数
         """
-        # 先删除该文档已有的所有块
-        self.delete_document(document_id)
+        self._check_writable()
+        if diff is None:
+            diff = self.diff_document(document_id, chunks)
+        ids = diff["ids"]
         
-        # 准备数据
-        ids = []
-        documents = []
-        metadatas = []
+        # 删除已不存在的块
+        self.remove_chunks(document_id, diff["removed"])
         
-        for i, (text, page_num) in enumerate(chunks):
-            chunk_id = f"{document_id}_chunk_{i}"
-            ids.append(chunk_id)
-            documents.append(text)
-            metadatas.append({
-                "document_id": document_id,
-                "page_number": page_num
-            })
+        # 编码并写入新增的块，内容未变的块只更新页码
+        added = [(ids[i], chunks[i]) for i in diff["added"]]
+        updated = [(ids[i], chunks[i]) for i in diff["updated"]]
+        if added and embeddings is None:
+            embeddings = self.embedding.embed_texts([chunk[0] for _, chunk in added])
+        self.write_chunk_batch(document_id, added, embeddings or [], updated)
         
-        # 生成嵌入向量
-        embeddings = self.embedding.embed_texts(documents)
+        return {
+            "chunks_total": len(ids),
+            "reused": diff["reused"],
+            "embedded": len(added),
+            "deleted": len(diff["removed"]),
+            "metadata_updated": len(updated)
+        }
+    
+    def write_chunk_batch(
+        self,
+        document_id: str,
+        added: List[tuple[str, tuple[str, int]]],
+        embeddings: List[List[float]],
+        updated: List[tuple[str, tuple[str, int]]]
+    ) -> None:
+        """
+        写入文档的一批块：新增的块写入，内容未变但页码变化的块原地更新页码
+        
+        入库任务每编码完一批就调用一次，不需要整篇文档的块和向量同时在内存中。
         
-        # 添加到集合
-        self._collection.add(
-            ids=ids,
-            documents=documents,
-            metadatas=metadatas,
-            embeddings=embeddings
-        )
+        Args:
+            document_id: 文档ID
+            added: 新增的 (块ID, (文本, 页码))，与 embeddings 一一对应
+            embeddings: 新增块的嵌入向量
+            updated: 内容未变但页码变化的 (块ID, (文本, 页码))
+        """
+        self._check_writable()
         
-        # 持久化
-        self._client.persist()
+        def metadata(chunk: tuple[str, int]) -> Dict[str, Any]:
+            return {"document_id": document_id, "page_number": chunk[1]}
+        
+        updated_ids = [chunk_id for chunk_id, _ in updated]
+        updated_metadatas = [metadata(chunk) for _, chunk in updated]
+        self._index.update_metadata(updated_ids, updated_metadatas)
+        
+        added_ids = [chunk_id for chunk_id, _ in added]
+        documents = [chunk[0] for _, chunk in added]
+        metadatas = [metadata(chunk) for _, chunk in added]
+        if added_ids:
+            self._index.add(
+                ids=added_ids,
+                embeddings=embeddings,
+                documents=documents,
+                metadatas=metadatas
+            )
+        
+        # 记录待刷盘的写入
+        self._record_writes(len(updated_ids) + len(added_ids))
+        
+        # 同步更新BM25索引
+        self.lexical_index.update_metadata(updated_ids, updated_metadatas)
+        self.lexical_index.add(added_ids, documents, metadatas)
+        
+        # 有任何变化时，引用了该文档的缓存答案已过期
+        if added_ids or updated_ids:
+            AnswerCache().invalidate_document(document_id)
     
-    def search(self, query: str, n_results: int = 3, document_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    def remove_chunks(self, document_id: str, chunk_ids: List[str]) -> None:
+        """删除文档中已不存在的块（增量更新的最后一步）"""
+        if not chunk_ids:
+            return
+        self._check_writable()
+        self._index.delete(ids=chunk_ids)
+        self._record_writes(len(chunk_ids))
+        for chunk_id in chunk_ids:
+            self.lexical_index.delete_chunk(chunk_id)
+        AnswerCache().invalidate_document(document_id)
+    
+    def search(
+        self,
+        query: str,
+        n_results: int = 3,
+        document_ids: Optional[List[str]] = None,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[Dict[str, Any]]:
         """
         搜索与查询相关的文档块
         
@@ -75,49 +400,56 @@ class VectorStore:
             query: 查询文本
             n_results: 返回结果数量
             document_ids: 可选，指定文档ID列表，只在这些文档中搜索
+            query_embedding: 可选，已计算好的查询向量（传入时不再重复编码）
             
         Returns:
             搜索结果列表，每个结果包含文档块信息和元数据
         """
         # 生成查询向量
-        query_embedding = self.embedding.embed_text(query)
-        
-        # 构建过滤条件
-        where = None
-        if document_ids:
-            where = {"document_id": {"$in": document_ids}}
+        if query_embedding is None:
+            query_embedding = self.embedding.embed_text(query)
         
         # 搜索
-        results = self._collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results,
-            where=where
-        )
-        
-        # 整理结果
-        formatted_results = []
-        for i in range(len(results["ids"][0])):
-            formatted_results.append({
-                "id": results["ids"][0][i],
-                "document": results["documents"][0][i],
-                "metadata": results["metadatas"][0][i],
-                "distance": results["distances"][0][i]
-            })
-        
-        return formatted_results
+        with stage_timer("query", "vector_search"):
+            return self._index.search(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                document_ids=document_ids
+            )[0]
+    
+    def search_many(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 3,
+        document_ids: Optional[List[str]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        一次检索多个查询向量（索引对整批查询只扫描一遍）
+        
+        Returns:
+            与 query_embeddings 一一对应的搜索结果列表
+        """
+        if not query_embeddings:
+            return []
+        with stage_timer("query", "vector_search"):
+            return self._index.search(
+                query_embeddings=query_embeddings,
+                n_results=n_results,
+                document_ids=document_ids
+            )
     
     def delete_document(self, document_id: str) -> None:
         """删除指定文档的所有块"""
-        self._collection.delete(
-            where={"document_id": document_id}
-        )
-        self._client.persist()
+        self._check_writable()
+        chunk_count = len(self._index.list_ids(document_id))
+        self._index.delete(document_id=document_id)
+        self._record_writes(chunk_count)
+        self.lexical_index.delete_document(document_id)
+        AnswerCache().invalidate_document(document_id)
     
     def get_document_ids(self) -> List[str]:
         """获取所有文档ID"""
-        results = self._collection.get(
-            include=[]  # 只获取ID和元数据
-        )
+        results = self._index.get()
         
         # 从元数据中提取唯一的document_id
         document_ids = set()
@@ -126,3 +458,79 @@ class VectorStore:
                 document_ids.add(metadata["document_id"])
         
         return list(document_ids)
+    
+    def export_archive(self, directory: Path, dtype: str = "float32") -> Dict[str, Any]:
+        """
+        把向量库导出为可移植的归档（格式见 app/core/index_archive.py）
+        
+        查询进程导出的是当前映射的快照。
+        
+        Returns:
+            归档清单
+        """
+        if SERVER_ROLE != "reader":
+            self.flush()
+        return write_archive(self._index, directory, dtype=dtype)
+    
+    def import_archive(self, directory: Path, verify: bool = True, force: bool = False) -> Dict[str, Any]:
+        """
+        从归档批量导入块和文档目录，直接写入归档中的向量，不调用嵌入模型
+        
+        归档中的文档先删除已有的块再写入（相当于整体替换这些文档），其他文档不受影响。
+        删除之前先检查归档内容与清单、向量维度与当前索引一致，检查不通过时索引不做任何修改。
+        
+        Args:
+            directory: 归档目录
+            verify: 是否先校验各文件的SHA-256
+            force: 嵌入模型与当前配置不一致时仍然导入
+            
+        Returns:
+            导入报告：文档数、块数、耗时（秒）
+            
+        Raises:
+            FileNotFoundError: 归档不存在
+            IndexArchiveError: 归档校验失败、内容与清单不符、向量维度或嵌入模型不一致
+        """
+        self._check_writable()
+        started = time.perf_counter()
+        manifest = read_manifest(directory)
+        if not force:
+            check_compatible(manifest)
+        if verify:
+            verify_archive(directory, manifest)
+        check_contents(directory, manifest, self._index.dimension())
+        documents = read_documents(directory)
+        
+        for record in documents:
+            self._index.delete(document_id=record["id"])
+            self.lexical_index.delete_document(record["id"])
+        
+        chunk_count = 0
+        with stage_timer("ingestion", "import"):
+            for ids, embeddings, texts, metadatas in iter_archive(directory):
+                self._index.add(ids=ids, embeddings=embeddings, documents=texts, metadatas=metadatas)
+                self.lexical_index.add(ids, texts, metadatas)
+                chunk_count += len(ids)
+        self._record_writes(chunk_count)
+        self.flush()
+        
+        catalog = DocumentCatalog()
+        for record in documents:
+            if "filename" not in record:
+                continue
+            catalog.upsert(
+                record["id"],
+                filename=record["filename"],
+                size=record["size"],
+                content_hash=record["content_hash"],
+                page_count=record["page_count"],
+                chunk_count=record["chunk_count"],
+                created_at=record["created_at"]
+            )
+        # 缓存中的答案可能引用了被替换的文档
+        AnswerCache().clear()
+        return {
+            "documents": len(documents),
+            "chunks": chunk_count,
+            "seconds": round(time.perf_counter() - started, 3)
+        }
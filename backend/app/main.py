@@ -1,4 +1,5 @@
-from fastapi import FastAPI
+import threading
+from fastapi import FastAPI, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pathlib import Path
@@ -7,6 +8,15 @@ from pathlib import Path
 from app.api.documents import router as documents_router
 from app.api.queries import router as queries_router
 from app.api.settings import router as settings_router
+from app.api.admin import router as admin_router
+from app.core.generation import Generation
+from app.core.ingestion_jobs import IngestionJobs
+from app.core.vector_store import VectorStore
+from app.core.embedding import Embedding
+from app.core.metrics import render_latest
+from app.core.executors import shutdown_stages
+from app.core.runtime_settings import RuntimeSettings
+from app.config import SERVER_ROLE
 
 # 创建FastAPI应用
 app = FastAPI(title="轻量化RAG知识库问答系统")
@@ -24,6 +34,44 @@ app.add_middleware(
 app.include_router(documents_router, prefix="/api/documents", tags=["documents"])
 app.include_router(queries_router, prefix="/api/queries", tags=["queries"])
 app.include_router(settings_router, prefix="/api/settings", tags=["settings"])
+app.include_router(admin_router, prefix="/api/admin", tags=["admin"])
+
+# Prometheus指标（需在挂载根路径的静态文件之前注册）
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    content, content_type = render_latest()
+    return Response(content=content, media_type=content_type)
+
+# 健康检查接口（需在挂载根路径的静态文件之前注册）
+@app.get("/health")
+async def health_check():
+    return {"status": "healthy"}
+
+# 就绪检查：模型和索引在后台预热完成前返回503（需在挂载根路径的静态文件之前注册）
+_warm_up_error = None
+
+@app.get("/ready", include_in_schema=False)
+async def readiness_check():
+    if _warm_up_error is not None:
+        return Response(content=f"warm-up failed: {_warm_up_error}", status_code=503)
+    if not Embedding.is_ready():
+        return Response(content="warming up", status_code=503)
+    return {"status": "ready"}
+
+def _warm_up() -> None:
+    """加载向量索引和嵌入模型并编码一次样例文本，避免第一个查询承担加载耗时"""
+    global _warm_up_error
+    try:
+        VectorStore()
+        Embedding.warm_up()
+        # 恢复上次未完成的入库任务、为未登记的文件补做入库（多进程部署时由写进程负责）；
+        # 放在预热之后，避免入库任务与预热同时初始化向量库
+        if SERVER_ROLE != "reader":
+            IngestionJobs().resume()
+            IngestionJobs().ingest_unregistered()
+    except Exception as e:
+        _warm_up_error = str(e)
+        print(f"❌ 预热失败：{e}")
 
 # 挂载静态文件
 frontend_dir = Path(__file__).parent.parent.parent / "frontend"
@@ -37,10 +85,25 @@ if frontend_dir.exists():
 else:
     print(f"⚠️  警告：前端目录 {frontend_dir} 不存在")
 
-# 健康检查接口
-@app.get("/health")
-async def health_check():
-    return {"status": "healthy"}
+# 应用启动时在后台预热，服务立即开始接受请求，/ready 在预热完成后才返回200
+@app.on_event("startup")
+async def startup():
+    threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
+    # 监视.env文件，其他进程通过设置接口修改的配置也能同步过来
+    RuntimeSettings().start_watching()
+
+# 应用关闭时释放共享资源
+@app.on_event("shutdown")
+async def shutdown():
+    RuntimeSettings().stop_watching()
+    # 停止入库线程池（未完成的任务下次启动时继续）
+    IngestionJobs().shutdown()
+    # 刷盘向量库中尚未持久化的写入
+    VectorStore.close()
+    # 停止查询链路各阶段的线程池
+    shutdown_stages()
+    # 关闭LLM客户端连接池
+    await Generation.aclose()
 
 # 在main.py中随便加一行注释，比如：
 # 这是一个测试修改，用于触发提交
\ No newline at end of file
@@ -0,0 +1,42 @@
+"""
+多进程部署中的写进程
+
+独占向量索引的写入：执行查询进程写入任务表的入库和删除任务，每次刷盘后发布新的
+只读索引快照（见 app/core/index_snapshot.py）。由 run.py 在 WORKERS > 1 时自动启动，
+也可单独运行（在 backend 目录下）：
+    SERVER_ROLE=writer VECTOR_BACKEND=numpy python -m app.writer
+"""
+import signal
+import threading
+from app.config import SERVER_ROLE
+from app.core.ingestion_jobs import IngestionJobs
+from app.core.vector_store import VectorStore
+from app.core.runtime_settings import RuntimeSettings
+
+
+def main() -> None:
+    if SERVER_ROLE != "writer":
+        raise SystemExit("写进程需要设置 SERVER_ROLE=writer")
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    # 启动时先发布一次快照，查询进程启动后即可映射
+    version = VectorStore().publish_snapshot()
+    print(f"✅ 已发布索引快照 v{version}")
+    jobs = IngestionJobs()
+    jobs.resume()
+    jobs.ingest_unregistered()
+    jobs.start_polling()
+    # 查询进程通过设置接口修改的配置（如入库线程数）写入.env后在这里生效
+    RuntimeSettings().start_watching()
+
+    stop.wait()
+    RuntimeSettings().stop_watching()
+    jobs.shutdown()
+    VectorStore.close()
+
+
+if __name__ == "__main__":
+    main()
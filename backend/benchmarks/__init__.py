@@ -0,0 +1,5 @@
+"""
+入库与检索热点路径的基准测试
+
+运行方式见 benchmarks/run.py。
+"""
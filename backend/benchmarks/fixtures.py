@@ -0,0 +1,145 @@
+"""
+基准测试用的确定性数据与假模型
+
+- synthetic_pages / synthetic_chunks：按种子生成的中英文混排文本
+- write_pdf：不依赖第三方库生成只含ASCII文本的PDF（标准字体不含中文字形）
+- FakeSentenceTransformer：由文本哈希决定向量的假嵌入模型，可替换 Embedding 中的真实模型
+"""
+import hashlib
+import random
+import re
+from pathlib import Path
+from typing import Dict, List
+import numpy as np
+
+_CHINESE_SENTENCES = [
+    "本系统支持上传PDF文档并基于文档内容回答问题。",
+    "检索阶段会先把问题编码为向量，再在向量库中查找最相似的文本块。",
+    "如果答案不在文档中，模型会明确说明无法回答，而不是编造内容。",
+    "文档入库在后台任务中完成，上传接口会立即返回任务编号。",
+    "混合检索把关键词得分和向量相似度按倒数排名融合，适合型号和错误码等精确查询。",
+    "每个文本块都记录了来源页码，回答时可以给出引用。",
+]
+_ENGLISH_SENTENCES = [
+    "The ingestion pipeline streams pages from a process pool while earlier pages are being embedded.",
+    "Error code E-1043 indicates that the upload exceeded the configured size limit.",
+    "Each chunk keeps the page number it came from so answers can cite their sources.",
+    "Version 2.1 reduced the average query latency by batching concurrent embeddings.",
+    "Deleting a document removes its chunks from both the vector index and the keyword index.",
+    "Answers are cached per question and invalidated when a cited document changes.",
+]
+_TOKEN_PATTERN = re.compile(r"[A-Za-z0-9]+|[^\sA-Za-z0-9]")
+
+
+def _wrap(paragraph: str, width: int) -> str:
+    return "\n".join(paragraph[i:i + width] for i in range(0, len(paragraph), width))
+
+
+def synthetic_pages(n_pages: int, seed: int = 0, english_only: bool = False) -> List[str]:
+    """生成按固定宽度折行、段落之间空一行的页面文本（模拟PDF抽取结果）"""
+    rng = random.Random(seed)
+    pages = []
+    for _ in range(n_pages):
+        paragraphs = []
+        for _ in range(rng.randint(3, 6)):
+            if not english_only and rng.random() < 0.6:
+                paragraph = "".join(rng.choice(_CHINESE_SENTENCES) for _ in range(rng.randint(2, 6)))
+                paragraphs.append(_wrap(paragraph, 40))
+            else:
+                paragraph = " ".join(rng.choice(_ENGLISH_SENTENCES) for _ in range(rng.randint(2, 6)))
+                paragraphs.append(_wrap(paragraph, 80))
+        pages.append("\n\n".join(paragraphs))
+    return pages
+
+
+def synthetic_chunks(document_index: int, n_chunks: int, seed: int = 0) -> List[tuple]:
+    """为一个文档生成 n_chunks 个互不相同的 (文本, 页码) 块"""
+    rng = random.Random(f"{seed}-{document_index}")
+    chunks = []
+    for i in range(n_chunks):
+        sentences = [rng.choice(_CHINESE_SENTENCES + _ENGLISH_SENTENCES) for _ in range(3)]
+        chunks.append((f"[doc {document_index} chunk {i}] " + " ".join(sentences), i // 5 + 1))
+    return chunks
+
+
+def _escape_pdf_text(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: Path, pages: List[str]) -> None:
+    """把每页文本写成一页PDF（Helvetica 10pt，每行一个文本对象，只支持ASCII）"""
+    objects: List[bytes] = []
+    page_ids = []
+    font_id = 3
+    objects.append(b"")  # 1: catalog，占位
+    objects.append(b"")  # 2: pages，占位
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    for text in pages:
+        lines = ["BT", "/F1 10 Tf", "12 TL", "50 790 Td"]
+        for line in text.encode("ascii", "ignore").decode().split("\n")[:64]:
+            lines.append(f"({_escape_pdf_text(line)}) Tj T*")
+        lines.append("ET")
+        stream = "\n".join(lines).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (font_id, content_id)
+        )
+        page_ids.append(len(objects))
+
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids)
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    Path(path).write_bytes(bytes(output))
+
+
+class FakeSentenceTransformer:
+    """
+    确定性的假嵌入模型
+
+    向量由文本的哈希作为随机种子生成并归一化，相同文本总是得到相同向量；
+    tokenizer 把每个英文/数字词和每个其他非空白字符计为一个token。
+    只实现了 Embedding 用到的 encode / tokenizer / max_seq_length。
+    """
+    max_seq_length = 256
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _vector(self, text: str) -> np.ndarray:
+        seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def encode(self, sentences, **kwargs) -> np.ndarray:
+        if isinstance(sentences, str):
+            return self._vector(sentences)
+        if not sentences:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack([self._vector(text) for text in sentences])
+
+    def tokenizer(self, texts: List[str], **kwargs) -> Dict[str, List[List[int]]]:
+        return {"input_ids": [list(range(len(_TOKEN_PATTERN.findall(text)))) for text in texts]}
+
+
+def install_fake_embedding(dim: int = 384):
+    """让 Embedding 单例使用假模型（需在首次创建 Embedding 之前调用），返回该单例"""
+    from app.core.embedding import Embedding
+
+    embedding = Embedding.__new__(Embedding)
+    embedding._model = FakeSentenceTransformer(dim)
+    embedding._cache = None
+    return embedding
@@ -0,0 +1,235 @@
+"""
+入库与检索热点路径的基准测试
+
+在临时数据目录（QA_DATA_DIR）中离线运行，分阶段计时：
+    extract  解析合成PDF（DataCollection.iter_pdf_pages）
+    chunk    分块（字符分块 / token分块）
+    embed    编码（Embedding.embed_texts，默认使用确定性的假模型）
+    upsert   写入向量库（VectorStore.add_documents，向量预先算好），以及未变化文档的增量重写
+    search   不同语料规模和文档过滤比例下的检索延迟（VectorStore.search）
+
+所有指标都是耗时（毫秒，越小越好），结果写成JSON；指定 --baseline 时与基线对比，
+任何指标变慢超过 --threshold 即以非零状态退出。
+
+运行（在 backend 目录下）：
+    python -m benchmarks.run --output benchmarks/results/latest.json
+    python -m benchmarks.run --baseline benchmarks/results/baseline.json --threshold 0.15
+    python -m benchmarks.run --real-embedding --sizes 1000 5000   # 使用真实的嵌入模型
+"""
+import argparse
+import atexit
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+# 必须在导入 app 之前指定数据目录，避免写入真实数据
+_DATA_DIR = tempfile.mkdtemp(prefix="qa-bench-")
+os.environ["QA_DATA_DIR"] = _DATA_DIR
+atexit.register(shutil.rmtree, _DATA_DIR, ignore_errors=True)
+
+
+def _median_ms(fn: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def bench_extract(args, results: Dict[str, float]) -> None:
+    from app.config import DOCUMENTS_DIR
+    from app.core.data_collection import DataCollection
+    from benchmarks.fixtures import synthetic_pages, write_pdf
+
+    pages = synthetic_pages(args.pages, seed=args.seed, english_only=True)
+    write_pdf(DOCUMENTS_DIR / "bench-extract.pdf", pages)
+    # 预热（进程池在首次并行解析时创建）
+    list(DataCollection.iter_pdf_pages("bench-extract"))
+    ms = _median_ms(lambda: list(DataCollection.iter_pdf_pages("bench-extract")), args.repeat)
+    results["extract.ms_per_page"] = ms / args.pages
+
+
+def bench_chunk(args, results: Dict[str, float]) -> List[tuple]:
+    from app.config import CHUNK_OVERLAP_TOKENS
+    from app.core.data_preprocessing import DataPreprocessing
+    from app.core.embedding import Embedding
+    from benchmarks.fixtures import synthetic_pages
+
+    pages = synthetic_pages(args.pages, seed=args.seed)
+    embedding = Embedding()
+
+    ms = _median_ms(lambda: list(DataPreprocessing.iter_chunks(pages)), args.repeat)
+    results["chunk.chars.ms_per_page"] = ms / len(pages)
+
+    def token_chunks():
+        return list(DataPreprocessing.iter_token_chunks(
+            pages, embedding.count_tokens, embedding.max_tokens, CHUNK_OVERLAP_TOKENS
+        ))
+
+    ms = _median_ms(token_chunks, args.repeat)
+    results["chunk.tokens.ms_per_page"] = ms / len(pages)
+    return list(DataPreprocessing.iter_chunks(pages))
+
+
+def bench_embed(args, results: Dict[str, float], chunks: List[tuple]) -> None:
+    from app.core.embedding import Embedding
+
+    texts = [text for text, _ in chunks]
+    embedding = Embedding()
+    ms = _median_ms(lambda: embedding.embed_texts(texts, use_cache=False), args.repeat)
+    results["embed.ms_per_chunk"] = ms / len(texts)
+
+
+def bench_store(args, results: Dict[str, float]) -> None:
+    from app.core.embedding import Embedding
+    from app.core.vector_store import VectorStore
+    from benchmarks.fixtures import synthetic_chunks
+
+    embedding = Embedding()
+    store = VectorStore()
+    chunks_per_document = args.chunks_per_document
+    documents = 0
+    queries = [text for text, _ in synthetic_chunks(-1, args.queries, seed=args.seed + 1)]
+    query_embeddings = embedding.embed_texts(queries, use_cache=False)
+
+    for size in sorted(args.sizes):
+        # 把语料扩充到目标规模，只对写入计时（向量预先算好）
+        upsert_ms = 0.0
+        added = 0
+        while documents * chunks_per_document < size:
+            chunks = synthetic_chunks(documents, chunks_per_document, seed=args.seed)
+            vectors = embedding.embed_texts([text for text, _ in chunks], use_cache=False)
+            started = time.perf_counter()
+            store.add_documents(f"bench-doc-{documents}", chunks, embeddings=vectors)
+            upsert_ms += (time.perf_counter() - started) * 1000
+            added += len(chunks)
+            documents += 1
+        store.flush()
+        if added:
+            results[f"upsert.n{size}.ms_per_chunk"] = upsert_ms / added
+
+        # 内容未变的文档重新入库（只比对，不写入向量）
+        unchanged = synthetic_chunks(0, chunks_per_document, seed=args.seed)
+        results[f"upsert.n{size}.unchanged_document_ms"] = _median_ms(
+            lambda: store.add_documents("bench-doc-0", unchanged), args.repeat
+        )
+
+        # 不同过滤比例下的检索延迟
+        for selectivity in args.selectivities:
+            if selectivity >= 1:
+                document_ids = None
+            else:
+                n_documents = max(1, round(documents * selectivity))
+                document_ids = [f"bench-doc-{i}" for i in range(n_documents)]
+            latencies = []
+            for query, query_embedding in zip(queries, query_embeddings):
+                started = time.perf_counter()
+                store.search(query, n_results=args.top_k, document_ids=document_ids, query_embedding=query_embedding)
+                latencies.append((time.perf_counter() - started) * 1000)
+            label = f"search.n{size}.filter{selectivity:g}"
+            results[f"{label}.p50_ms"] = _percentile(latencies, 0.5)
+            results[f"{label}.p95_ms"] = _percentile(latencies, 0.95)
+
+
+def compare(
+    results: Dict[str, float],
+    baseline: Dict[str, float],
+    threshold: float,
+    min_delta_ms: float
+) -> List[str]:
+    """返回比基线慢超过阈值（且绝对差值超过 min_delta_ms，过滤亚毫秒级的抖动）的指标说明"""
+    regressions = []
+    print(f"\n{'metric':<44} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        before, after = baseline[name], results[name]
+        change = (after - before) / before if before else 0.0
+        regressed = change > threshold and after - before > min_delta_ms
+        flag = "  <-- 变慢" if regressed else ""
+        print(f"{name:<44} {before:>10.3f} {after:>10.3f} {change:>+8.1%}{flag}")
+        if regressed:
+            regressions.append(f"{name}: {before:.3f} -> {after:.3f} ({change:+.1%})")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="入库与检索热点路径的基准测试")
+    parser.add_argument("--stages", nargs="+", default=["extract", "chunk", "embed", "store"],
+                        choices=["extract", "chunk", "embed", "store"])
+    parser.add_argument("--pages", type=int, default=100, help="合成PDF和文本语料的页数")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="检索测试的语料规模（块数）")
+    parser.add_argument("--selectivities", type=float, nargs="+", default=[1.0, 0.25, 0.1, 0.05, 0.01],
+                        help="文档过滤比例（1表示不过滤）")
+    parser.add_argument("--chunks-per-document", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5, help="每个阶段重复次数（取中位数）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--real-embedding", action="store_true", help="使用真实的嵌入模型（默认使用假模型）")
+    parser.add_argument("--output", help="结果JSON的输出路径")
+    parser.add_argument("--baseline", help="用于对比的基线JSON")
+    parser.add_argument("--threshold", type=float, default=0.15, help="允许的最大变慢比例")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="低于该绝对差值（毫秒）的变化不算变慢")
+    args = parser.parse_args()
+
+    from app.config import VECTOR_BACKEND, VECTOR_QUANTIZATION, EMBEDDING_MODEL, EMBEDDING_BACKEND
+    if not args.real_embedding:
+        from benchmarks.fixtures import install_fake_embedding
+        install_fake_embedding()
+
+    results: Dict[str, float] = {}
+    if "extract" in args.stages:
+        bench_extract(args, results)
+    chunks = bench_chunk(args, results) if "chunk" in args.stages or "embed" in args.stages else []
+    if "embed" in args.stages:
+        bench_embed(args, results, chunks)
+    if "store" in args.stages:
+        bench_store(args, results)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "vector_backend": VECTOR_BACKEND,
+            "vector_quantization": VECTOR_QUANTIZATION,
+            "embedding": EMBEDDING_MODEL if args.real_embedding else "fake",
+            "embedding_backend": EMBEDDING_BACKEND if args.real_embedding else "fake",
+            "args": {name: value for name, value in vars(args).items() if name not in ("output", "baseline")},
+        },
+        "results": results,
+    }
+
+    print(f"{'metric':<44} {'ms':>10}")
+    for name, value in results.items():
+        print(f"{name:<44} {value:>10.3f}")
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))["results"]
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} 项指标变慢超过 {args.threshold:.0%}：")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
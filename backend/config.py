@@ -4,25 +4,146 @@ from pathlib import Path
 
 # 加载环境变量
 load_dotenv()
+# 设置接口修改的配置写入的.env文件（backend目录下）
+ENV_FILE = Path(__file__).parent / ".env"
 
-# 项目根目录
-ROOT_DIR = Path(__file__).parent.parent.parent
+# 项目根目录（本文件位于 backend/ 下）
+ROOT_DIR = Path(__file__).parent.parent
 
-# 数据存储目录
-DATA_DIR = ROOT_DIR / "data"
+# 数据存储目录（可通过 QA_DATA_DIR 指向其他目录，如基准测试使用的临时目录）
+DATA_DIR = Path(os.getenv("QA_DATA_DIR", ROOT_DIR / "data"))
 DOCUMENTS_DIR = DATA_DIR / "documents"
 VECTOR_DB_DIR = DATA_DIR / "vector_db"
+DOCUMENT_CATALOG_DB = DATA_DIR / "documents.sqlite3"  # 文档目录（入库时写入的文档元数据）
+
+# 向量索引后端：chroma（默认）或 numpy（内存映射的float32矩阵）
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+NUMPY_INDEX_DIR = VECTOR_DB_DIR / "numpy"
+NUMPY_INDEX_COMPACT_RATIO = float(os.getenv("NUMPY_INDEX_COMPACT_RATIO", 0.2))  # 已删除行占比超过该值时压缩
+# 按文档过滤时，所选文档的行数占比不超过该值则只计算这些行（按文档的行号索引预过滤），否则全量扫描后屏蔽
+NUMPY_INDEX_PREFILTER_RATIO = float(os.getenv("NUMPY_INDEX_PREFILTER_RATIO", 0.3))
+# 向量量化（仅numpy后端）：none / float16 / int8，量化向量用于粗排，再用float32向量精排
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+VECTOR_RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", 4))  # 粗排候选数 = top_k × 该值
+
+# 向量库持久化方式：per_write（每次写入后刷盘）/ grouped（按时间间隔或写入量合并刷盘）/ on_shutdown（仅在关闭时刷盘）
+VECTOR_PERSIST_MODE = os.getenv("VECTOR_PERSIST_MODE", "grouped")
+VECTOR_PERSIST_INTERVAL = float(os.getenv("VECTOR_PERSIST_INTERVAL", 2.0))  # grouped模式的刷盘间隔（秒）
+VECTOR_PERSIST_MAX_PENDING = int(os.getenv("VECTOR_PERSIST_MAX_PENDING", 5000))  # grouped模式下未刷盘的块数达到该值时立即刷盘
+
+# 进程角色：standalone（单进程，默认）/ writer（独占入库并发布索引快照）/ reader（只读映射快照，处理查询）
+# 多进程部署由 run.py 按 WORKERS 自动设置，需使用numpy后端
+SERVER_ROLE = os.getenv("SERVER_ROLE", "standalone")
+SNAPSHOT_DIR = VECTOR_DB_DIR / "snapshots"
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", 3))  # 保留的历史快照数
+SNAPSHOT_POLL_INTERVAL = float(os.getenv("SNAPSHOT_POLL_INTERVAL", 1.0))  # reader检查新快照、writer拉取排队任务的间隔（秒）
+SNAPSHOT_MIN_INTERVAL = float(os.getenv("SNAPSHOT_MIN_INTERVAL", 10.0))  # writer两次发布快照的最小间隔（秒），期间的写入合并到下一次发布
+
+# 索引导出/导入（python manage.py export-index / import-index，或 /api/admin）：向量、块文本和文档目录打包成可移植的归档，
+# 新节点导入后无需重新解析和编码即可提供服务
+INDEX_EXPORT_DIR = Path(os.getenv("INDEX_EXPORT_DIR", DATA_DIR / "exports"))  # 管理接口读写归档的目录
+INDEX_EXPORT_DTYPE = os.getenv("INDEX_EXPORT_DTYPE", "float32")  # 归档中向量的类型：float32 / float16（体积减半）
 
 # 创建目录（如果不存在）
 for dir_path in [DATA_DIR, DOCUMENTS_DIR, VECTOR_DB_DIR]:
     dir_path.mkdir(parents=True, exist_ok=True)
 
+# PDF解析配置：在进程池中解析，纯Python的解析不占用服务进程的GIL；大文档按页段分片并行解析
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", min(4, os.cpu_count() or 1)))  # 0表示在当前进程中解析
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 50))  # 页数达到该值才分片并行解析
+PDF_SHARD_PAGES = int(os.getenv("PDF_SHARD_PAGES", 16))  # 每个分片的页数
+PDF_INFLIGHT_PAGES = int(os.getenv("PDF_INFLIGHT_PAGES", 64))  # 同时在解析或等待消费的最大页数（限制内存峰值）
+# 上传配置
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", 100 * 1024 * 1024))  # 单个上传文件的大小上限（字节）
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", 1024 * 1024))  # 上传文件每次读取写盘的块大小（字节）
+
 # DeepSeek API 配置
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "")
 DEEPSEEK_API_URL = os.getenv("DEEPSEEK_API_URL", "https://api.deepseek.com/v1/chat/completions")
+DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
+
+# LLM 客户端配置（所有请求共享一个连接池，超时单位：秒）
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", 60))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 20))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 10))
+# LLM调用的截止时间、重试、对冲请求和熔断
+QUERY_TIMEOUT = float(os.getenv("QUERY_TIMEOUT", 90))  # 查询接口从收到请求起的总时限（秒），检索和生成共用
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))  # 超时、连接错误和可重试状态码最多重试的次数
+LLM_RETRY_STATUS_CODES = tuple(
+    int(code) for code in os.getenv("LLM_RETRY_STATUS_CODES", "408,429,500,502,503,504").split(",") if code.strip()
+)
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", 0.5))  # 第n次重试前随机等待 0 ~ 该值×2^n 秒
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", 8))  # 单次退避等待的上限（秒）
+# 对冲请求：非流式调用超过近期耗时的分位数仍未返回时，再并发发送一次，先返回的结果生效
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", 0.95))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20))  # 成功调用的样本数不足时不发送对冲请求
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", 0.5))  # 对冲延迟的下限（秒）
+# 熔断：连续失败达到阈值后在冷却时间内直接拒绝调用，冷却结束后放行一次探测
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", 5))
+LLM_BREAKER_RESET_TIMEOUT = float(os.getenv("LLM_BREAKER_RESET_TIMEOUT", 30))
 
 # 嵌入模型配置
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+# 嵌入向量缓存（按模型名+文本哈希持久化到SQLite，避免重复编码相同文本）
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = DATA_DIR / "embedding_cache.sqlite3"
+# 嵌入模型推理后端：torch（sentence-transformers）/ onnx（onnxruntime CPU，需先运行 python manage.py export-onnx）
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_DIR = Path(os.getenv("EMBEDDING_ONNX_DIR", DATA_DIR / "onnx" / EMBEDDING_MODEL))
+EMBEDDING_ONNX_QUANTIZATION = os.getenv("EMBEDDING_ONNX_QUANTIZATION", "none")  # none / int8（动态量化的权重）
+EMBEDDING_ONNX_THREADS = int(os.getenv("EMBEDDING_ONNX_THREADS", 0))  # onnxruntime算子内线程数，0表示自动
+# 查询向量微批处理（并发查询合并成一次encode调用）
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", 5))  # 收集一批请求的最长等待时间（毫秒）
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", 32))  # 每批最多合并的请求数
 
 # 检索配置
-TOP_K = 3  # 检索最相关的3个片段
+TOP_K = int(os.getenv("TOP_K", 3))  # 检索最相关的3个片段
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")  # 默认检索模式：vector（纯向量）或 hybrid（BM25 + 向量）
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 20))  # 混合检索时两路各取的候选数
+RRF_K = int(os.getenv("RRF_K", 60))  # 倒数排名融合（RRF）的平滑常数
+
+# 上下文组装配置（检索结果 → LLM上下文）
+CONTEXT_PACKING_ENABLED = os.getenv("CONTEXT_PACKING_ENABLED", "true").lower() == "true"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1500))  # 上下文的token上限（估算值），0表示不限制
+CONTEXT_MAX_DISTANCE = float(os.getenv("CONTEXT_MAX_DISTANCE", 0))  # 丢弃向量距离大于该值的块，0表示不截断
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", 0.9))  # 近似重复块的相似度阈值
+CONTEXT_MIN_OVERLAP = int(os.getenv("CONTEXT_MIN_OVERLAP", 20))  # 相邻块首尾重叠至少多少字符才合并
+
+# 答案缓存配置
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 512))  # 最多缓存的答案条数（LRU淘汰）
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 3600))  # 缓存有效期（秒）
+# 语义缓存的余弦相似度阈值，设为大于1的值可关闭语义缓存
+ANSWER_CACHE_SEMANTIC_THRESHOLD = float(os.getenv("ANSWER_CACHE_SEMANTIC_THRESHOLD", 0.95))
+
+# 批量查询配置（POST /api/queries/batch）
+BATCH_QUERY_MAX_QUESTIONS = int(os.getenv("BATCH_QUERY_MAX_QUESTIONS", 500))  # 单次请求最多的问题数
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", 4))  # 批量查询同时进行的LLM调用数（进程内所有批量请求共享）
+BATCH_LLM_RATE_LIMIT = float(os.getenv("BATCH_LLM_RATE_LIMIT", 0))  # 批量查询每秒最多发起的LLM调用数，0表示不限制
+
+# 文档入库任务配置
+INGESTION_JOBS_DB = DATA_DIR / "ingestion_jobs.sqlite3"  # 任务持久化，重启后继续处理未完成的任务
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", 1))  # 同时处理的入库任务数（避免挤占查询的CPU）
+INGESTION_MAX_PENDING = int(os.getenv("INGESTION_MAX_PENDING", 100))  # 排队任务上限，超过则拒绝上传
+INGESTION_EMBED_BATCH_SIZE = int(os.getenv("INGESTION_EMBED_BATCH_SIZE", 64))  # 每批编码的文本块数
+
+# 分块配置：chars（按字符数）或 tokens（按嵌入模型分词器的token数填满最大序列长度）
+CHUNKING_MODE = os.getenv("CHUNKING_MODE", "chars")
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 300))  # chars模式下每块的大致字符数
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 50))  # chars模式下相邻块重叠的字符数
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", 0))  # tokens模式下每块的token上限，0表示使用模型的最大序列长度
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 32))  # tokens模式下相邻块重叠的token数（按整句重叠）
+
+# 运行时配置（GET/PUT /api/settings 可在不重启进程的情况下修改的性能参数，见 app/core/runtime_settings.py）
+SETTINGS_WATCH_INTERVAL = float(os.getenv("SETTINGS_WATCH_INTERVAL", 2.0))  # 检查.env文件变化的间隔（秒），0表示不监视
+
+# 查询链路各阶段的专用执行器和准入控制：同时在执行和排队的任务数达到上限时立即返回429（附 Retry-After），
+# 过载时只拒绝超出的请求，而不是让所有请求一起排队超时
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", 1))  # 批量编码的线程数（单条查询由微批处理线程编码）
+EMBED_MAX_PENDING = int(os.getenv("EMBED_MAX_PENDING", 256))  # 等待编码的查询上限
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", min(8, os.cpu_count() or 1)))  # 向量/BM25检索的线程数
+SEARCH_MAX_PENDING = int(os.getenv("SEARCH_MAX_PENDING", 64))  # 正在检索和排队检索的请求上限
+GENERATE_MAX_PENDING = int(os.getenv("GENERATE_MAX_PENDING", 64))  # 同时进行的交互式LLM调用上限（异步I/O，不占线程）
+DOCUMENT_WORKERS = int(os.getenv("DOCUMENT_WORKERS", 4))  # 上传文件写盘、删除文档的线程数
+DOCUMENT_MAX_PENDING = int(os.getenv("DOCUMENT_MAX_PENDING", 16))  # 正在处理和排队的文档写操作上限
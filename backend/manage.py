@@ -0,0 +1,130 @@
+"""
+后端管理命令
+
+用法（在 backend 目录下）：
+    python manage.py eval-quantization [--k 10] [--queries 200] [--rescore-factor 4]
+    python manage.py export-onnx [--no-int8] [--min-cosine 0.999 --min-cosine-int8 0.98]
+    python manage.py export-index <归档目录> [--float16]
+    python manage.py import-index <归档目录> [--no-verify] [--force]
+
+import-index 直接写入本地向量库，需在服务停止时运行；服务运行中请使用 POST /api/admin/import。
+"""
+import argparse
+import sys
+from pathlib import Path
+from app.config import NUMPY_INDEX_DIR, VECTOR_RESCORE_FACTOR, EMBEDDING_MODEL, EMBEDDING_ONNX_DIR, INDEX_EXPORT_DTYPE
+
+
+def eval_quantization(args: argparse.Namespace) -> None:
+    """评估各量化模式相对float32基线的 Recall@k"""
+    from app.core.vector_index import evaluate_quantization
+
+    results = evaluate_quantization(
+        directory=Path(args.directory),
+        modes=tuple(args.modes),
+        n_queries=args.queries,
+        k=args.k,
+        rescore_factor=args.rescore_factor,
+        noise=args.noise
+    )
+    print(f"{'mode':<8} {f'recall@{args.k}':>10} {'search(ms)':>11} {'resident(MB)':>13}")
+    for result in results:
+        print(
+            f"{result['mode']:<8} {result['recall']:>10.4f} {result['search_ms']:>11.2f} "
+            f"{result['resident_bytes'] / 1024 / 1024:>13.1f}"
+        )
+
+
+def export_onnx(args: argparse.Namespace) -> None:
+    """导出ONNX嵌入模型，并用样例文本验证与torch模型的余弦相似度"""
+    from app.core.onnx_embedding import export_onnx as export, compare_with_torch
+    from benchmarks.fixtures import synthetic_chunks
+
+    paths = export(Path(args.directory), model_name=args.model, quantize=not args.no_int8)
+    for quantization, path in paths.items():
+        print(f"已导出 {quantization}: {path}")
+
+    texts = [text for text, _ in synthetic_chunks(0, args.samples)]
+    tolerances = {"none": args.min_cosine, "int8": args.min_cosine_int8}
+    failed = False
+    print(f"{'model':<8} {'min cos':>10} {'mean cos':>10} {'required':>10}")
+    for quantization, result in compare_with_torch(Path(args.directory), texts, tuple(paths), args.model).items():
+        ok = result["min_cosine"] >= tolerances[quantization]
+        failed |= not ok
+        print(
+            f"{quantization:<8} {result['min_cosine']:>10.5f} {result['mean_cosine']:>10.5f} "
+            f"{tolerances[quantization]:>10.5f}{'' if ok else '  <-- 超出容差'}"
+        )
+    if failed:
+        sys.exit(1)
+
+
+def export_index(args: argparse.Namespace) -> None:
+    """把向量库和文档目录导出为可移植的归档"""
+    from app.core.vector_store import VectorStore
+
+    manifest = VectorStore().export_archive(Path(args.directory), dtype=args.dtype)
+    size = sum(file["bytes"] for file in manifest["files"].values())
+    print(
+        f"已导出 {manifest['documents']} 个文档、{manifest['chunks']} 个块"
+        f"（{manifest['dtype']}，{size / 1024 / 1024:.1f}MB）到 {args.directory}"
+    )
+
+
+def import_index(args: argparse.Namespace) -> None:
+    """从归档批量导入向量库和文档目录（不调用嵌入模型）"""
+    from app.core.index_archive import IndexArchiveError
+    from app.core.vector_store import VectorStore
+
+    try:
+        report = VectorStore().import_archive(Path(args.directory), verify=not args.no_verify, force=args.force)
+    except IndexArchiveError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    finally:
+        VectorStore.close()
+    print(f"已导入 {report['documents']} 个文档、{report['chunks']} 个块，耗时 {report['seconds']:.1f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="后端管理命令")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    evaluate = subparsers.add_parser("eval-quantization", help="评估向量量化模式的召回率")
+    evaluate.add_argument("--directory", default=str(NUMPY_INDEX_DIR), help="numpy后端的索引目录")
+    evaluate.add_argument("--modes", nargs="+", default=["float16", "int8"], choices=["float16", "int8"])
+    evaluate.add_argument("--queries", type=int, default=200, help="抽样查询数")
+    evaluate.add_argument("--k", type=int, default=10)
+    evaluate.add_argument("--rescore-factor", type=int, default=VECTOR_RESCORE_FACTOR)
+    evaluate.add_argument("--noise", type=float, default=0.05, help="加到抽样向量上的噪声比例")
+    evaluate.set_defaults(handler=eval_quantization)
+
+    onnx = subparsers.add_parser("export-onnx", help="导出ONNX嵌入模型（EMBEDDING_BACKEND=onnx 使用）并验证精度")
+    onnx.add_argument("--directory", default=str(EMBEDDING_ONNX_DIR), help="导出目录")
+    onnx.add_argument("--model", default=EMBEDDING_MODEL)
+    onnx.add_argument("--no-int8", action="store_true", help="不生成int8量化的模型")
+    onnx.add_argument("--samples", type=int, default=200, help="验证用的样例文本数")
+    onnx.add_argument("--min-cosine", type=float, default=0.999, help="float32模型与torch的最小余弦相似度")
+    onnx.add_argument("--min-cosine-int8", type=float, default=0.98, help="int8模型与torch的最小余弦相似度")
+    onnx.set_defaults(handler=export_onnx)
+
+    export = subparsers.add_parser("export-index", help="导出向量库和文档目录为可移植的归档")
+    export.add_argument("directory", help="归档目录（不能已存在）")
+    export.add_argument(
+        "--float16", dest="dtype", action="store_const", const="float16", default=INDEX_EXPORT_DTYPE,
+        help="向量以float16保存（体积减半）"
+    )
+    export.set_defaults(handler=export_index)
+
+    load = subparsers.add_parser("import-index", help="从归档导入向量库和文档目录（无需重新编码）")
+    load.add_argument("directory", help="归档目录")
+    load.add_argument("--no-verify", action="store_true", help="跳过文件的SHA-256校验")
+    load.add_argument("--force", action="store_true", help="嵌入模型与当前配置不一致时仍然导入")
+    load.set_defaults(handler=import_index)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
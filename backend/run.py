@@ -1,10 +1,38 @@
+import os
+import subprocess
+import sys
 import uvicorn
+from dotenv import load_dotenv
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "app.main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        workers=1
-    )
+    load_dotenv()
+    # 查询进程数：大于1时启用多进程部署（一个写进程 + WORKERS个只读查询进程）
+    workers = int(os.getenv("WORKERS", 1))
+
+    if workers <= 1:
+        uvicorn.run(
+            "app.main:app",
+            host="0.0.0.0",
+            port=8000,
+            reload=True,
+            workers=1
+        )
+    else:
+        if os.getenv("VECTOR_BACKEND", "chroma") != "numpy":
+            raise SystemExit("多进程部署需要numpy向量索引后端，请设置 VECTOR_BACKEND=numpy")
+        # 写进程独占入库并发布索引快照；查询进程只读映射快照，共享操作系统页缓存
+        writer = subprocess.Popen(
+            [sys.executable, "-m", "app.writer"],
+            env={**os.environ, "SERVER_ROLE": "writer"}
+        )
+        os.environ["SERVER_ROLE"] = "reader"
+        try:
+            uvicorn.run(
+                "app.main:app",
+                host="0.0.0.0",
+                port=8000,
+                workers=workers
+            )
+        finally:
+            writer.terminate()
+            writer.wait()
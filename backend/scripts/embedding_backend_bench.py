@@ -0,0 +1,98 @@
+"""
+嵌入模型推理后端对比：torch（sentence-transformers） vs onnx vs onnx-int8
+
+每个后端在独立的子进程中运行，以测得包含导入依赖在内的冷启动耗时；输出
+导入 + 加载耗时、首次编码耗时、批量编码吞吐量（条/秒），以及与torch向量的余弦相似度。
+
+运行（在 backend 目录下，需先运行 python manage.py export-onnx）：
+    python -m scripts.embedding_backend_bench
+    python -m scripts.embedding_backend_bench --texts 2000 --batch-size 64
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+
+_BACKENDS = {
+    "torch": {"EMBEDDING_BACKEND": "torch"},
+    "onnx": {"EMBEDDING_BACKEND": "onnx", "EMBEDDING_ONNX_QUANTIZATION": "none"},
+    "onnx-int8": {"EMBEDDING_BACKEND": "onnx", "EMBEDDING_ONNX_QUANTIZATION": "int8"},
+}
+
+
+def run_backend(args: argparse.Namespace) -> None:
+    """子进程：按环境变量选择的后端加载模型并计时，结果写入 --output"""
+    started = time.perf_counter()
+    from app.core.embedding import load_model
+    model = load_model()
+    load_seconds = time.perf_counter() - started
+
+    from benchmarks.fixtures import synthetic_chunks
+    texts = [text for text, _ in synthetic_chunks(0, args.texts, seed=args.seed)]
+
+    started = time.perf_counter()
+    model.encode(texts[:1])
+    first_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    vectors = np.asarray(model.encode(texts, batch_size=args.batch_size), dtype=np.float32)
+    encode_seconds = time.perf_counter() - started
+
+    np.save(args.output + ".npy", vectors)
+    Path(args.output).write_text(json.dumps({
+        "load_s": load_seconds,
+        "first_encode_s": first_seconds,
+        "texts_per_s": len(texts) / encode_seconds,
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="嵌入模型推理后端对比")
+    parser.add_argument("--backends", nargs="+", default=list(_BACKENDS), choices=list(_BACKENDS))
+    parser.add_argument("--texts", type=int, default=1000, help="编码的文本数")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--run-backend", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_backend:
+        run_backend(args)
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends:
+            output = os.path.join(tmp, backend)
+            subprocess.run(
+                [sys.executable, "-m", "scripts.embedding_backend_bench", "--run-backend",
+                 "--output", output, "--texts", str(args.texts),
+                 "--batch-size", str(args.batch_size), "--seed", str(args.seed)],
+                env={**os.environ, **_BACKENDS[backend]},
+                check=True
+            )
+            results[backend] = json.loads(Path(output).read_text())
+            results[backend]["vectors"] = np.load(output + ".npy")
+
+    reference = results.get("torch", {}).get("vectors")
+    print(f"{'backend':<10} {'load(s)':>8} {'first(ms)':>10} {'texts/s':>9} {'min cos':>9} {'mean cos':>9}")
+    for backend, result in results.items():
+        line = (
+            f"{backend:<10} {result['load_s']:>8.2f} {result['first_encode_s'] * 1000:>10.1f} "
+            f"{result['texts_per_s']:>9.1f}"
+        )
+        if reference is not None:
+            a = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+            b = result["vectors"] / np.linalg.norm(result["vectors"], axis=1, keepdims=True)
+            cosines = np.einsum("ij,ij->i", a, b)
+            line += f" {cosines.min():>9.5f} {cosines.mean():>9.5f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
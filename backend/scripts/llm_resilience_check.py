@@ -0,0 +1,176 @@
+"""
+LLM调用的容错验证：在本地故障注入桩服务（scripts/stub_llm_server.py）上逐项检查
+重试、Retry-After、不可重试错误、截止时间、对冲请求和熔断的行为
+
+桩服务在本进程的后台线程中启动，不访问DeepSeek，也不修改 .env。
+
+运行（在 backend 目录下）：
+    python -m scripts.llm_resilience_check
+    python -m scripts.llm_resilience_check --hedge-calls 200
+"""
+import argparse
+import asyncio
+import random
+import socket
+import threading
+import time
+from typing import Callable, List
+import httpx
+import uvicorn
+from app.core.generation import Generation
+from app.core.llm_resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, Deadline, UpstreamError
+from app.core.runtime_settings import RuntimeSettings
+from scripts.stub_llm_server import app as stub_app
+
+_CONTEXT = [{"document": "桩服务不读取上下文。"}]
+
+
+def start_stub() -> str:
+    """在后台线程启动桩服务，返回其基础URL"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(stub_app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="stub-llm", daemon=True).start()
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{base_url}/faults")
+            return base_url
+        except httpx.TransportError:
+            time.sleep(0.05)
+    raise RuntimeError("桩服务启动失败")
+
+
+class Checker:
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.generator = Generation(api_key="stub", api_url=f"{base_url}/v1/chat/completions")
+        self.results: List[tuple] = []
+
+    def faults(self, **faults) -> dict:
+        """重置桩服务后注入故障，返回故障配置和计数"""
+        httpx.delete(f"{self.base_url}/faults")
+        return httpx.put(f"{self.base_url}/faults", json=faults).json()
+
+    def stub_requests(self) -> int:
+        return httpx.get(f"{self.base_url}/faults").json()["counters"]["requests"]
+
+    def check(self, name: str, passed: bool, detail: str) -> None:
+        self.results.append((name, passed, detail))
+
+    async def timed(self, call: Callable) -> tuple:
+        """执行一次调用，返回 (结果或异常, 耗时秒)"""
+        started = time.perf_counter()
+        try:
+            result = await call()
+        except Exception as e:
+            result = e
+        return result, time.perf_counter() - started
+
+    def answer(self, deadline: float = None):
+        return lambda: self.generator.generate_answer("问题", _CONTEXT, Deadline(deadline))
+
+    async def run(self, hedge_calls: int) -> None:
+        settings = RuntimeSettings()
+        settings.update({"llm_max_retries": 2, "llm_hedge_enabled": False}, persist=False)
+
+        # 可重试的状态码：失败两次后第三次成功
+        self.faults(fail_next=2, error_status=503)
+        result, seconds = await self.timed(self.answer())
+        requests = self.stub_requests()
+        self.check("retry 503", isinstance(result, str) and requests == 3,
+                   f"{requests} 次请求，{seconds * 1000:.0f}ms，结果：{type(result).__name__}")
+
+        # Retry-After 优先于随机退避
+        self.faults(fail_next=1, error_status=429, retry_after=0.3)
+        result, seconds = await self.timed(self.answer())
+        self.check("retry-after 429", isinstance(result, str) and seconds >= 0.3,
+                   f"{seconds * 1000:.0f}ms（Retry-After 300ms）")
+
+        # 请求本身的错误不重试
+        self.faults(fail_next=1, error_status=400)
+        result, seconds = await self.timed(self.answer())
+        requests = self.stub_requests()
+        self.check("no retry on 400", isinstance(result, UpstreamError) and requests == 1,
+                   f"{requests} 次请求，{type(result).__name__}")
+
+        # 上游挂起：在截止时间处放弃
+        self.faults(hang_rate=1)
+        result, seconds = await self.timed(self.answer(deadline=1.0))
+        self.check("deadline on hang", isinstance(result, DeadlineExceeded) and seconds < 1.5,
+                   f"{seconds * 1000:.0f}ms（时限 1000ms），{type(result).__name__}")
+
+        # 流式输出中途挂起：在截止时间处中断
+        self.faults(stream_hang_after=3)
+        tokens = []
+
+        async def stream():
+            async for token in self.generator.stream_answer("问题", _CONTEXT, Deadline(1.0)):
+                tokens.append(token)
+
+        result, seconds = await self.timed(stream)
+        self.check("deadline mid-stream", isinstance(result, DeadlineExceeded) and len(tokens) == 3,
+                   f"收到 {len(tokens)} 个片段后中断，{seconds * 1000:.0f}ms")
+
+        # 长尾延迟：对比开启对冲请求前后超过1秒的调用数和尾延迟（桩服务与本进程共用随机数种子）
+        random.seed(0)
+        self.faults(latency=0.02, slow_rate=0.05, slow_latency=2.0)
+        for _ in range(30):
+            await self.answer()()
+        tails = {}
+        for hedge in (False, True):
+            settings.update({"llm_hedge_enabled": hedge}, persist=False)
+            latencies = []
+            for _ in range(hedge_calls):
+                _, seconds = await self.timed(self.answer())
+                latencies.append(seconds)
+            latencies.sort()
+            tails[hedge] = (
+                sum(seconds > 1.0 for seconds in latencies),
+                latencies[int(0.99 * (len(latencies) - 1))],
+                latencies[-1]
+            )
+        settings.update({"llm_hedge_enabled": False}, persist=False)
+        self.check("hedging cuts tail", tails[True][0] < tails[False][0],
+                   "超过1秒/p99/max 不对冲 {}/{:.0f}ms/{:.0f}ms，对冲 {}/{:.0f}ms/{:.0f}ms".format(
+                       tails[False][0], tails[False][1] * 1000, tails[False][2] * 1000,
+                       tails[True][0], tails[True][1] * 1000, tails[True][2] * 1000
+                   ))
+
+        # 熔断：连续失败后快速失败，冷却后探测成功恢复
+        settings.update({"llm_max_retries": 0}, persist=False)
+        Generation.breaker = CircuitBreaker(failure_threshold=3, reset_timeout=1.0)
+        self.faults(error_rate=1, error_status=503)
+        for _ in range(3):
+            await self.timed(self.answer())
+        requests = self.stub_requests()
+        result, seconds = await self.timed(self.answer())
+        self.check("breaker fails fast", isinstance(result, CircuitOpenError) and self.stub_requests() == requests,
+                   f"{seconds * 1000:.1f}ms，{type(result).__name__}")
+        self.faults()
+        await asyncio.sleep(1.0)
+        result, _ = await self.timed(self.answer())
+        self.check("breaker recovers", isinstance(result, str) and Generation.breaker.state == CircuitBreaker.CLOSED,
+                   f"探测结果：{type(result).__name__}，状态：{Generation.breaker.state}")
+
+        await Generation.aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="LLM调用容错验证（本地故障注入桩服务）")
+    parser.add_argument("--hedge-calls", type=int, default=100, help="对比尾延迟时每种设置的调用次数")
+    args = parser.parse_args()
+
+    checker = Checker(start_stub())
+    asyncio.run(checker.run(args.hedge_calls))
+
+    width = max(len(name) for name, _, _ in checker.results)
+    for name, passed, detail in checker.results:
+        print(f"{'✅' if passed else '❌'} {name:<{width}}  {detail}")
+    if not all(passed for _, passed, _ in checker.results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+本地OpenAI兼容的LLM桩服务，用于在不访问DeepSeek的情况下联调生成链路，
+并可注入故障（延迟、长尾、错误状态码、挂起）来验证超时、重试、对冲请求和熔断
+
+启动：
+    uvicorn scripts.stub_llm_server:app --port 9000
+
+然后设置环境变量让后端指向桩服务：
+    DEEPSEEK_API_URL=http://127.0.0.1:9000/v1/chat/completions
+    DEEPSEEK_API_KEY=stub
+
+可选环境变量：
+    STUB_TOKEN_DELAY   每个流式片段之间的间隔（秒），默认0.02
+    STUB_ANSWER        固定返回的答案文本
+
+故障注入（运行中修改，未提交的字段保持不变）：
+    curl -X PUT localhost:9000/faults -H 'Content-Type: application/json' \\
+         -d '{"error_rate": 0.5, "error_status": 503, "retry_after": 1}'
+    curl localhost:9000/faults          # 查看当前故障配置和请求计数
+    curl -X DELETE localhost:9000/faults  # 恢复正常并清零计数
+"""
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+app = FastAPI(title="LLM桩服务")
+
+TOKEN_DELAY = float(os.getenv("STUB_TOKEN_DELAY", 0.02))
+ANSWER = os.getenv("STUB_ANSWER", "这是来自本地桩服务的回答。")
+
+
+class Faults(BaseModel):
+    """注入的故障，每个请求独立按概率抽取"""
+    latency: float = Field(0.0, ge=0)  # 每个请求开始响应前的固定延迟（秒）
+    slow_rate: float = Field(0.0, ge=0, le=1)  # 长尾请求的比例
+    slow_latency: float = Field(2.0, ge=0)  # 长尾请求额外的延迟（秒）
+    error_rate: float = Field(0.0, ge=0, le=1)  # 返回错误状态码的比例
+    error_status: int = Field(503, ge=400, le=599)
+    retry_after: Optional[float] = Field(None, ge=0)  # 错误响应附带的 Retry-After（秒）
+    fail_next: int = Field(0, ge=0)  # 接下来的这么多个请求必定返回错误（优先于 error_rate）
+    hang_rate: float = Field(0.0, ge=0, le=1)  # 挂起（长时间不响应）的比例
+    stream_hang_after: int = Field(0, ge=0)  # 流式输出这么多个片段后挂起，0表示不挂起
+
+
+_faults = Faults()
+_counters = {"requests": 0, "errors": 0, "hangs": 0, "slow": 0}
+
+
+def _completion(model: str) -> dict:
+    return {
+        "id": "stub-completion",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": ANSWER},
+            "finish_reason": "stop"
+        }]
+    }
+
+
+async def _stream(model: str, hang_after: int):
+    for i, token in enumerate(ANSWER):
+        if hang_after and i == hang_after:
+            await asyncio.sleep(3600)
+        chunk = {
+            "id": "stub-completion",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]
+        }
+        yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        await asyncio.sleep(TOKEN_DELAY)
+    yield "data: [DONE]\n\n"
+
+
+async def _inject_faults() -> Optional[JSONResponse]:
+    """按当前故障配置延迟或挂起，需要返回错误时返回错误响应"""
+    faults = _faults
+    _counters["requests"] += 1
+    delay = faults.latency
+    if faults.slow_rate and random.random() < faults.slow_rate:
+        _counters["slow"] += 1
+        delay += faults.slow_latency
+    if faults.hang_rate and random.random() < faults.hang_rate:
+        _counters["hangs"] += 1
+        delay = 3600
+    if delay:
+        await asyncio.sleep(delay)
+
+    failing = faults.fail_next > 0 or (faults.error_rate and random.random() < faults.error_rate)
+    if not failing:
+        return None
+    if faults.fail_next > 0:
+        faults.fail_next -= 1
+    _counters["errors"] += 1
+    headers = {"Retry-After": f"{faults.retry_after:g}"} if faults.retry_after is not None else None
+    return JSONResponse(
+        {"error": {"message": "injected fault", "type": "stub_error"}},
+        status_code=faults.error_status,
+        headers=headers
+    )
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "stub")
+    error = await _inject_faults()
+    if error is not None:
+        return error
+    if body.get("stream"):
+        return StreamingResponse(_stream(model, _faults.stream_hang_after), media_type="text/event-stream")
+    return _completion(model)
+
+
+@app.get("/faults")
+async def get_faults():
+    return {"faults": _faults.model_dump(), "counters": _counters}
+
+
+@app.put("/faults")
+async def update_faults(faults: dict):
+    global _faults
+    try:
+        _faults = Faults(**{**_faults.model_dump(), **faults})
+    except ValueError as e:
+        return JSONResponse({"detail": str(e)}, status_code=422)
+    return {"faults": _faults.model_dump(), "counters": _counters}
+
+
+@app.delete("/faults")
+async def reset_faults():
+    global _faults
+    _faults = Faults()
+    for name in _counters:
+        _counters[name] = 0
+    return {"faults": _faults.model_dump(), "counters": _counters}
@@ -0,0 +1,152 @@
+"""
+向量索引后端的一致性检查与性能对比
+
+对每个后端先运行同一组一致性检查（写入、覆盖、过滤检索、删除、读取），
+检索结果与暴力计算的平方L2距离对比；通过后再用随机向量对比写入和检索耗时。
+
+运行（在 backend 目录下）：
+    python -m scripts.vector_index_bench
+    python -m scripts.vector_index_bench --backends numpy --chunks 50000 --queries 200
+
+可选参数见 --help。chroma 后端需要安装 chromadb。
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+from app.core.vector_index import VectorIndex, ChromaVectorIndex, NumpyVectorIndex
+
+
+def _make_index(backend: str, directory: Path) -> VectorIndex:
+    if backend == "chroma":
+        return ChromaVectorIndex(directory)
+    return NumpyVectorIndex(directory)
+
+
+def _random_chunks(rng: np.random.Generator, n: int, dim: int, n_documents: int, prefix: str = "doc"):
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = [f"{prefix}{i % n_documents}_chunk_{i}" for i in range(n)]
+    documents = [f"text {i}" for i in range(n)]
+    metadatas = [{"document_id": f"{prefix}{i % n_documents}", "page_number": i % 7 + 1} for i in range(n)]
+    return ids, vectors, documents, metadatas
+
+
+def _brute_force(vectors: np.ndarray, ids: list, query: np.ndarray, n_results: int, allowed=None) -> list:
+    distances = ((vectors - query) ** 2).sum(axis=1)
+    order = [i for i in np.argsort(distances) if allowed is None or ids[i] in allowed]
+    return [ids[i] for i in order[:n_results]]
+
+
+def check_conformance(backend: str, dim: int = 32) -> None:
+    """对指定后端运行一致性检查，失败时抛出 AssertionError"""
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = _make_index(backend, Path(tmp))
+        ids, vectors, documents, metadatas = _random_chunks(rng, 300, dim, 5)
+        index.add(ids, vectors.tolist(), documents, metadatas)
+        assert index.count() == 300
+        assert sorted(index.list_ids("doc1")) == sorted(i for i in ids if i.startswith("doc1_"))
+
+        # 全库检索与暴力计算一致，距离为平方L2
+        query = rng.standard_normal(dim).astype(np.float32)
+        [results] = index.search([query.tolist()], 10)
+        assert [r["id"] for r in results] == _brute_force(vectors, ids, query, 10)
+        expected = float(((vectors[ids.index(results[0]["id"])] - query) ** 2).sum())
+        assert abs(results[0]["distance"] - expected) < 1e-3
+        assert results[0]["document"] == documents[ids.index(results[0]["id"])]
+        assert results[0]["metadata"]["document_id"] in {"doc0", "doc1", "doc2", "doc3", "doc4"}
+
+        # 按文档过滤
+        allowed = {i for i, m in zip(ids, metadatas) if m["document_id"] in ("doc2", "doc3")}
+        [results] = index.search([query.tolist()], 10, ["doc2", "doc3"])
+        assert [r["id"] for r in results] == _brute_force(vectors, ids, query, 10, allowed)
+
+        # 覆盖已有ID
+        vectors[0] = query
+        index.add([ids[0]], [query.tolist()], ["replaced"], [metadatas[0]])
+        assert index.count() == 300
+        [results] = index.search([query.tolist()], 1)
+        assert results[0]["id"] == ids[0] and results[0]["document"] == "replaced"
+
+        # 按文档删除和按ID删除
+        index.delete(document_id="doc0")
+        index.delete(ids=[ids[1]])
+        remaining = [i for i in ids if not i.startswith("doc0_") and i != ids[1]]
+        assert sorted(index.list_ids()) == sorted(remaining)
+        assert index.get("doc0")["ids"] == []
+        [results] = index.search([query.tolist()], 10)
+        allowed = set(remaining)
+        assert [r["id"] for r in results] == _brute_force(vectors, ids, query, 10, allowed)
+
+        # 不存在的文档过滤返回空结果
+        [results] = index.search([query.tolist()], 10, ["missing"])
+        assert results == []
+
+        # 持久化后重新打开
+        index.persist()
+        reopened = _make_index(backend, Path(tmp))
+        assert sorted(reopened.list_ids()) == sorted(remaining)
+        [results] = reopened.search([query.tolist()], 10)
+        assert [r["id"] for r in results] == _brute_force(vectors, ids, query, 10, allowed)
+
+
+def benchmark(backend: str, n_chunks: int, dim: int, n_queries: int, n_results: int) -> dict:
+    """随机向量下的写入与检索耗时"""
+    rng = np.random.default_rng(1)
+    ids, vectors, documents, metadatas = _random_chunks(rng, n_chunks, dim, max(1, n_chunks // 100))
+    queries = rng.standard_normal((n_queries, dim)).astype(np.float32)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = _make_index(backend, Path(tmp))
+        started = time.perf_counter()
+        for start in range(0, n_chunks, 1000):
+            end = start + 1000
+            index.add(ids[start:end], vectors[start:end].tolist(), documents[start:end], metadatas[start:end])
+        index.persist()
+        add_seconds = time.perf_counter() - started
+
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search([query.tolist()], n_results)
+            latencies.append((time.perf_counter() - started) * 1000)
+        filtered = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search([query.tolist()], n_results, ["doc0"])
+            filtered.append((time.perf_counter() - started) * 1000)
+
+    return {
+        "backend": backend,
+        "add_seconds": add_seconds,
+        "search_p50_ms": float(np.percentile(latencies, 50)),
+        "search_p95_ms": float(np.percentile(latencies, 95)),
+        "filtered_p50_ms": float(np.percentile(filtered, 50)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="向量索引后端一致性检查与性能对比")
+    parser.add_argument("--backends", nargs="+", default=["numpy", "chroma"], choices=["numpy", "chroma"])
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    for backend in args.backends:
+        check_conformance(backend)
+        print(f"[{backend}] 一致性检查通过")
+
+    print(f"{'backend':<8} {'add(s)':>8} {'p50(ms)':>9} {'p95(ms)':>9} {'filtered p50(ms)':>17}")
+    for backend in args.backends:
+        result = benchmark(backend, args.chunks, args.dim, args.queries, args.top_k)
+        print(
+            f"{result['backend']:<8} {result['add_seconds']:>8.2f} {result['search_p50_ms']:>9.2f} "
+            f"{result['search_p95_ms']:>9.2f} {result['filtered_p50_ms']:>17.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()